@@ -0,0 +1 @@
+from .workloads import *
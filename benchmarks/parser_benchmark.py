@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+'''Time the parsing of generated programs of growing size : the cost per rule
+should stay flat.
+
+Command (at the root of the project) : python3 -m benchmarks.parser_benchmark [max_rules]'''
+import os
+import sys
+import tempfile
+import time
+
+import queries
+
+
+def write_program(file_name, n):
+    '''Write a program of n statements : facts, with one rule every ten statements'''
+    with open(file_name, 'w', encoding='utf8') as f:
+        for i in range(n - 1):
+            if i % 10:
+                f.write("edge(n%d, 'N%d').\n" % (i, i + 1))
+            else:
+                f.write("path%d(X, Z) ← edge(X, Y), path%d(Y, Z), X ≠ n%d.\n" % (i, i, i))
+        f.write("? edge(X, Y)\n")
+
+
+def main(max_rules=10 ** 6):
+    n = 1000
+    with tempfile.TemporaryDirectory() as folder:
+        file_name = os.path.join(folder, "program.query")
+        print("%10s %10s %14s" % ("rules", "seconds", "µs per rule"))
+        while n <= max_rules:
+            write_program(file_name, n)
+            start = time.perf_counter()
+            q = queries.query_parse_file(file_name)
+            elapsed = time.perf_counter() - start
+            assert len(q.program.rules) == n - 1
+            print("%10d %10.3f %14.2f" % (n, elapsed, 1e6 * elapsed / n))
+            n *= 10
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+'''Run the synthetic workloads, timing parsing, validation, preparation and
+evaluation separately, and store the results as JSON.
+
+Command (at the root of the project) :
+python3 -m benchmarks.runner --scale 1000 --output results.json [--compare base.json]'''
+import argparse
+import json
+import platform
+import subprocess
+import time
+
+import queries
+
+from .workloads import WORKLOADS
+
+
+def timed(function, *args, **kwargs):
+    '''Return (result, seconds) of one call'''
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run_workload(name, scale, engines=('tuple', 'columnar'), repeat=3, seed=0):
+    '''Time a workload : the best time of repeat runs of each phase
+    @return dict phase -> seconds, with the number of answers'''
+    text = WORKLOADS[name](scale, seed)
+    times = {}
+    for _ in range(repeat):
+        q, t = timed(queries.query_parser, text)
+        times['parse'] = min(times.get('parse', t), t)
+        _, t = timed(q.assert_evaluable)
+        times['validate'] = min(times.get('validate', t), t)
+        prepared, t = timed(q.prepare, False)
+        times['prepare'] = min(times.get('prepare', t), t)
+        answers = {}
+        for engine in engines:
+            answers[engine], t = timed(prepared.execute, None, True, engine)
+            key = 'evaluate_' + engine
+            times[key] = min(times.get(key, t), t)
+    # The engines must return the same rows, whatever the type of their values
+    rows = [sorted([str(v) for v in row] for row in a) for a in answers.values()]
+    if any(r != rows[0] for r in rows[1:]):
+        raise Exception("The engines disagree on workload %s" % name)
+    return {'scale': scale, 'statements': text.count("\n"), 'answers': len(rows[0]),
+            'seconds': times}
+
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names=None, scale=1000, engines=('tuple', 'columnar'), repeat=3):
+    '''Run workloads (all by default)
+    @return dict holding the environment and the results of each workload'''
+    results = {}
+    for name in names or WORKLOADS:
+        results[name] = run_workload(name, scale, engines, repeat)
+    return {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'results': results
+    }
+
+
+def compare(base, new):
+    '''Ratios new / base of the times of the phases found in both results
+    @return dict workload -> phase -> ratio'''
+    ratios = {}
+    for name, result in new['results'].items():
+        old = base['results'].get(name)
+        if old is None or old['scale'] != result['scale']:
+            continue
+        ratios[name] = {phase: t / old['seconds'][phase]
+                        for phase, t in result['seconds'].items()
+                        if old['seconds'].get(phase)}
+    return ratios
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("workloads", nargs="*", help="workloads to run (default : all)")
+    parser.add_argument("--scale", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--engines", default="tuple,columnar")
+    parser.add_argument("--output", help="file the results are written to")
+    parser.add_argument("--compare", help="results of a previous run to compare with")
+    args = parser.parse_args(argv)
+
+    results = run(args.workloads, args.scale, args.engines.split(","), args.repeat)
+    for name, result in results['results'].items():
+        print("%-14s %8d answers  " % (name, result['answers']) +
+              "  ".join("%s %.4fs" % item for item in result['seconds'].items()))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+        print("\nnew / base (%s) :" % base.get('commit'))
+        for name, ratios in compare(base, results).items():
+            print("%-14s " % name + "  ".join("%s x%.2f" % item for item in ratios.items()))
+
+
+if __name__ == '__main__':
+    main()
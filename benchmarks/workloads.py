@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+'''Generators of synthetic workloads : each function returns the text of a program
+and its query, whose size grows with the scale n.'''
+import random
+
+
+def facts(predicate, rows):
+    return "".join("%s(%s).\n" % (predicate, ", ".join(row)) for row in rows)
+
+
+def chain(n, seed=0):
+    '''Transitive closure of a chain of n edges (n * (n + 1) / 2 paths)'''
+    text = facts("edge", [("n%d" % i, "n%d" % (i + 1)) for i in range(n)])
+    return text + "path(X, Y) ← edge(X, Y).\npath(X, Z) ← path(X, Y) edge(Y, Z).\n? path(X, Y)\n"
+
+
+def random_graph(n, seed=0, degree=3):
+    '''Nodes reachable from n0 in a random graph of n nodes and degree * n edges'''
+    rng = random.Random(seed)
+    text = facts("edge", [("n%d" % rng.randrange(n), "n%d" % rng.randrange(n))
+                          for _ in range(degree * n)])
+    return text + "reach(Y) ← edge(n0, Y).\nreach(Z) ← reach(Y) edge(Y, Z).\n? reach(X)\n"
+
+
+def star(n, seed=0, dimensions=4, size=20):
+    '''Star join : a fact table of n rows referencing dimension tables of size rows,
+    with a selection on the first dimension'''
+    rng = random.Random(seed)
+    text = facts("sales", [["s%d" % i] + ["d%d_%d" % (d, rng.randrange(size))
+                                          for d in range(dimensions)] for i in range(n)])
+    for d in range(dimensions):
+        text += facts("dim%d" % d, [("d%d_%d" % (d, i), "v%d" % (i % 5)) for i in range(size)])
+    keys = ", ".join("K%d" % d for d in range(dimensions))
+    body = " ".join("dim%d(K%d, V%d)" % (d, d, d) for d in range(dimensions))
+    values = ", ".join("V%d" % d for d in range(1, dimensions))
+    return text + "q(S, %s) ← sales(S, %s) %s V0 = v1.\n? q(S, %s)\n" % (
+        values, keys, body, values)
+
+
+def snowflake(n, seed=0, dimensions=3, size=20):
+    '''Snowflake join : a star whose dimensions reference their own sub-dimension'''
+    rng = random.Random(seed)
+    text = facts("sales", [["s%d" % i] + ["d%d_%d" % (d, rng.randrange(size))
+                                          for d in range(dimensions)] for i in range(n)])
+    for d in range(dimensions):
+        text += facts("dim%d" % d, [("d%d_%d" % (d, i), "e%d_%d" % (d, i % 4))
+                                    for i in range(size)])
+        text += facts("sub%d" % d, [("e%d_%d" % (d, i), "v%d" % (i % 2)) for i in range(4)])
+    keys = ", ".join("K%d" % d for d in range(dimensions))
+    body = " ".join("dim%d(K%d, E%d) sub%d(E%d, V%d)" % (d, d, d, d, d, d)
+                    for d in range(dimensions))
+    values = ", ".join("V%d" % d for d in range(dimensions))
+    return text + "q(S, %s) ← sales(S, %s) %s.\n? q(S, %s)\n" % (values, keys, body, values)
+
+
+def triangle(n, seed=0, degree=4):
+    '''Triangles of a random graph of n nodes and degree * n edges'''
+    rng = random.Random(seed)
+    text = facts("edge", [("n%d" % rng.randrange(n), "n%d" % rng.randrange(n))
+                          for _ in range(degree * n)])
+    return text + "tri(X, Y, Z) ← edge(X, Y) edge(Y, Z) edge(Z, X).\n? tri(X, Y, Z)\n"
+
+
+def rule_stack(n, seed=0, depth=50):
+    '''Stack of depth non-recursive rules, each one joining the previous level
+    with a base table of n rows'''
+    rng = random.Random(seed)
+    text = facts("base", [("n%d" % i, "n%d" % rng.randrange(n)) for i in range(n)])
+    text += "p0(X, Y) ← base(X, Y).\n"
+    for level in range(1, depth + 1):
+        text += "p%d(X, Y) ← p%d(X, Z) base(Z, Y).\n" % (level, level - 1)
+    return text + "? p%d(X, Y)\n" % depth
+
+
+def selections(n, seed=0, values=10):
+    '''Constant-heavy selections over a wide table of n rows'''
+    rng = random.Random(seed)
+    text = facts("r", [("n%d" % i,) + tuple("c%d" % rng.randrange(values) for _ in range(4))
+                       for i in range(n)])
+    text += "q(X) ← r(X, c1, Y, c2, Z).\nq(X) ← r(X, Y, c3, Y, c4).\n"
+    text += "q(X) ← r(X, c5, c5, Y, Z) r(Y, c5, W, V, U).\n"
+    return text + "? q(X)\n"
+
+
+def differences(n, seed=0, values=30):
+    '''≠ filters between variables and with constants'''
+    rng = random.Random(seed)
+    text = facts("r", [("n%d" % rng.randrange(values), "n%d" % rng.randrange(values))
+                       for _ in range(n)])
+    text += "q(X, Z) ← r(X, Y) r(Y, Z) X ≠ Z Y ≠ n0 X ≠ Y.\n"
+    return text + "? q(X, Z)\n"
+
+
+WORKLOADS = {
+    'chain': chain,
+    'random_graph': random_graph,
+    'star': star,
+    'snowflake': snowflake,
+    'triangle': triangle,
+    'rule_stack': rule_stack,
+    'selections': selections,
+    'differences': differences,
+}
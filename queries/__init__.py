@@ -1,2 +1,15 @@
 from .queries import *
-from .query_parser import *
\ No newline at end of file
+from .query_parser import *
+from .database import *
+from .planner import *
+from .magic import *
+from .incremental import *
+from .store import *
+from .loader import *
+from .snapshot import *
+from .prepared import *
+from .parallel import *
+from .batch import *
+from .explain import *
+from .analysis import *
+from .sql import *
\ No newline at end of file
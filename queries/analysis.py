@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+from .queries import Any, Var, Const, Aggregate, Clause, Rule, Equality, Different
+
+__all__ = ['DisjointSet', 'RuleIR']
+
+
+class DisjointSet:
+    # Disjoint-set forest over hashable elements, with union by size and path
+    # compression : a sequence of n operations takes almost linear time.
+    def __init__(self, elements=()):
+        self.parent = {}
+        self.size = {}  # number of elements of the sets, on their roots
+        for e in elements:
+            self.add(e)
+
+    def add(self, element):
+        self.parent.setdefault(element, element)
+
+    def find(self, element):
+        '''Return the root of the set containing element (added if unknown)'''
+        parent = self.parent
+        root = parent.setdefault(element, element)
+        if root is element:
+            return root
+        while parent[root] is not root:
+            root = parent[root]
+        while parent[element] is not root:
+            parent[element], element = root, parent[element]
+        return root
+
+    def union(self, a, b):
+        '''Merge the sets containing a and b
+        @return the root of the merged set'''
+        a, b = self.find(a), self.find(b)
+        if a is b:
+            return a
+        size_a, size_b = self.size.get(a, 1), self.size.get(b, 1)
+        if size_a < size_b:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] = size_a + size_b
+        return a
+
+    def get_classes(self):
+        '''Return the list of the sets as lists, in order of first addition of their
+        elements, each list in order of addition'''
+        classes = {}
+        for e in self.parent:
+            classes.setdefault(self.find(e), []).append(e)
+        return list(classes.values())
+
+    def get_sets(self):
+        '''Return the list of the sets, in order of first addition of their elements'''
+        return [set(c) for c in self.get_classes()]
+
+
+class RuleIR:
+    # Normalized representation of a rule, computed in one pass over its clauses :
+    # the equivalence classes of its terms (lists of terms) with the representative
+    # of each term (the constant of its class if any), and the results of the static
+    # checks. The rule without equalities is built from it when first asked for.
+    # It is cached on the rule (see Rule.get_ir).
+    def __init__(self, rule):
+        self.source = (rule.head, rule.body)
+        self.predicate = rule.head.predicate_name
+        self.body_predicates = []         # predicates of the clauses of the body
+        self.negated_predicates = []      # predicates of the negated clauses
+        self.arities = [(self.predicate, rule.head.arity)]
+        self.negates_any = False          # whether a negated clause contains _
+        self.conjunctive = True           # whether the body has no (in)equalities
+        self.differences = []
+        classes = DisjointSet()
+        add = classes.add
+        # Variables and _ of the positive clauses : each _ is a distinct term, bound
+        # by the clause it appears in (so p(X) ← q(X, _) is range restricted)
+        safe = set()
+
+        for c in rule.body:
+            if isinstance(c, Clause):
+                self.body_predicates.append(c.predicate_name)
+                self.arities.append((c.predicate_name, c.arity))
+                if c.pos:
+                    safe.update(c.args)
+                else:
+                    self.negated_predicates.append(c.predicate_name)
+                    for a in c.args:
+                        if isinstance(a, Any):
+                            self.negates_any = True
+                for a in c.args:
+                    add(a)
+            elif isinstance(c, Equality):
+                classes.union(c.left, c.right)
+                self.conjunctive = False
+            elif isinstance(c, Different):
+                add(c.left)
+                add(c.right)
+                self.differences.append(c)
+                self.conjunctive = False
+        self.aggregated = False           # whether the head has aggregates
+        for a in rule.head.args:
+            if isinstance(a, Aggregate):
+                self.aggregated = True
+                a = a.term
+            add(a)
+        self.positive_variables = set(a for a in safe if isinstance(a, Var))
+
+        # Representative of each class : its constant if any, else its first term
+        self.eq_classes = classes.get_classes()
+        self.representative = {}
+        self.range_restricted = True
+        self.satisfiable = True
+        for terms in self.eq_classes:
+            constants = [t for t in terms if isinstance(t, Const)]
+            if len(constants) > 1:
+                self.satisfiable = False
+            elif not constants and not any(t in safe for t in terms):
+                self.range_restricted = False
+            representative = constants[0] if constants else terms[0]
+            for t in terms:
+                self.representative[t] = representative
+        for c in self.differences:
+            if self.representative[c.left] is self.representative[c.right]:
+                self.satisfiable = False
+        self.normalized = None
+        self.grouped = None
+        self.compiled = {}  # functions compiled for the rule (see Rule.get_compiled)
+
+    def get_grouped_rule(self):
+        '''Return the rule deriving the rows grouped by an aggregated rule : its head
+        holds the aggregated terms instead of the aggregates (built the first time it
+        is asked for)'''
+        if self.grouped is None:
+            head, body = self.source
+            self.grouped = Rule(Clause(head.predicate_name,
+                                       [a.term if isinstance(a, Aggregate) else a
+                                        for a in head.args], head.pos), body)
+        return self.grouped
+
+    def get_normalized(self):
+        '''Return (head, body) of the rule without equalities, each term being replaced
+        by the representative of its class (built the first time it is asked for)'''
+        if self.normalized is None:
+            head, body = self.source
+            representative = self.representative
+            self.normalized = (
+                Clause(head.predicate_name,
+                       [Aggregate(a.function, representative[a.term]) if isinstance(a, Aggregate)
+                        else representative[a] for a in head.args], head.pos),
+                [Clause(c.predicate_name, [representative[a] for a in c.args], c.pos)
+                 for c in body if isinstance(c, Clause)] +
+                [Different(representative[c.left], representative[c.right])
+                 for c in self.differences])
+        return self.normalized
+
+    def __repr__(self):
+        head, body = self.get_normalized()
+        return "RuleIR(%s ← %s)" % (head, " ".join(map(repr, body)))
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+from .queries import Any, Var, Aggregate, Clause, Rule, Program, Query, \
+    is_recursive_component, distinct_rows
+from .operators import select
+from .prepared import get_database, evaluate_component
+
+__all__ = ['BatchQuery', 'evaluate_batch']
+
+
+def term_signature(term, variables):
+    '''Signature of a term, variables being numbered in order of appearance'''
+    if isinstance(term, Var):
+        return variables.setdefault(term, "V%d" % len(variables))
+    if isinstance(term, Any):
+        return "_"
+    if isinstance(term, Aggregate):
+        return term.function + "(" + term_signature(term.term, variables) + ")"
+    return "'" + term.name
+
+
+def rule_signature(rule, names):
+    '''Signature of a rule which does not depend on the names of its variables
+    @param names: dict predicate -> name under which the predicates of the body are known
+    @return tuple
+    '''
+    variables = {}
+    head = tuple(term_signature(a, variables) for a in rule.head.args)
+    body = tuple((("+" if c.pos else "-") + names[c.predicate_name],)
+                 + tuple(term_signature(a, variables) for a in c.args)
+                 if isinstance(c, Clause) else
+                 ("≠", term_signature(c.left, variables), term_signature(c.right, variables))
+                 for c in rule.body)
+    return head, body
+
+
+class BatchQuery:
+    # Several queries evaluated together on the same facts. Their programs are merged
+    # in one : a predicate is evaluated once for all the queries defining it the same
+    # way (same name, same facts, same rules up to variable renaming and same
+    # definitions of the predicates they read). Predicates of the same name defined
+    # differently are renamed (name#2, name#3, ...).
+    def __init__(self, queries):
+        self.goals = []       # (predicate, constants, variables) of each query
+        self.components = []  # (component, rules, recursive) in evaluation order
+        self.facts = {}       # facts of the program of each merged predicate
+        self.sources = {}     # table of the database each renamed predicate starts from
+        merged = {}           # (predicate, signature of its component) -> merged name
+        taken = set()         # merged names given
+        defined = set()       # merged names of the components already added
+
+        for query in queries:
+            query.assert_evaluable()
+            query = Query(Program([Rule(*r.get_remove_equalities())
+                                   for r in query.program.rules]), [], query.query)
+            rules, facts = {}, {}
+            for r in query.program.rules:
+                if r.body:
+                    rules.setdefault(r.head.predicate_name, []).append(r)
+                else:
+                    facts.setdefault(r.head.predicate_name, []).append(tuple(r.head.args))
+            dependencies = query.program.get_dependencies()
+
+            names = {}  # merged name of each predicate of this query
+            for stratum in query.get_strata():
+                for component in stratum:
+                    local = dict(names, **{p: "@" + p for p in component})
+                    signature = tuple(sorted(
+                        (p, tuple(sorted(rule_signature(r, local) for r in rules.get(p, []))),
+                         tuple(sorted(tuple(c.name for c in row) for row in facts.get(p, []))))
+                        for p in component))
+                    for p in component:
+                        if (p, signature) not in merged:
+                            name, k = p, 1
+                            while name in taken:
+                                k += 1
+                                name = "%s#%d" % (p, k)
+                            merged[(p, signature)] = name
+                            taken.add(name)
+                        names[p] = merged[(p, signature)]
+                    if names[component[0]] in defined:
+                        continue
+
+                    # First query defining the component this way : add it
+                    defined.update(names[p] for p in component)
+                    for p in component:
+                        if names[p] != p:
+                            self.sources[names[p]] = p
+                        if p in facts:
+                            self.facts[names[p]] = tuple(facts[p])
+                    component_rules = tuple(
+                        Rule(rename(r.head, names), [rename(c, names) for c in r.body])
+                        for p in component for r in rules.get(p, []))
+                    if component_rules:
+                        self.components.append((tuple(names[p] for p in component),
+                                                component_rules,
+                                                is_recursive_component(component, dependencies)))
+
+            constants, variables = query.query.get_positions()
+            self.goals.append((names[query.query.predicate_name], tuple(constants),
+                               tuple(tuple(positions) for positions in variables.values())))
+
+    def execute(self, db=None, unique=True, engine='tuple', workers=None):
+        '''Evaluate the queries on a database (see Query.evaluate)
+        @return list of the answers of each query
+        '''
+        if workers is not None:
+            from .parallel import evaluate_parallel
+            engine = 'columnar'
+            db = evaluate_parallel(get_database(db, engine, self.facts, self.sources),
+                                   [self.components], workers)
+        else:
+            db = get_database(db, engine, self.facts, self.sources)
+            for component, rules, recursive in self.components:
+                db = evaluate_component(db, engine, component, rules, recursive)
+
+        answers = []
+        for predicate, constants, variables in self.goals:
+            if engine in ('columnar', 'sqlite'):
+                answers.append(db.get_answer(predicate, unique, constants, variables))
+                continue
+            ans = list(select(db.get(predicate, []), constants, variables))
+            answers.append(distinct_rows(ans) if unique else ans)
+        if engine == 'sqlite':
+            db.release()
+        return answers
+
+    def __repr__(self):
+        return "BatchQuery(%d queries, %d components)" % (len(self.goals), len(self.components))
+
+
+def rename(clause, names):
+    '''Return the clause reading the table of its merged predicate'''
+    if not isinstance(clause, Clause):
+        return clause
+    return Clause(names.get(clause.predicate_name, clause.predicate_name), clause.args, clause.pos)
+
+
+def evaluate_batch(queries, db=None, unique=True, engine='tuple', workers=None):
+    '''Evaluate several queries at once, sharing the predicates they define the same way
+    (see BatchQuery). Constants of the queries select their answers, the queries are
+    not rewritten with magic sets.
+    @return list of the answers of each query
+    '''
+    return BatchQuery(queries).execute(db, unique, engine, workers)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+from .queries import Var, Const, Clause, Different
+from .operators import key_getter, select, build
+from .database import Database
+
+__all__ = ['CompiledRule', 'compile_rule']
+
+
+class CompiledRule:
+    # Python function generated for a rule and a join order : nested loops over the
+    # positive clauses, probing hash indexes on the variables already bound, with the
+    # differences and negated clauses tested as soon as their variables are bound.
+    # sources gives, for each argument of the function, the clause it reads :
+    # (index of the clause in the body, clause, positions of the index key or () for a
+    # scan). Negated clauses are read as sets (or indexes) of keys.
+    def __init__(self, function, sources, text):
+        self.function = function
+        self.sources = sources
+        self.text = text
+
+    def __call__(self, db, delta=None):
+        '''Yield the rows of the head derived from db
+        @param delta: same as in Rule.get_answer
+        @return generator of tuples
+        '''
+        args = []
+        for i, c, positions in self.sources:
+            if delta is not None and delta[0] == i:
+                relation = delta[1]
+            elif isinstance(db, Database) and positions and \
+                    (c.pos or not has_repeated_variables(c)):
+                args.append(db.get_index(c.predicate_name, positions))
+                continue
+            else:
+                relation = db.get(c.predicate_name, [])
+            if c.pos:
+                args.append(build(relation, positions) if positions else relation)
+            else:
+                constants, variables = c.get_positions()
+                get_key = key_getter(positions)
+                args.append(set(get_key(row) for row in
+                                select(relation, constants, list(variables.values()))))
+        return self.function(*args)
+
+    def __repr__(self):
+        return self.text
+
+
+def has_repeated_variables(clause):
+    return any(len(positions) > 1 for positions in clause.get_positions()[1].values())
+
+
+def compile_rule(rule, order, distinct):
+    '''Generate the Python function evaluating a rule (without equalities) in a join order
+    @param order: indexes of the positive clauses of the body in join order
+    @param distinct: as in Rule.get_answer : if true, partial rows are deduplicated on
+    the variables still needed after each join, and the head rows are distinct
+    @return CompiledRule
+    '''
+    names = {}      # name of each term in the generated code
+    constants = {}  # name -> constant, given to the generated code
+    bound = set()   # variables bound by the loops written so far
+    kept = set()    # bound variables the partial rows are not yet deduplicated on
+    sources = []
+    lines = []
+    filters = [c for c in rule.body if isinstance(c, Different) or
+               (isinstance(c, Clause) and c.is_negative())]
+
+    def name(term):
+        if term not in names:
+            if isinstance(term, Var):
+                names[term] = "v%d" % len(names)
+            else:
+                names[term] = "c%d" % len(constants)
+                constants[names[term]] = term
+        return names[term]
+
+    def key(terms):
+        return "(" + "".join(name(t) + ", " for t in terms) + ")"
+
+    def write_filters(indent, skip):
+        # Test the filters whose variables are all bound
+        for c in [c for c in filters if bound.issuperset(a for a in c.args if isinstance(a, Var))]:
+            filters.remove(c)
+            if isinstance(c, Different):
+                lines.append(indent + "if %s == %s: %s" % (name(c.left), name(c.right), skip))
+                continue
+            positions = [p for p, a in enumerate(c.args) if isinstance(a, Const)]
+            positions += [p for p, a in enumerate(c.args)
+                          if isinstance(a, Var) and c.args.index(a) == p]
+            lines.append(indent + "if %s in n%d: %s" % (
+                key(c.args[p] for p in positions), len(sources), skip))
+            sources.append((rule.body.index(c), c, tuple(positions)))
+
+    indent = "    "
+    write_filters(indent, "return")
+    for step, (i, live) in enumerate(zip(order, rule.get_live_variables(order))):
+        c = rule.body[i]
+        row = "r%d" % step
+        constant_positions, variables = c.get_positions()
+        shared = [(v, positions[0]) for v, positions in variables.items() if v in bound]
+        positions = tuple([p for p, _ in constant_positions] + [p for _, p in shared])
+        if positions:
+            lines.append(indent + "for %s in s%d.get(%s, ()):" % (
+                row, len(sources), key([a for _, a in constant_positions] + [v for v, _ in shared])))
+        else:
+            lines.append(indent + "for %s in s%d:" % (row, len(sources)))
+        sources.append((i, c, positions))
+        indent += "    "
+        for v, var_positions in variables.items():
+            if v not in bound:
+                lines.append(indent + "%s = %s[%d]" % (name(v), row, var_positions[0]))
+                bound.add(v)
+                kept.add(v)
+            for p in var_positions[1:]:
+                lines.append(indent + "if %s[%d] != %s: continue" % (row, p, name(v)))
+        write_filters(indent, "continue")
+        if distinct and not kept <= live and step < len(order) - 1:
+            # Skip the partial rows already seen on the variables still needed
+            kept &= live
+            lines.append(indent + "k = " + key(sorted(kept, key=name)))
+            lines.append(indent + "if k in seen%d: continue" % step)
+            lines.append(indent + "seen%d.add(k)" % step)
+            lines.insert(0, "    seen%d = set()" % step)
+
+    head = key(rule.head.args)
+    if distinct:
+        lines.append(indent + "k = " + head)
+        lines.append(indent + "if k not in seen:")
+        lines.append(indent + "    seen.add(k)")
+        lines.append(indent + "    yield k")
+        lines.insert(0, "    seen = set()")
+    else:
+        lines.append(indent + "yield " + head)
+
+    arguments = ", ".join(("s%d" if c.pos else "n%d") % k for k, (_, c, _) in enumerate(sources))
+    text = "def answer(%s):\n" % arguments + "\n".join(lines) + "\n"
+    namespace = dict(constants)
+    exec(compile(text, "<rule %r>" % rule, "exec"), namespace)
+    return CompiledRule(namespace['answer'], sources, text)
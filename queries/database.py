@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+from collections import Counter
+
+from .operators import key_getter
+from .planner import RelationStatistics
+
+__all__ = ['Database']
+
+
+class Database(dict):
+    # dict of tables (predicate name -> list of rows) keeping hash indexes on
+    # their columns. An index is built the first time it is asked for and kept
+    # until its table is replaced : tables are append-only, rows appended to a
+    # table are added to its indexes on the next lookup. Statistics on the
+    # tables (see planner.RelationStatistics) are maintained the same way.
+    # An overlay keeps the indexes of the tables it replaces, the indexes of the
+    # tables it shares with its base are kept by the base. Rows can also be removed
+    # from a table of distinct rows with remove_rows, which patches its indexes.
+    # Facts are added with add_rows, which skips the rows a table already holds.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.indexes = {}
+        self.statistics = {}
+        self.positions = {}
+        self.base = None  # Database this one is an overlay of
+
+    def get_owner(self, name):
+        ''' Return the database caching the indexes of table name : the base of an
+        overlay (or the base of the base...) for the tables it did not replace'''
+        db = self
+        while db.base is not None and db.base.get(name) is db.get(name):
+            db = db.base
+        return db
+
+    def get_index(self, name, positions):
+        ''' Return the index of table name on the given argument positions
+        @param positions: tuple of positions
+        @return dict (values at positions) -> list of rows
+        '''
+        db = self.get_owner(name)
+        table = db.get(name, [])
+        entry = db.indexes.get((name, positions))
+        if entry is None or entry[0] is not table or entry[1] > len(table):
+            entry = (table, 0, {})
+        table, indexed, index = entry
+        if indexed < len(table):
+            get_key = key_getter(positions)
+            for i in range(indexed, len(table)):
+                row = table[i]
+                index.setdefault(get_key(row), []).append(row)
+            db.indexes[(name, positions)] = (table, len(table), index)
+        return index
+
+    def get_statistics(self, name, arity):
+        ''' Return the RelationStatistics of table name'''
+        db = self.get_owner(name)
+        table = db.get(name, [])
+        entry = db.statistics.get(name)
+        if entry is None or entry[0] is not table or entry[1] > len(table) \
+                or len(entry[2]) != arity:
+            entry = (table, 0, [Counter() for _ in range(arity)])
+        table, counted, values = entry
+        if counted < len(table):
+            for i in range(counted, len(table)):
+                for column, v in zip(values, table[i]):
+                    column[v] += 1
+            db.statistics[name] = (table, len(table), values)
+        return RelationStatistics(len(table), [len(column) for column in values])
+
+    def get_positions(self, name):
+        ''' Return the position of each row of table name, whose rows are distinct
+        @return dict row -> index in the table
+        '''
+        db = self.get_owner(name)
+        table = db.get(name, [])
+        entry = db.positions.get(name)
+        if entry is None or entry[0] is not table or entry[1] > len(table):
+            entry = (table, 0, {})
+        table, indexed, positions = entry
+        if indexed < len(table):
+            for i in range(indexed, len(table)):
+                positions[table[i]] = i
+            db.positions[name] = (table, len(table), positions)
+        return positions
+
+    def add_rows(self, name, rows):
+        ''' Add rows (tuples of constants) to table name, skipping the rows it
+        already holds : facts are sets. A table shared with the base database is
+        replaced by a copy, so that the base is not modified, the others are
+        appended to.'''
+        table = self.get(name)
+        if table is None or (self.base is not None and self.base.get(name) is table):
+            table = self[name] = list(table or [])
+        positions = self.get_positions(name)
+        for row in rows:
+            if row not in positions:
+                positions[row] = len(table)
+                table.append(row)
+        self.positions[name] = (table, len(table), positions)
+
+    def remove_rows(self, name, rows):
+        ''' Remove rows from table name (whose rows are distinct) in place : each
+        removed row is replaced by the last row of the table. The indexes and the
+        statistics of the table are patched instead of being rebuilt.
+        @param rows: iterable of rows of the table
+        '''
+        db = self.get_owner(name)
+        table = db[name]
+        # Index the appended rows first : the indexes then hold every row
+        indexes = [(positions, key_getter(positions), self.get_index(name, positions))
+                   for n, positions in list(db.indexes) if n == name]
+        values = None
+        if name in db.statistics:
+            self.get_statistics(name, len(db.statistics[name][2]))
+            values = db.statistics[name][2]
+        positions = self.get_positions(name)
+        for row in rows:
+            i = positions.pop(row)
+            last = table.pop()
+            if i < len(table):
+                table[i] = last
+                positions[last] = i
+            for _, get_key, index in indexes:
+                key = get_key(row)
+                index[key].remove(row)
+                if not index[key]:
+                    del index[key]
+            if values is not None:
+                for column, v in zip(values, row):
+                    column[v] -= 1
+                    if not column[v]:
+                        del column[v]
+        for key_positions, _, index in indexes:
+            db.indexes[(name, key_positions)] = (table, len(table), index)
+        if values is not None:
+            db.statistics[name] = (table, len(table), values)
+        db.positions[name] = (table, len(table), positions)
+
+    def invalidate(self, name):
+        ''' Drop the indexes of a table modified otherwise than by appending rows'''
+        for key in [k for k in self.indexes if k[0] == name]:
+            del self.indexes[key]
+        self.statistics.pop(name, None)
+        self.positions.pop(name, None)
+
+    def overlay(self):
+        ''' Return a new Database containing the same tables, so that tables added
+        to it do not modify this one. The indexes of the tables they share are
+        built and kept by this one.'''
+        db = Database(self)
+        db.base = self
+        return db
+
+    def __repr__(self):
+        return "Database(%s)" % dict.__repr__(self)
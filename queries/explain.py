@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+
+from .queries import Clause, Different, seminaive
+from .prepared import get_database
+
+__all__ = ['Explanation', 'explain']
+
+
+class Explanation:
+    # Plan of a prepared query : its components in evaluation order and, for each
+    # rule, the operators of its join plan with their estimated number of rows.
+    # When the query was analyzed, the measures of each component, rule and
+    # operator (calls, rows, time and peak intermediate size) are included.
+    def __init__(self, query, components, analyze, seconds=None):
+        self.query = query
+        self.components = components
+        self.analyze = analyze
+        self.seconds = seconds
+
+    def to_dict(self):
+        return {'query': self.query, 'analyze': self.analyze, 'seconds': self.seconds,
+                'components': self.components}
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def __str__(self):
+        lines = []
+        for c in self.components:
+            line = "stratum %d, %s%s" % (c['stratum'], ", ".join(c['predicates']),
+                                         " (recursive)" if c['recursive'] else "")
+            if self.analyze:
+                line += " : %.6f s, %s" % (c['seconds'], ", ".join(
+                    "%s %d rows" % item for item in c['rows'].items()))
+            lines.append(line)
+            for r in c['rules']:
+                line = "  " + r['rule']
+                if self.analyze:
+                    line += "  [%d calls, %.6f s, %d rows, peak %d]" % (
+                        r['calls'], r['seconds'], r['rows'], r['peak'])
+                lines.append(line)
+                for op in r['operators']:
+                    estimate = " [~%d rows]" % op['estimate'] if 'estimate' in op else ""
+                    lines.append("    " + op['operator'] + estimate)
+                for op in r.get('measures', []):
+                    lines.append("    > %s : %d calls, %d rows in, %d rows, %.6f s" % (
+                        op['operator'], op['calls'], op['rows_in'], op['rows'], op['seconds']))
+        if self.analyze:
+            lines.append("total : %.6f s" % self.seconds)
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "Explanation(" + self.query + ")"
+
+
+def describe_rule(rule, db):
+    '''Operators evaluating a rule on a database, with their estimated output size
+    @return list of dict (operator, and estimate for the joins)
+    '''
+    aggregated = rule.get_ir().aggregated
+    if aggregated:
+        rule, head = rule.get_ir().get_grouped_rule(), rule.head
+    plan = rule.get_join_plan(db)
+    operators = []
+    bound = set()
+    for i, estimate in zip(plan.order, plan.estimates):
+        operators.append({'operator': rule.get_join_method(db, None, i, bound) + " " +
+                          repr(rule.body[i]), 'estimate': round(estimate)})
+        bound.update(rule.body[i].get_vars())
+    for c in rule.body:
+        if isinstance(c, Different) or (isinstance(c, Clause) and c.is_negative()):
+            operators.append({'operator': "filter " + repr(c)})
+    operators.append({'operator': "head " + repr(rule.head)})
+    if aggregated:
+        operators.append({'operator': "group by " + repr(head)})
+    return operators
+
+
+def summarize_trace(trace):
+    '''Aggregate the measures of the operators of a rule over all its evaluations
+    @param trace: list of (operator, rows, seconds), as filled by Rule.get_answer
+    @return dict of the measures of the rule, with the list of the measures of
+    each operator
+    '''
+    measures = {}
+    rows_in = 1  # an evaluation starts from the empty row
+    head_rows = 0
+    rule = {'calls': 0, 'seconds': 0.0, 'rows': 0, 'peak': 0}
+    for operator, rows, seconds in trace:
+        if operator.startswith(("index join", "hash join", "scan")) and head_rows is not None:
+            rows_in, head_rows = 1, None
+        m = measures.setdefault(operator, {'operator': operator, 'calls': 0, 'rows_in': 0,
+                                           'rows': 0, 'seconds': 0.0, 'peak': 0})
+        m['calls'] += 1
+        m['rows_in'] += rows_in
+        m['rows'] += rows
+        m['seconds'] += seconds
+        m['peak'] = max(m['peak'], rows)
+        rule['seconds'] += seconds
+        rule['peak'] = max(rule['peak'], rows)
+        rows_in = rows
+        if operator.startswith("head "):
+            rule['calls'] += 1
+            rule['rows'] += rows
+            head_rows = rows
+        elif operator.startswith("group by "):
+            # The rows of the head are grouped : the rule derives the groups
+            rule['rows'] += rows - head_rows
+    rule['measures'] = list(measures.values())
+    return rule
+
+
+def explain(prepared, db=None, analyze=False, hooks=()):
+    '''Explain how a prepared query is evaluated with the tuple engine
+    @param db: optional Database, as in PreparedQuery.execute
+    @param analyze: if true, evaluate the query and measure each operator (their
+    outputs are then materialized). The rules are then evaluated by the interpreted
+    pipeline of operators (see Rule.iter_answer), not by their compiled functions :
+    the plans and the numbers of rows are the ones of a normal evaluation, but the
+    times are the ones of the interpreter, which is slower. Otherwise the join plans are estimated from the
+    statistics of the database, in which the derived tables are still empty.
+    @param hooks: callables called with the dict describing each component, once it
+    is evaluated
+    @return Explanation
+    '''
+    db = get_database(db, 'tuple', prepared.facts)
+    components = []
+    start = time.perf_counter()
+    for k, stratum in enumerate(prepared.strata):
+        for component, rules, recursive in stratum:
+            entry = {'predicates': list(component), 'stratum': k, 'recursive': recursive,
+                     'rules': [{'rule': repr(r), 'operators': describe_rule(r, db)}
+                               for r in rules]}
+            if analyze:
+                traces = {r: [] for r in rules}
+                component_start = time.perf_counter()
+                if recursive:
+                    db = seminaive(rules, component, db, traces=traces)
+                else:
+                    for r in rules:
+                        db = r.evaluate(db, trace=traces[r])
+                entry['seconds'] = time.perf_counter() - component_start
+                entry['rows'] = {p: len(db.get(p, [])) for p in component}
+                for r, rule_entry in zip(rules, entry['rules']):
+                    rule_entry.update(summarize_trace(traces[r]))
+            for hook in hooks:
+                hook(entry)
+            components.append(entry)
+    seconds = time.perf_counter() - start if analyze else None
+    return Explanation(repr(prepared.rewritten), components, analyze, seconds)
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+from collections import Counter
+
+from .queries import Var, Const, Any, Clause, Rule, seminaive, is_recursive_component, \
+    distinct_rows
+from .operators import select
+
+__all__ = ['MaterializedQuery']
+
+
+class MaterializedQuery:
+    # Evaluated query whose derived tables are kept up to date when facts of
+    # extensional predicates are inserted or deleted. Non-recursive predicates
+    # keep the number of derivations of each tuple (counting algorithm),
+    # recursive components are maintained by deleting and rederiving (DRed).
+    # The tables, their indexes, the counts and the sets of rows of the recursive
+    # predicates are updated in place : an update only reads the changed rows and
+    # the rows joining them.
+    def __init__(self, query, db=None):
+        query.assert_evaluable()
+        if query.program.has_aggregates():
+            raise Exception("Aggregates are not maintained incrementally")
+        query.remove_equalities()
+        self.query = query
+        self.db, _ = query.get_data(db)
+        for name in list(self.db):
+            self.db[name] = list(set(self.db[name]))
+
+        self.rules = {}
+        for r in query.program.rules:
+            if r.body:
+                self.rules.setdefault(r.head.predicate_name, []).append(r)
+        dependencies = query.program.get_dependencies()
+        self.components = [(component, is_recursive_component(component, dependencies))
+                           for stratum in query.get_strata() for component in stratum
+                           if any(p in self.rules for p in component)]
+        # Facts of the intensional predicates, which always hold
+        self.base = {p: set(self.db.get(p, [])) for p in self.rules}
+        self.delta_rules = {}  # rewritten rules evaluated by the updates
+
+        self.counts = {}
+        self.known = {}  # rows of the tables of the recursive predicates
+        for component, recursive in self.components:
+            rules = [r for p in component for r in self.rules[p]]
+            if recursive:
+                seminaive(rules, component, self.db)
+                self.known.update((p, set(self.db[p])) for p in component)
+            else:
+                p = component[0]
+                counts = Counter(self.db.get(p, []))
+                for r in rules:
+                    counts.update(r.get_answer(self.db))
+                self.counts[p] = counts
+                self.db[p] = list(counts)
+
+    def insert(self, facts):
+        ''' Insert facts and update the derived tables
+        @param facts: dict predicate -> iterable of rows (of constants or str)
+        '''
+        return self.update(facts, {})
+
+    def delete(self, facts):
+        ''' Delete facts and update the derived tables
+        @param facts: dict predicate -> iterable of rows (of constants or str)
+        '''
+        return self.update({}, facts)
+
+    def update(self, inserted, deleted):
+        ''' Delete then insert facts, and update the derived tables
+        @return dict predicate -> (inserted rows, deleted rows) for each modified table
+        '''
+        plus, minus = {}, {}
+        for name in set(inserted) | set(deleted):
+            if name in self.rules:
+                raise Exception("Only facts of extensional predicates can be inserted "
+                                "or deleted, %s is defined by rules" % name)
+            self.db.setdefault(name, [])
+            present = self.db.get_positions(name)
+            new = set(map(to_row, inserted.get(name, [])))
+            self.change_table(name, set(t for t in new if t not in present),
+                              set(t for t in map(to_row, deleted.get(name, []))
+                                  if t in present and t not in new), plus, minus)
+
+        for component, recursive in self.components:
+            rules = [r for p in component for r in self.rules[p]]
+            if not any(c.predicate_name in plus for r in rules for c in r.body
+                       if isinstance(c, Clause)):
+                continue
+            if recursive:
+                self.dred(rules, component, plus, minus)
+            else:
+                self.count(rules, component[0], plus, minus)
+        return {p: (list(plus[p]), list(minus[p])) for p in plus}
+
+    def change_table(self, name, added, removed, plus, minus):
+        ''' Add and remove rows of a table in place, and record its changes
+        @param added, removed: sets of rows absent from and present in the table
+        '''
+        if added or removed:
+            self.db.remove_rows(name, removed)
+            self.db[name].extend(added)
+            plus[name] = added
+            minus[name] = removed
+
+    def get_changes(self, plus, minus):
+        ''' Return an overlay of the database holding the changes of the modified
+        tables : the tables name#plus and name#minus'''
+        db = self.db.overlay()
+        for name in plus:
+            db[name + "#plus"] = list(plus[name])
+            db[name + "#minus"] = list(minus[name])
+        return db
+
+    def get_delta_rules(self, rule, i, old):
+        ''' Return the rules deriving the rows of the rule in which the i-th clause
+        of the body reads the table #delta, and the clauses at the positions old read
+        the state of their table before the update (see old_state_bodies)'''
+        key = (rule, i, old)
+        if key not in self.delta_rules:
+            body = list(rule.body)
+            body[i] = Clause("#delta", body[i].args, True)
+            self.delta_rules[key] = [Rule(rule.head, b) for b in old_state_bodies(body, old)]
+        return self.delta_rules[key]
+
+    def get_deltas(self, rule, plus, minus, positive=True):
+        ''' Yield the (index, rows, sign) of the changes to apply to each changed
+        clause of the body : the rows of the clause whose truth value became
+        true (sign 1) or false (sign -1)'''
+        for i, c in enumerate(rule.body):
+            if isinstance(c, Clause) and c.predicate_name in plus:
+                if positive and c.pos and plus[c.predicate_name]:
+                    yield i, plus[c.predicate_name], 1
+                if c.pos and minus[c.predicate_name]:
+                    yield i, minus[c.predicate_name], -1
+                if c.is_negative() and positive and minus[c.predicate_name]:
+                    yield i, minus[c.predicate_name], 1
+                if c.is_negative() and plus[c.predicate_name]:
+                    yield i, plus[c.predicate_name], -1
+
+    def count(self, rules, p, plus, minus):
+        ''' Update the derivation counts of a non-recursive predicate :
+        for each changed clause i, the derivations with clauses before i in
+        their new state, i in its delta and clauses after i in their old state'''
+        delta = Counter()
+        db = self.get_changes(plus, minus)
+        for r in rules:
+            for i, rows, sign in self.get_deltas(r, plus, minus):
+                db["#delta"] = list(rows)
+                old = tuple(j for j, c in enumerate(r.body) if j > i and
+                            isinstance(c, Clause) and c.predicate_name in plus)
+                for delta_rule in self.get_delta_rules(r, i, old):
+                    for t in delta_rule.get_answer(db):
+                        delta[t] += sign
+
+        counts = self.counts[p]
+        added, removed = set(), set()
+        for t, d in delta.items():
+            if not d:
+                continue
+            if not counts[t]:
+                added.add(t)
+            counts[t] += d
+            if counts[t] <= 0:
+                del counts[t]
+                removed.add(t)
+        self.change_table(p, added - removed, removed - added, plus, minus)
+
+    def dred(self, rules, component, plus, minus):
+        ''' Update a recursive component : over-delete every tuple having a
+        derivation using a deleted tuple, rederive the ones having another
+        derivation, then insert the new tuples with semi-naive iteration'''
+        known = {p: self.known[p] for p in component}
+        old_db = self.get_changes(plus, minus)
+
+        def changed(rule, i):
+            # Clauses other than i reading a modified table, in the old state
+            return tuple(j for j, c in enumerate(rule.body) if j != i and
+                         isinstance(c, Clause) and c.predicate_name in plus)
+
+        # Over-deletion, in the old state of the database
+        deleted = {p: set() for p in component}
+        delta = {p: set() for p in component}
+        for r in rules:
+            for i, rows, _ in self.get_deltas(r, plus, minus, positive=False):
+                old_db["#delta"] = list(rows)
+                for delta_rule in self.get_delta_rules(r, i, changed(r, i)):
+                    delta[r.head.predicate_name].update(delta_rule.get_answer(old_db))
+        while any(delta.values()):
+            for p in component:
+                delta[p] = set(t for t in delta[p] if t in known[p] and t not in deleted[p])
+                deleted[p] |= delta[p]
+            new_delta = {p: set() for p in component}
+            for r in rules:
+                for i, c in enumerate(r.body):
+                    if isinstance(c, Clause) and c.pos and c.predicate_name in delta \
+                            and delta[c.predicate_name]:
+                        old_db["#delta"] = list(delta[c.predicate_name])
+                        for delta_rule in self.get_delta_rules(r, i, changed(r, i)):
+                            new_delta[r.head.predicate_name].update(delta_rule.get_answer(old_db))
+            delta = new_delta
+        marks = {}
+        for p in component:
+            self.db.remove_rows(p, deleted[p])
+            known[p] -= deleted[p]
+            marks[p] = len(self.db[p])
+
+        # Rederivation of the over-deleted tuples, in the new state
+        seeds = {p: deleted[p] & self.base[p] for p in component}
+        for r in rules:
+            p = r.head.predicate_name
+            if deleted[p]:
+                db = self.db.overlay()
+                db["#deleted"] = list(deleted[p])
+                key = (r, "#deleted")
+                if key not in self.delta_rules:
+                    self.delta_rules[key] = Rule(r.head, [Clause("#deleted", r.head.args, True)]
+                                                 + list(r.body))
+                seeds[p].update(self.delta_rules[key].get_answer(db))
+
+        # Insertion, in the new state
+        for r in rules:
+            for i, rows, sign in self.get_deltas(r, plus, minus):
+                if sign > 0:
+                    db = self.db.overlay()
+                    db["#delta"] = list(rows)
+                    for delta_rule in self.get_delta_rules(r, i, ()):
+                        seeds[r.head.predicate_name].update(delta_rule.get_answer(db))
+        seminaive(rules, component, self.db,
+                  {p: [t for t in seeds[p] if t not in known[p]] for p in component}, known=known)
+
+        for p in component:
+            added = set(t for t in self.db[p][marks[p]:] if t not in deleted[p])
+            removed = set(t for t in deleted[p] if t not in known[p])
+            if added or removed:
+                plus[p] = added
+                minus[p] = removed
+
+    def get_answer(self, unique=True):
+        ''' Return the answer of the query, as Query.evaluate'''
+        constants, variables = self.query.query.get_positions()
+        ans = list(select(self.db.get(self.query.query.predicate_name, []),
+                          constants, list(variables.values())))
+        if unique:
+            ans = distinct_rows(ans)
+        return ans
+
+    def __repr__(self):
+        return "MaterializedQuery(" + self.query.__repr__() + ")"
+
+
+def old_state_bodies(body, old):
+    '''Return the bodies whose derivations are the ones of a body in which the
+    clauses at the positions old read the state of their table before an update,
+    from its current state and its changes (tables name#plus and name#minus) : a
+    row held before the update is either held now and not inserted, or deleted.
+    @return list of lists of clauses
+    '''
+    bodies = [[]]
+    for j, c in enumerate(body):
+        if j not in old:
+            bodies = [b + [c] for b in bodies]
+            continue
+        name = c.predicate_name
+        if c.pos:
+            # The _ of the clause are the same row in both clauses, and are distinct
+            # from the ones of the other clauses
+            args = [Var("_#%d_%d" % (j, k)) if isinstance(a, Any) else a
+                    for k, a in enumerate(c.args)]
+            choices = [[Clause(name, args, True), Clause(name + "#plus", args, False)],
+                       [Clause(name + "#minus", args, True)]]
+        else:
+            choices = [[c, Clause(name + "#minus", c.args, False)],
+                       [Clause(name + "#plus", c.args, True)]]
+        bodies = [b + choice for b in bodies for choice in choices]
+    return bodies
+
+
+def to_row(row):
+    '''Convert a row of str or constants to a tuple of constants'''
+    return tuple(v if isinstance(v, Const) else Const(v) for v in row)
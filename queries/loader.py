@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import csv
+import json
+import re
+
+import numpy as np
+
+from .queries import Const
+from .store import ColumnStore, Relation
+from .sql import SQLiteStore
+
+__all__ = ['to_constant', 'read_rows', 'load_facts']
+
+NAME = re.compile(r"[a-z][a-zA-Z0-9\-_]*")
+QUOTED = re.compile(r"'([^']|\\')+'|\"([^\"]|\\\")+\"")
+
+FORMATS = {'.csv': 'csv', '.tsv': 'tsv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+
+def to_constant(value):
+    '''Return the constant the parser builds for a value written in a file :
+    names starting with a lower case letter and quoted names are kept as they are,
+    other values are single quoted (so "Actor0" gives the constant 'Actor0')
+    '''
+    value = str(value)
+    if NAME.fullmatch(value) or QUOTED.fullmatch(value):
+        return Const(value)
+    return Const("'" + value.replace("'", "\\'") + "'")
+
+
+def read_rows(f, format, predicate=None):
+    '''Stream the facts of an open file
+    @param format: 'csv', 'tsv' or 'jsonl'. The lines of a jsonl file are either
+    lists of values, or objects {"predicate": name, "args": list of values}
+    @param predicate: predicate of the rows (required except for jsonl objects)
+    @return generator of (line number, predicate, list of values)
+    '''
+    if format in ('csv', 'tsv'):
+        reader = csv.reader(f, delimiter=',' if format == 'csv' else '\t')
+        for row in reader:
+            if row:
+                yield reader.line_num, predicate, row
+    elif format == 'jsonl':
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            fact = json.loads(line)
+            if isinstance(fact, dict):
+                yield line_num, fact['predicate'], fact['args']
+            else:
+                yield line_num, predicate, fact
+    else:
+        raise Exception("Unknown fact file format : %s" % format)
+
+
+def load_facts(db, file_name, predicate=None, format=None, program=None, chunk_size=100000):
+    '''Stream facts from a delimited or jsonl file into the tables of a database,
+    without going through the parser
+    @param db: Database (rows are added to its tables, see Database.add_rows : the
+    base of an overlay is not modified), ColumnStore or SQLiteStore (rows are
+    inserted in its tables, committed at the end)
+    @param file_name: path of the file, its format is guessed from its extension
+    (.csv, .tsv, .jsonl) if format is not given
+    @param predicate: predicate of the facts of a csv/tsv file or of a jsonl file
+    made of lists
+    @param program: optional Program (or Query) whose arities the facts must match
+    @param chunk_size: number of rows converted at once
+    @return dict predicate -> number of facts loaded
+    '''
+    if format is None:
+        format = FORMATS.get(file_name[file_name.rfind('.'):].lower())
+    arities = {}
+    if program is not None:
+        if hasattr(program, 'program'):
+            program = program.program
+        assert program.check_predicate_arity(
+        ), "Arity of a predicate is not constant everywhere in the program"
+        arities = program.get_predicate_arities()
+    if isinstance(db, ColumnStore):
+        arities.update((name, r.get_arity()) for name, r in db.relations.items())
+    elif isinstance(db, SQLiteStore):
+        arities.update((name, db.get_arity(name)) for name in db.get_tables())
+    else:
+        arities.update((name, len(rows[0])) for name, rows in db.items() if rows)
+
+    counts = {}
+    encoded = {}  # chunks of the relations of a ColumnStore, concatenated at the end
+    chunks = {}
+
+    def flush(name):
+        rows = chunks.pop(name)
+        if isinstance(db, ColumnStore):
+            encoded.setdefault(name, []).append(
+                Relation.from_rows(rows, arities[name], db.dictionary))
+        elif isinstance(db, SQLiteStore):
+            db.add_rows(name, rows, arities[name])
+        else:
+            # A table shared with the base of an overlay is replaced, not extended
+            db.add_rows(name, rows)
+
+    with open(file_name, encoding='utf8', newline='') as f:
+        for line_num, name, values in read_rows(f, format, predicate):
+            if name is None:
+                raise Exception("%s:%d : no predicate given for the facts" % (file_name, line_num))
+            arity = arities.setdefault(name, len(values))
+            if len(values) != arity:
+                raise Exception("%s:%d : %s has arity %d, got %d values" % (
+                    file_name, line_num, name, arity, len(values)))
+            chunk = chunks.setdefault(name, [])
+            chunk.append(tuple(to_constant(v) for v in values))
+            counts[name] = counts.get(name, 0) + 1
+            if len(chunk) >= chunk_size:
+                flush(name)
+    for name in list(chunks):
+        flush(name)
+    if isinstance(db, SQLiteStore):
+        db.connection.commit()
+
+    for name, relations in encoded.items():
+        # Facts are sets : the rows already held are skipped
+        relation = Relation([np.concatenate(columns) for columns in
+                             zip(*[r.columns for r in relations])],
+                            sum(len(r) for r in relations)).unique()
+        if name in db.relations:
+            relation = relation - db.relations[name]
+        db.add(name, relation)
+    return counts
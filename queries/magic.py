@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+from .queries import Var, Const, Clause, Rule, Program, Query
+
+__all__ = ['magic_rewrite']
+
+
+def get_adornment(args, bound):
+    '''Adornment of an atom : 'b' for each argument that is a constant or a bound
+    variable, 'f' for the free ones'''
+    return "".join("b" if isinstance(a, Const) or a in bound else "f" for a in args)
+
+
+def adorned_name(predicate, adornment):
+    return predicate + "@" + adornment
+
+
+def magic_name(predicate, adornment):
+    return "magic@" + predicate + "@" + adornment
+
+
+def bound_args(args, adornment):
+    return [a for a, x in zip(args, adornment) if x == "b"]
+
+
+def magic_rewrite(query):
+    '''Magic-sets rewriting of a query (without equalities) : the constants of the
+    query are propagated through the rules (left to right), so that bottom-up
+    evaluation only derives the facts relevant to the query.
+
+    Each needed couple (predicate, adornment) gets a magic predicate holding the
+    bindings it is asked for, and an adorned copy of its rules guarded by this
+    magic predicate. Predicates appearing under a negation keep their original
+    definition. Facts are kept as they are, and each adorned predicate reads the
+    facts of the original one through a bridge rule.
+    Programs with aggregates are not rewritten : an aggregate needs all the
+    derivations of its groups.
+    @return Query, whose query predicate is the adorned query predicate
+    '''
+    program = query.program
+    goal = query.query
+    rules = {}
+    for r in program.rules:
+        if r.body:
+            rules.setdefault(r.head.predicate_name, []).append(r)
+    if goal.predicate_name not in rules or program.has_aggregates():
+        return query
+
+    new_rules = [r for r in program.rules if not r.body]
+    adornment = get_adornment(goal.args, set())
+    new_rules.append(Rule(Clause(magic_name(goal.predicate_name, adornment),
+                                 bound_args(goal.args, adornment), True), []))
+    todo = [(goal.predicate_name, adornment)]
+    seen = set(todo)
+    negated = set()
+    while todo:
+        predicate, adornment = todo.pop()
+        arity = rules[predicate][0].head.arity
+        args = [Var("V@%d" % i) for i in range(arity)]
+        magic = Clause(magic_name(predicate, adornment), bound_args(args, adornment), True)
+        new_rules.append(Rule(Clause(adorned_name(predicate, adornment), args, True),
+                              [magic, Clause(predicate, args, True)]))
+
+        for r in rules[predicate]:
+            magic = Clause(magic_name(predicate, adornment),
+                           bound_args(r.head.args, adornment), True)
+            bound = set(a for a in magic.args if isinstance(a, Var))
+            body = [magic]
+            for c in r.body:
+                if isinstance(c, Clause) and c.pos and c.predicate_name in rules:
+                    c_adornment = get_adornment(c.args, bound)
+                    guard = [l for l in body if (isinstance(l, Clause) and l.pos)
+                             or set(a for a in l.args if isinstance(a, Var)) <= bound]
+                    magic_head = Clause(magic_name(c.predicate_name, c_adornment),
+                                        bound_args(c.args, c_adornment), True)
+                    if guard != [magic] or magic_head.predicate_name != magic.predicate_name \
+                            or magic_head.args != magic.args:
+                        new_rules.append(Rule(magic_head, guard))
+                    body.append(Clause(adorned_name(c.predicate_name, c_adornment), c.args, True))
+                    if (c.predicate_name, c_adornment) not in seen:
+                        seen.add((c.predicate_name, c_adornment))
+                        todo.append((c.predicate_name, c_adornment))
+                else:
+                    if isinstance(c, Clause) and c.is_negative() and c.predicate_name in rules:
+                        negated.add(c.predicate_name)
+                    body.append(c)
+                if isinstance(c, Clause) and c.pos:
+                    bound.update(c.get_vars())
+            new_rules.append(Rule(Clause(adorned_name(predicate, adornment), r.head.args, True),
+                                  body))
+
+    # Predicates under a negation are computed entirely, with their dependencies
+    dependencies = program.get_dependencies()
+    needed = set()
+    todo = list(negated)
+    while todo:
+        p = todo.pop()
+        if p in rules and p not in needed:
+            needed.add(p)
+            todo.extend(dependencies[p])
+    new_rules.extend(r for p in needed for r in rules[p])
+
+    return Query(Program(new_rules), [],
+                 Clause(adorned_name(goal.predicate_name, get_adornment(goal.args, set())),
+                        goal.args, True))
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+import re
+from operator import itemgetter
+
+# The operators are the building blocks of the engines : they are used through
+# queries.operators, not exported by the package
+__all__ = []
+
+NUMBER = re.compile(r"-?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?")
+
+
+def key_getter(positions):
+    '''Return a function extracting the join key of a row
+    @param positions: list of positions of the key columns in the row
+    @return function row -> key (a tuple whatever the number of columns)
+    '''
+    if not positions:
+        return lambda row: ()
+    if len(positions) == 1:
+        pos = positions[0]
+        return lambda row: (row[pos],)
+    return itemgetter(*positions)
+
+
+def scan(relation, constants, variables):
+    '''Select the rows of a relation and project them on the variables of an atom
+    @param relation: iterable of rows
+    @param constants: list of (position, constant) the row must match
+    @param variables: list of list of positions, one list per distinct variable
+    (a variable appearing twice in the atom requires equal values)
+    @return generator of tuples with one value per variable
+    '''
+    firsts = [positions[0] for positions in variables]
+    for row in select(relation, constants, variables):
+        yield tuple(row[i] for i in firsts)
+
+
+def select(relation, constants, variables):
+    '''Select the rows of a relation matching an atom (same parameters as scan)
+    @return generator of the selected rows
+    '''
+    repeated = [positions for positions in variables if len(positions) > 1]
+    for row in relation:
+        if any(row[i] != c for i, c in constants):
+            continue
+        if any(row[i] != row[positions[0]] for positions in repeated for i in positions[1:]):
+            continue
+        yield row
+
+
+def project(rows, positions):
+    '''Keep the columns of the rows at the given positions
+    @return generator of tuples
+    '''
+    get_key = key_getter(positions)
+    return (get_key(row) for row in rows)
+
+
+def deduplicate(rows):
+    '''Remove the duplicated rows, keeping the first occurrence of each
+    @return generator of rows
+    '''
+    seen = set()
+    for row in rows:
+        if row not in seen:
+            seen.add(row)
+            yield row
+
+
+def build(relation, keys):
+    '''Build phase of a hash join: index the rows of a relation by their key
+    @param relation: iterable of rows
+    @param keys: positions of the key columns
+    @return dict key -> list of rows
+    '''
+    get_key = key_getter(keys)
+    table = {}
+    for row in relation:
+        table.setdefault(get_key(row), []).append(row)
+    return table
+
+
+def probe(rows, table, keys, columns):
+    '''Probe phase of a hash join
+    @param rows: iterable of rows of the probing (left) side
+    @param table: dict built by build() on the right side
+    @param keys: positions of the key columns in the probing rows
+    @param columns: positions of the right rows to append to the left rows
+    @return generator of joined rows
+    '''
+    get_key = key_getter(keys)
+    for row in rows:
+        matches = table.get(get_key(row))
+        if matches:
+            for match in matches:
+                yield row + tuple(match[c] for c in columns)
+
+
+def hash_join(left, right, left_keys, right_keys, columns):
+    '''Equi-join of two relations on multi-column keys
+    @param left, right: iterables of tuples
+    @param left_keys, right_keys: positions of the join columns in each side
+    @param columns: positions of the right rows kept in the output
+    @return generator of left_row + selected columns of right_row
+    '''
+    if not left_keys:
+        return cartesian_product(left, right, columns)
+    return probe(left, build(right, right_keys), left_keys, columns)
+
+
+def cartesian_product(left, right, columns):
+    '''Cross product of two relations, used when atoms share no variables'''
+    right = [tuple(r[c] for c in columns) for r in right]
+    return (row + r for row in left for r in right)
+
+
+def select_different(rows, left, right):
+    '''Keep the rows in which two terms are different
+    @param left, right: couples (is_column, position or constant)
+    '''
+    (left_col, l), (right_col, r) = left, right
+    if not left_col and not right_col:
+        # Two constants (left by the removal of the equalities) : all or no rows
+        return iter(rows) if l != r else iter(())
+    if left_col and right_col:
+        return (row for row in rows if row[l] != row[r])
+    if left_col:
+        return (row for row in rows if row[l] != r)
+    return (row for row in rows if row[r] != l)
+
+
+def anti_join(left, right, left_keys, right_keys):
+    '''Hash anti-join : keep the rows of left without any matching row in right
+    @param left, right: iterables of tuples
+    @param left_keys, right_keys: positions of the join columns in each side
+    @return generator of the rows of left
+    '''
+    if not left_keys:
+        if any(True for _ in right):
+            return iter(())
+        return iter(left)
+    keys = set(map(key_getter(right_keys), right))
+    get_key = key_getter(left_keys)
+    return (row for row in left if get_key(row) not in keys)
+
+
+def index_join(rows, index, constants, keys, repeated, columns):
+    '''Join rows with a relation through one of its indexes
+    @param index: dict built on the relation (see build), keyed on the positions
+    of the constants of the atom followed by the positions of the join keys
+    @param constants: tuple of constants, first part of the index key
+    @param keys: positions of the probing rows forming the second part of the key
+    @param repeated: list of list of positions which must hold equal values in the
+    relation rows (variables repeated in the atom)
+    @param columns: positions of the relation rows appended to the output rows
+    @return generator of joined rows
+    '''
+    for row in rows:
+        matches = index.get(constants + tuple(row[k] for k in keys))
+        if matches:
+            for match in matches:
+                if all(match[i] == match[p[0]] for p in repeated for i in p[1:]):
+                    yield row + tuple(match[c] for c in columns)
+
+
+def index_anti_join(rows, index, constants, keys, repeated):
+    '''Anti-join through an index : keep the rows without any match in the relation
+    (same parameters as index_join)'''
+    for row in rows:
+        matches = index.get(constants + tuple(row[k] for k in keys))
+        if not matches or not any(all(match[i] == match[p[0]] for p in repeated for i in p[1:])
+                                  for match in matches):
+            yield row
+
+
+def to_number(value):
+    '''Return the number written by a value (a constant such as '42' or '-1.5',
+    quoted or not), or None if it is not a number
+    @return int, float or None
+    '''
+    text = str(value)
+    if len(text) > 1 and text[0] == text[-1] and text[0] in "'\"":
+        text = text[1:-1]
+    if not NUMBER.fullmatch(text):
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def order_key(value):
+    '''Key ordering values for min and max : numbers first, by value, then the
+    other values by their text'''
+    number = to_number(value)
+    return (0, number, "") if number is not None else (1, 0, str(value))
+
+
+def group_by(rows, keys, aggregates):
+    '''Hash group-by : one row per distinct value of the key columns, in which each
+    aggregated column holds the aggregate of its values over the rows of the group
+    @param rows: iterable of tuples
+    @param keys: positions of the grouping columns
+    @param aggregates: list of (function, position), function being 'count', 'sum',
+    'min' or 'max'. Counts and sums are returned as int or float, min and max as
+    the value found in the rows.
+    @return list of tuples, with the same columns as the rows
+    '''
+    get_key = key_getter(keys)
+    groups = {}  # key -> [a row of the group, accumulator of each aggregate]
+    for row in rows:
+        group = groups.get(get_key(row))
+        if group is None:
+            group = groups[get_key(row)] = [row] + [None] * len(aggregates)
+        for k, (function, position) in enumerate(aggregates, 1):
+            value, total = row[position], group[k]
+            if function == 'count':
+                group[k] = (total or 0) + 1
+            elif function == 'sum':
+                number = to_number(value)
+                if number is None:
+                    raise ValueError("sum of a value which is not a number : %s" % value)
+                group[k] = (total or 0) + number
+            elif total is None or (order_key(value) < order_key(total)) == (function == 'min'):
+                group[k] = value
+    result = []
+    for group in groups.values():
+        row = list(group[0])
+        for (_, position), total in zip(aggregates, group[1:]):
+            row[position] = total
+        result.append(tuple(row))
+    return result
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from .queries import Const, Clause, Rule
+from .store import ColumnStore, ConstantDictionary
+
+__all__ = ['evaluate_parallel']
+
+# Constant dictionary of a worker process, received once when the pool starts
+worker_dictionary = None
+
+
+def init_worker(constants):
+    global worker_dictionary
+    worker_dictionary = ConstantDictionary(constants)
+
+
+def evaluate_task(rules, component, recursive, relations):
+    '''Evaluate in a worker process the rules of a recursive component, or one rule
+    of a non-recursive one
+    @param relations: dict name -> Relation read by the rules
+    @return dict name -> Relation derived for each predicate of the component
+    '''
+    store = ColumnStore(worker_dictionary)
+    store.relations = relations
+    if recursive:
+        store.evaluate_component(rules, component, True)
+        return {p: store.relations[p] for p in component}
+    [r] = rules
+    return {r.head.predicate_name: store.evaluate_rule(r).unique()}
+
+
+def partition_rule(store, rule, partitions):
+    '''Split the evaluation of a rule in independent tasks : the atoms containing a
+    chosen variable are hash-partitioned on its value (the one covering the largest
+    relations is chosen), the other atoms are sent to every task. Each derivation of
+    the rule then happens in exactly one task.
+    @param store: ColumnStore holding the relations read by the rule
+    @param partitions: number of tasks
+    @return list of (rule, relations) : the rule, in which each clause of the body
+    reads its own relation "#i", and the relations of each task
+    '''
+    body = [Clause("#%d" % i, c.args, c.pos) if isinstance(c, Clause) else c
+            for i, c in enumerate(rule.body)]
+    relations = {"#%d" % i: store.get(c.predicate_name, c.arity)
+                 for i, c in enumerate(rule.body) if isinstance(c, Clause)}
+    renamed = Rule(rule.head, body)
+
+    sizes = {}  # number of rows partitioned for each candidate variable
+    positives = [i for i, c in enumerate(rule.body) if isinstance(c, Clause) and c.pos]
+    for i in positives:
+        for v in set(rule.body[i].get_vars()):
+            sizes[v] = sizes.get(v, 0) + len(relations["#%d" % i])
+    if partitions <= 1 or not sizes:
+        return [(renamed, relations)]
+    v = max(sizes, key=sizes.get)
+
+    tasks = [(renamed, dict(relations)) for _ in range(partitions)]
+    for i in positives:
+        c = rule.body[i]
+        if v in c.args:
+            relation = relations["#%d" % i]
+            keys = relation.columns[c.args.index(v)] % partitions
+            for k, (_, task_relations) in enumerate(tasks):
+                task_relations["#%d" % i] = relation.take(keys == k)
+    return tasks
+
+
+def get_tasks(strata):
+    '''Turn the components of a stratified plan into a DAG
+    @param strata: list of strata of (component, rules, recursive), as in PreparedQuery
+    @return (components, dependencies) : the list of (component, rules, recursive),
+    and for each of them the set of indexes of the components it reads
+    '''
+    components = [c for stratum in strata for c in stratum]
+    component_of = {p: k for k, (component, _, _) in enumerate(components) for p in component}
+    dependencies = []
+    for k, (_, rules, _) in enumerate(components):
+        dependencies.append(set(component_of[c.predicate_name] for r in rules for c in r.body
+                                if isinstance(c, Clause) and c.predicate_name in component_of)
+                            - {k})
+    return components, dependencies
+
+
+def evaluate_parallel(store, strata, workers=None, partitions=None):
+    '''Evaluate a stratified plan on a pool of processes : each rule of a non-recursive
+    component, and each recursive component, is a task run as soon as the components
+    it reads are evaluated. Relations are sent to the workers in the columnar encoding
+    (numpy arrays of codes), the constant dictionary once per worker. Components
+    with aggregates are evaluated in this process.
+    @param store: ColumnStore holding the facts, updated with the derived relations
+    @param strata: list of strata of (component, rules, recursive), as in PreparedQuery
+    @param workers: number of processes (by default, the number of processors)
+    @param partitions: if given, each rule of a non-recursive component is split in
+    this number of tasks, by hash-partitioning its joins (see partition_rule)
+    @return store
+    '''
+    # Encode the constants of the rules first, so that the workers never add codes
+    for stratum in strata:
+        for _, rules, _ in stratum:
+            for r in rules:
+                for c in [r.head] + list(r.body):
+                    for a in c.args:
+                        if isinstance(a, Const):
+                            store.dictionary.encode(a)
+
+    components, dependencies = get_tasks(strata)
+    dependents = [[] for _ in components]
+    for k, deps in enumerate(dependencies):
+        for d in deps:
+            dependents[d].append(k)
+    remaining = {}  # number of running tasks of each started component
+    futures = {}
+
+    with ProcessPoolExecutor(workers, initializer=init_worker,
+                             initargs=(list(store.dictionary),)) as pool:
+        def start(k):
+            component, rules, recursive = components[k]
+            if any(r.get_ir().aggregated for r in rules):
+                # Aggregates encode new constants (counts and sums) : evaluated here
+                store.evaluate_component(rules, component, recursive)
+                tasks = []
+            elif recursive or partitions is None:
+                needed = set(c.predicate_name for r in rules for c in r.body
+                             if isinstance(c, Clause))
+                if recursive:
+                    needed.update(component)
+                relations = {p: store.relations[p] for p in needed if p in store.relations}
+                tasks = [(rules, relations)] if recursive else [([r], relations) for r in rules]
+            else:
+                tasks = [([task_rule], relations) for r in rules
+                         for task_rule, relations in partition_rule(store, r, partitions)]
+            remaining[k] = len(tasks)
+            for task_rules, relations in tasks:
+                futures[pool.submit(evaluate_task, task_rules, component, recursive,
+                                    relations)] = k
+            if not tasks:
+                finish(k)
+
+        def finish(k):
+            for j in dependents[k]:
+                dependencies[j].discard(k)
+                if not dependencies[j]:
+                    start(j)
+
+        for k in [k for k, deps in enumerate(dependencies) if not deps]:
+            start(k)
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                k = futures.pop(future)
+                recursive = components[k][2]
+                for p, relation in future.result().items():
+                    if recursive:
+                        store.relations[p] = relation
+                    else:
+                        store.add(p, relation - store.get(p, relation.get_arity()))
+                remaining[k] -= 1
+                if not remaining[k]:
+                    finish(k)
+    return store
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+__all__ = ['RelationStatistics', 'JoinPlan', 'plan_joins']
+
+
+class RelationStatistics:
+    # Cardinality of a relation and number of distinct values in each column
+    def __init__(self, cardinality, distinct):
+        self.cardinality = cardinality
+        self.distinct = distinct
+
+    @classmethod
+    def from_rows(cls, rows, arity):
+        columns = [set() for _ in range(arity)]
+        for row in rows:
+            for values, v in zip(columns, row):
+                values.add(v)
+        return cls(len(rows), [len(values) for values in columns])
+
+    @classmethod
+    def from_columns(cls, columns, length):
+        return cls(length, [len(np.unique(c)) for c in columns])
+
+    def __repr__(self):
+        return "RelationStatistics(cardinality=%d, distinct=%s)" % (self.cardinality, self.distinct)
+
+
+class JoinPlan:
+    # Order in which the positive clauses of a rule are joined, with the
+    # estimated number of rows after each join
+    def __init__(self, clauses, order, estimates):
+        self.clauses = clauses
+        self.order = order
+        self.estimates = estimates
+
+    def get_order(self):
+        ''' Return the positive clauses in join order'''
+        return [self.clauses[i] for i in self.order]
+
+    def __repr__(self):
+        return " ⋈ ".join("%r [~%d rows]" % (self.clauses[i], round(e))
+                          for i, e in zip(self.order, self.estimates))
+
+
+def atom_estimates(constants, variables, statistics):
+    '''Estimate the number of rows of an atom after the selection of its constants
+    and repeated variables, and the number of distinct values of each of its variables
+    @param constants, variables: as returned by Clause.get_positions
+    @param statistics: RelationStatistics of the relation of the atom
+    @return (size, dict variable -> distinct values)
+    '''
+    size = float(statistics.cardinality)
+    for i, _ in constants:
+        size /= max(statistics.distinct[i], 1)
+    for positions in variables.values():
+        for i in positions[1:]:
+            size /= max(statistics.distinct[i], statistics.distinct[positions[0]], 1)
+    distinct = {v: min(float(statistics.distinct[p[0]]), size) for v, p in variables.items()}
+    return size, distinct
+
+
+def plan_joins(atoms):
+    '''Greedy join ordering : start with the smallest atom, then repeatedly join the
+    atom giving the smallest estimated result among the ones sharing a variable with
+    the previous ones (cartesian products come last)
+    @param atoms: list of (constants, variables, statistics) for each positive clause
+    @return (order, estimates): indices of the atoms in join order and estimated
+    number of rows after each join
+    '''
+    estimates = [atom_estimates(*a) for a in atoms]
+    remaining = list(range(len(atoms)))
+    bound = {}  # estimated number of distinct values of each bound variable
+    size = 1.0
+    order, sizes = [], []
+    while remaining:
+        best = None
+        for i in remaining:
+            atom_size, distinct = estimates[i]
+            shared = [v for v in distinct if v in bound]
+            joined = size * atom_size
+            for v in shared:
+                joined /= max(bound[v], distinct[v], 1)
+            key = (bool(bound) and not shared, joined)
+            if best is None or key < best[0]:
+                best = (key, i, joined)
+        _, i, size = best
+        for v, d in estimates[i][1].items():
+            bound[v] = min(bound.get(v, d), d)
+        for v in bound:
+            bound[v] = min(bound[v], size)
+        remaining.remove(i)
+        order.append(i)
+        sizes.append(size)
+    return order, sizes
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import pickle
+import tempfile
+from itertools import chain
+
+from .queries import Const, Rule, Program, Query, seminaive, is_recursive_component, distinct_rows
+from .operators import select
+from .database import Database
+from .query_parser import query_parser
+
+__all__ = ['PreparedQuery', 'prepare_query', 'prepare_query_file']
+
+# Changed whenever the content of a PreparedQuery changes (including the pickled
+# state of the rules and terms it holds), so that plans cached by an older
+# version are not reused
+PLAN_VERSION = 3
+
+
+class PreparedQuery:
+    # Query checked, rewritten and stratified once, which can then be executed
+    # against any number of databases. The plan (facts of the program and the
+    # rules of each component, in evaluation order) is never modified by an
+    # execution; join orders are still chosen on each execution, from the data.
+    def __init__(self, query, magic=None):
+        query.assert_evaluable()
+        self.query = query.query
+        self.rewritten = Query(Program([Rule(*r.get_remove_equalities())
+                                        for r in query.program.rules]), [], query.query)
+        if magic or (magic is None and any(isinstance(a, Const) for a in self.query.args)):
+            self.rewritten = self.rewritten.magic_sets()
+        self.predicate = self.rewritten.query.predicate_name
+
+        facts = {}
+        rules = {}
+        for r in self.rewritten.program.rules:
+            if r.body:
+                rules.setdefault(r.head.predicate_name, []).append(r)
+            else:
+                facts.setdefault(r.head.predicate_name, []).append(tuple(r.head.args))
+        self.facts = {name: tuple(rows) for name, rows in facts.items()}
+
+        dependencies = self.rewritten.program.get_dependencies()
+        self.strata = tuple(
+            tuple((tuple(component), tuple(r for p in component for r in rules.get(p, [])),
+                   is_recursive_component(component, dependencies))
+                  for component in stratum)
+            for stratum in self.rewritten.get_strata())
+
+        constants, variables = self.query.get_positions()
+        self.constants = tuple(constants)
+        self.variables = tuple(tuple(positions) for positions in variables.values())
+
+    def execute(self, db=None, unique=True, engine='tuple', workers=None, partitions=None):
+        '''Evaluate the query on a database (see Query.evaluate)
+        @param db: optional Database, ColumnStore or SQLiteStore holding facts in
+        addition to the ones of the program (it is not modified)
+        @param engine: 'tuple', 'columnar' or 'sqlite' (see Query.evaluate)
+        @param workers: if given, number of processes evaluating the independent
+        rules and components concurrently (see parallel.evaluate_parallel). The
+        relations are then encoded in columns : the columnar engine is used.
+        @param partitions: if given, the joins of each non-recursive rule are split in
+        this number of hash partitions evaluated in parallel (see parallel.partition_rule)
+        @return the rows of the query predicate matching the constants of the query
+        '''
+        if workers is not None or partitions is not None:
+            from .parallel import evaluate_parallel
+            engine = 'columnar'
+            db = evaluate_parallel(get_database(db, engine, self.facts), self.strata, workers,
+                                   partitions)
+        else:
+            db = get_database(db, engine, self.facts)
+            for stratum in self.strata:
+                for component, rules, recursive in stratum:
+                    db = evaluate_component(db, engine, component, rules, recursive)
+
+        if engine == 'sqlite':
+            ans = db.get_answer(self.predicate, unique, self.constants, self.variables)
+            db.release()
+            return ans
+        if engine == 'columnar':
+            return db.get_answer(self.predicate, unique, self.constants, self.variables)
+        ans = list(select(db.get(self.predicate, []), self.constants, self.variables))
+        if unique:
+            ans = distinct_rows(ans)
+        return ans
+
+    def iter_answers(self, db=None, limit=None, engine='tuple'):
+        '''Yield the distinct answers of the query (tuples of str) as they are derived,
+        in no particular order. The components the query predicate depends on are
+        evaluated first; if the query predicate is not recursive, its rules are then
+        evaluated lazily, so that stopping the iteration (or reaching limit) stops
+        the evaluation.
+        @param db, engine: as in execute
+        @param limit: optional maximum number of answers
+        @return generator of tuples
+        '''
+        if limit is not None and limit <= 0:
+            return
+        db = get_database(db, engine, self.facts)
+        *components, (component, rules, recursive) = [c for stratum in self.strata for c in stratum]
+        for c in components:
+            db = evaluate_component(db, engine, *c)
+
+        if engine in ('columnar', 'sqlite'):
+            # Relations are evaluated at once, the answer is deduplicated on the codes
+            # (or by the UNIQUE index of the table, which also reads only limit rows)
+            db = evaluate_component(db, engine, component, rules, recursive)
+            if engine == 'sqlite':
+                rows = db.get_answer(self.predicate, True, self.constants, self.variables, limit)
+                db.release()
+            else:
+                rows = db.get_answer(self.predicate, True, self.constants, self.variables)[:limit]
+            yield from (tuple(row) for row in rows)
+            return
+        if recursive:
+            rows = evaluate_component(db, engine, component, rules, recursive).get(self.predicate, [])
+        else:
+            rows = chain(db.get(self.predicate, []), *[r.iter_answer(db, distinct=True) for r in rules])
+
+        seen = set()
+        for row in select(rows, self.constants, self.variables):
+            row = tuple(row)
+            if row not in seen:
+                seen.add(row)
+                yield tuple(str(v) for v in row)
+                if len(seen) == limit:
+                    return
+
+    def explain(self, db=None, analyze=False, hooks=()):
+        '''Describe the evaluation plan, and measure it if analyze is true
+        (see explain.explain)
+        @return Explanation, printed as text or turned into a dict with to_dict
+        '''
+        from .explain import explain
+        return explain(self, db, analyze, hooks)
+
+    def __repr__(self):
+        return "PreparedQuery(" + self.rewritten.__repr__() + ")"
+
+
+def get_database(db, engine, facts, sources=None):
+    '''Return a new database holding the tables of db and the given facts
+    @param db: None, Database, ColumnStore or SQLiteStore (it is not modified)
+    @param engine: 'columnar' to return a ColumnStore, 'sqlite' to return an overlay
+    of a SQLiteStore (whose tables are dropped by its release method), otherwise a
+    Database
+    @param facts: dict name -> rows added to the table name
+    @param sources: optional dict name -> table of db the table name starts from
+    (by default, the table of db with the same name)
+    '''
+    from .store import ColumnStore
+    from .sql import SQLiteStore
+    sources = sources or {}
+    if engine == 'sqlite':
+        db = (db if isinstance(db, SQLiteStore) else SQLiteStore.from_db(db or {})).overlay()
+        for name, source in sources.items():
+            db.copy(name, source)
+        for name, rows in facts.items():
+            db.add_rows(name, rows)
+        return db
+    if isinstance(db, SQLiteStore):
+        db = Database(db.to_db())
+    if engine == 'columnar':
+        db = db.overlay() if isinstance(db, ColumnStore) else ColumnStore.from_db(db or {})
+        tables = db.relations
+    else:
+        if isinstance(db, ColumnStore):
+            db = Database(db.to_db())
+        db = db.overlay() if db is not None else Database()
+        tables = db
+    for name, source in sources.items():
+        if source in tables:
+            tables[name] = tables[source]
+        else:
+            tables.pop(name, None)
+    for name, rows in facts.items():
+        db.add_rows(name, rows)
+    return db
+
+
+def evaluate_component(db, engine, component, rules, recursive):
+    '''Evaluate the rules defining a strongly connected component
+    @return the database holding the derived tables'''
+    if engine in ('columnar', 'sqlite'):
+        return db.evaluate_component(rules, component, recursive)
+    if recursive:
+        return seminaive(rules, component, db)
+    for r in rules:
+        db = r.evaluate(db)
+    return db
+
+
+def prepare_query(text, magic=None, cache_dir=None):
+    '''Parse and prepare a query (see PreparedQuery)
+    @param text: program and query, as read by query_parser
+    @param cache_dir: optional directory where prepared queries are pickled, keyed by
+    a hash of the text and the options, so that they are only prepared once
+    @return PreparedQuery
+    '''
+    if cache_dir is None:
+        return PreparedQuery(query_parser(text), magic)
+
+    key = hashlib.sha256(("%d\0%r\0%s" % (PLAN_VERSION, magic, text)).encode('utf8'))
+    file_name = os.path.join(cache_dir, key.hexdigest() + ".plan")
+    try:
+        with open(file_name, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        # Missing, truncated or stale plan (pickled by another version of the
+        # classes it holds) : prepared again
+        pass
+
+    prepared = PreparedQuery(query_parser(text), magic)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=cache_dir)
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(prepared, f)
+    os.replace(tmp_name, file_name)
+    return prepared
+
+
+def prepare_query_file(file_name, magic=None, cache_dir=None):
+    '''Parse and prepare the query of a file (see prepare_query)'''
+    with open(file_name, encoding='utf8') as f:
+        return prepare_query(f.read(), magic, cache_dir)
@@ -1,11 +1,20 @@
 # -*- coding: utf-8 -*-
-import numpy as np
-from operator import xor
-from copy import copy
+import time
+import weakref
+
+from .operators import scan, project, deduplicate, hash_join, anti_join, \
+    select_different, index_join, index_anti_join, group_by
+from .database import Database
+from .planner import RelationStatistics, JoinPlan, plan_joins
+
+__all__ = ['Any', 'Var', 'Const', 'Aggregate', 'Equality', 'Different', 'Clause', 'Rule',
+           'Program', 'Query', 'union_find', 'get_repr_eq_classes', 'to_string']
 
 
 class Any:
     # unnamed variable
+    __slots__ = ()
+
     def __init__(self):
         return
 
@@ -14,9 +23,23 @@ class Any:
 
 
 class Var:
-    # named variable, with a field var_name with the variable name
-    def __init__(self, name):
-        self.name = name
+    # named variable, with a field var_name with the variable name.
+    # Variables are interned : Var(name) always returns the same object while it
+    # is used, so equality and hashing are by identity. The table holds weak
+    # references, so the terms no longer used are freed.
+    __slots__ = ('name', '__weakref__')
+    interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, name):
+        name = str(name)
+        var = cls.interned.get(name)
+        if var is None:
+            var = cls.interned[name] = object.__new__(cls)
+            var.name = name
+        return var
+
+    def __getnewargs__(self):
+        return (self.name,)
 
     def get_name(self):
         return self.name
@@ -24,20 +47,26 @@ class Var:
     def __repr__(self):
         return self.name
 
-    def __eq__(self, other):
-        return str(self) == str(other)
-
-    def __hash__(self):
-        return hash(self.name)
-
     def __str__(self):
         return str(self.name)
 
 
 class Const:
-    # Constants with a field const_name containing the name of the constant
-    def __init__(self, name):
-        self.name = name
+    # Constants with a field const_name containing the name of the constant.
+    # Constants are interned like variables (see Var).
+    __slots__ = ('name', '__weakref__')
+    interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, name):
+        name = str(name)
+        const = cls.interned.get(name)
+        if const is None:
+            const = cls.interned[name] = object.__new__(cls)
+            const.name = name
+        return const
+
+    def __getnewargs__(self):
+        return (self.name,)
 
     def get_name(self):
         return self.name
@@ -45,22 +74,33 @@ class Const:
     def __repr__(self):
         return self.name
 
-    def __eq__(self, other):
-        return str(self) == str(other)
-
-    def __hash__(self):
-        return hash(self.name)
-
     def __str__(self):
         return str(self.name)
 
 
+class Aggregate:
+    # Aggregate of the values of a term over the derivations of a rule body, in the
+    # head of a rule : function is 'count', 'sum', 'min' or 'max'. The other terms
+    # of the head group the derivations (see Rule.get_groups).
+    __slots__ = ('function', 'term')
+    functions = ('count', 'sum', 'min', 'max')
+
+    def __init__(self, function, term):
+        self.function = str(function)
+        self.term = term
+
+    def __repr__(self):
+        return self.function + "(" + self.term.__repr__() + ")"
+
+
 class Equality:
     # Equality between two terms left and right
+    __slots__ = ('left', 'right', 'args')
+
     def __init__(self, left, right):
         self.left = left
         self.right = right
-        self.args = [self.left, self.right]
+        self.args = (self.left, self.right)
 
     def get_left(self):
         return self.left
@@ -74,10 +114,12 @@ class Equality:
 
 class Different:
     # Specifies that two terms left and right must be different
+    __slots__ = ('left', 'right', 'args')
+
     def __init__(self, left, right):
         self.left = left
         self.right = right
-        self.args = [self.left, self.right]
+        self.args = (self.left, self.right)
 
     def get_left(self):
         return self.left
@@ -90,11 +132,13 @@ class Different:
 
 
 class Clause:
-    # Clause with a predicate name, the list of terms (args), and whether it is
+    # Clause with a predicate name, the tuple of terms (args), and whether it is
     # negated or not.
+    __slots__ = ('predicate_name', 'args', 'pos', 'arity')
+
     def __init__(self, name, args, positive):
         self.predicate_name = str(name)
-        self.args = args
+        self.args = tuple(args)
         self.pos = positive
         self.arity = len(self.args)
 
@@ -115,8 +159,22 @@ class Clause:
         for a in self.args:
             if isinstance(a, Var):
                 vars.append(a)
+            elif isinstance(a, Aggregate) and isinstance(a.term, Var):
+                vars.append(a.term)
         return vars
 
+    def get_positions(self):
+        '''Return the (position, constant) couples of the clause and a dict
+        containing the list of positions of each variable'''
+        constants = []
+        variables = {}
+        for i, a in enumerate(self.args):
+            if isinstance(a, Const):
+                constants.append((i, a))
+            elif isinstance(a, Var):
+                variables.setdefault(a, []).append(i)
+        return constants, variables
+
     def __repr__(self):
         if self.is_positive():
             neg = ""
@@ -127,10 +185,25 @@ class Clause:
 
 
 class Rule:
-    # Rule made with a head (positive) clause, and body of list of clauses
+    # Rule made with a head (positive) clause, and body of tuple of clauses.
+    # Rules are not modified in place (the body and the arguments of the clauses
+    # are tuples) : the head or the body are replaced, which drops the analysis of
+    # the rule and the functions compiled for it (see get_ir and get_compiled).
     def __init__(self, head, body):
         self.head = head
-        self.body = body
+        self.body = tuple(body)
+
+    def __getstate__(self):
+        # The analysis and the compiled functions are not pickled, they are
+        # computed again when needed
+        state = dict(self.__dict__)
+        state.pop('ir', None)
+        return state
+
+    @property
+    def compiled(self):
+        ''' Functions compiled for the rule, kept with its analysis'''
+        return self.get_ir().compiled
 
     def get_headvars(self):
         return set(self.head.get_vars())
@@ -150,213 +223,294 @@ class Rule:
         terms = [[el] for el in set([item for elem in terms for item in elem])]
         return terms
 
+    def get_ir(self):
+        ''' Return the normalized representation of the rule and its static analysis
+        (see analysis.RuleIR), computed once and kept until the head or the body of
+        the rule is replaced (they cannot be modified in place)'''
+        ir = getattr(self, 'ir', None)
+        if ir is None or ir.source[0] is not self.head or ir.source[1] is not self.body:
+            from .analysis import RuleIR
+            ir = self.ir = RuleIR(self)
+        return ir
+
     def is_rangerestricted(self):
         '''Check if the rule is range restricted /safe'''
-        # Check if all var in head are also in Body
-        return self.get_headvars() <= self.get_bodyvars() and \
-            all([any([isinstance(term, Const) for term in eq]) or len(eq.intersection(
-                self.get_var_in_positive_clauses())) for eq in self.get_eqclasses()])
-        # And Check if either in each eq classes, there is : 1 constant of 1 var contained in a positive clause
+        # Each equivalence class (of the terms of the head and the body) contains
+        # a constant, a variable of a positive clause, or is an _ of a positive clause
+        return self.get_ir().range_restricted
 
     def get_eqclasses(self):
         ''' Return all the equivalence classes in the rule'''
-        eq = self.get_body_terms() + [[arg] for arg in self.head.args]
-
-        for c in self.body:
-            if isinstance(c, Equality):
-                eq.append(set([c.left, c.right]))
-        return union_find(eq)
+        return [set(eq) for eq in self.get_ir().eq_classes]
 
     def create_eqclasses(self):
         self.eq_classes = self.get_eqclasses()
 
     def get_predicates(self):
         "Get the prediates from both head and body"
-        pred_list_body = []
-        pred_head = self.head.get_predicate()
-        for c in self.body:
-            if isinstance(c, Clause):
-                pred_list_body.append(c.get_predicate())
+        ir = self.get_ir()
+        return ir.predicate, list(ir.body_predicates)
 
-        return pred_head, pred_list_body
+    def get_negated_predicates(self):
+        "Get the predicates of the negated clauses of the body"
+        return list(self.get_ir().negated_predicates)
 
     def get_var_in_positive_clauses(self):
         ''' Get all the variables from all the positive clauses'''
-        var_pos_clauses = set()
-        for c in self.body:
-            if isinstance(c, Clause) and c.pos:
-                var_pos_clauses = var_pos_clauses.union(set(c.get_vars()))
-        return var_pos_clauses
+        return set(self.get_ir().positive_variables)
 
     def is_satisfiable(self):
-        '''Check if the rule is satisfiable '''
-        eq_cl = self.get_eqclasses()
-        for c in self.body:  # Check if negation creates conflicts with eq classes
-            if isinstance(c, Different):
-                for eq in eq_cl:
-                    if (c.left in eq) and (c.right in eq):
-                        return False
-
-        # Check if no 2 constants in the same eq class
-        for eq in eq_cl:
-            const_nb = 0
-            for term in eq:
-                if isinstance(term, Const):
-                    const_nb += 1
-            if const_nb > 1:
-                return False
-        return True
+        '''Check if the rule is satisfiable : no difference between two terms of the
+        same equivalence class, and no two constants in the same class'''
+        return self.get_ir().satisfiable
 
     def get_remove_equalities(self):
         ''' Remove all the equalities and replace the var by the representant of their equivalence classes'''
-        eq_cl = self.get_eqclasses()
-        repr_eq_classes = get_repr_eq_classes(eq_cl)
-
-        new_body = [Clause(cl.predicate_name, [repr_eq_classes[x] for x in cl.args], cl.pos)
-                    for cl in self.body if isinstance(cl, Clause)] + \
-            [Different(repr_eq_classes[diff.left], repr_eq_classes[diff.right])
-             for diff in self.body if isinstance(diff, Different)]
-
-        new_head = Clause(self.head.predicate_name, [
-                          repr_eq_classes[x] for x in self.head.args], self.head.pos)
-
-        return new_head, new_body
+        head, body = self.get_ir().get_normalized()
+        return head, list(body)
 
     def remove_equalities(self):
-        self.head, self.body = self.get_remove_equalities()
+        head, body = self.get_remove_equalities()
+        self.head, self.body = head, tuple(body)
 
     def get_predicate_namesarity(self):
         ''' Return a dict containing the arity of each predicate'''
-        predicate_namesarity = [(self.head.predicate_name, self.head.arity)]
-        for c in self.body:
-            if isinstance(c, Clause):
-                predicate_namesarity.append((c.predicate_name, c.arity))
-
-        return predicate_namesarity
+        return list(self.get_ir().arities)
 
     def check_no_negate_any(self):
         '''Check if a negation of any is stated in the rule :
         Return False if it is, True if not'''
+        return not self.get_ir().negates_any
+
+    def get_join_plan(self, db, delta=None):
+        ''' Choose the order in which the positive clauses are joined from the
+        statistics of the tables (see planner.plan_joins)
+        @param db : Database, ColumnStore or dict with data tables
+        @param delta : same as in get_answer
+        @return JoinPlan, the order being given as indexes of clauses in the body
+        '''
+        statistics = getattr(db, 'get_statistics', None) or Database(db).get_statistics
+        positives = [i for i, c in enumerate(self.body) if isinstance(c, Clause) and c.pos]
+        atoms = []
+        for i in positives:
+            c = self.body[i]
+            if delta is not None and delta[0] == i:
+                if isinstance(delta[1], list):
+                    stats = RelationStatistics.from_rows(delta[1], c.arity)
+                else:
+                    stats = RelationStatistics.from_columns(delta[1].columns, len(delta[1]))
+            else:
+                stats = statistics(c.predicate_name, c.arity)
+            atoms.append(c.get_positions() + (stats,))
+        order, estimates = plan_joins(atoms)
+        return JoinPlan(self.body, [positives[j] for j in order], estimates)
+
+    def get_live_variables(self, order):
+        ''' Return, for each step of a join order, the variables still needed after
+        this step : by the clauses joined later, the filters (differences and negated
+        clauses) and the head
+        @param order : indexes of the positive clauses of the body in join order
+        @return list of sets of variables
+        '''
+        needed = set(self.head.get_vars())
         for c in self.body:
-            if isinstance(c, Clause) and c.is_negative():
-                for arg in c.args:
-                    if isinstance(arg, Any):
-                        return False
-        return True
-
-    def evaluate(self, db):
+            if not (isinstance(c, Clause) and c.pos):
+                needed.update(a for a in c.args if isinstance(a, Var))
+        live = []
+        for i in reversed(order):
+            live.append(set(needed))
+            needed.update(self.body[i].get_vars())
+        return live[::-1]
+
+    def get_answer(self, db, delta=None, distinct=False, trace=None):
+        ''' Compute the answer of the rule with hash joins between the body atoms.
+        After each join, the rows are projected on the variables still needed.
+        @param db : dict with data tables
+        @param delta : optional couple (index of a body clause, table) to read this
+        clause from the given table instead of db
+        @param distinct : if true, duplicated rows are removed after each projection.
+        Otherwise the answer is a bag holding each row once per derivation.
+        @param trace : optional list to which (operator, rows, seconds) is appended
+        for each operator (the output of each operator is then materialized)
+        @return list of rows (tuples) of the head predicate
+        '''
+        return list(self.iter_answer(db, delta, distinct, trace))
+
+    def iter_answer(self, db, delta=None, distinct=False, trace=None):
+        ''' Same as get_answer, but yield the rows of the head predicate as the
+        pipeline of joins produces them : only the atoms joined against are
+        materialized, so stopping the iteration early saves the rest of the work.
+        Without trace, the rule is evaluated by the function compiled for its join
+        order (see get_compiled); with a trace, by the interpreted pipeline of
+        operators, in the same join order, whose output is measured operator by
+        operator (the compiled function fuses them and cannot be measured so).
+        '''
+        if self.get_ir().aggregated:
+            yield from self.get_groups(db, delta, trace)
+            return
+        if trace is None:
+            order = self.get_join_plan(db, delta).order
+            yield from self.get_compiled(order, distinct)(db, delta)
+            return
+
+        columns = {}  # position of each bound variable in the rows
+        rows = [()]
+
+        # Join the positive clauses in the order chosen by the planner, dropping
+        # the variables which are not used anymore after each join
+        start = time.perf_counter()
+        order = self.get_join_plan(db, delta).order
+        for i, live in zip(order, self.get_live_variables(order)):
+            method = self.get_join_method(db, delta, i, columns)
+            rows, columns = self.join_clause(db, delta, i, rows, columns)
+            if len(live) < len(columns):
+                kept = [v for v in columns if v in live]
+                rows = project(rows, [columns[v] for v in kept])
+                columns = {v: j for j, v in enumerate(kept)}
+                if distinct:
+                    rows = deduplicate(rows)
+            rows, start = trace_rows(trace, method + " " + repr(self.body[i]), rows, start)
+
+        # Filter with the differences and the negated clauses
+        for c in self.body:
+            if isinstance(c, Different):
+                rows = select_different(rows, *[(arg in columns, columns.get(arg, arg))
+                                                for arg in c.args])
+            elif isinstance(c, Clause) and c.is_negative():
+                # Hash anti-join against the (lower stratum) negated table
+                constants, variables = c.get_positions()
+                if isinstance(db, Database) and (constants or variables):
+                    index = db.get_index(c.predicate_name, tuple(
+                        [p for p, _ in constants] + [p[0] for p in variables.values()]))
+                    rows = index_anti_join(rows, index, tuple(const for _, const in constants),
+                                           [columns[v] for v in variables],
+                                           [p for p in variables.values() if len(p) > 1])
+                else:
+                    atom = scan(db.get(c.predicate_name, []),
+                                constants, list(variables.values()))
+                    rows = anti_join(rows, atom, [columns[v] for v in variables],
+                                     list(range(len(variables))))
+            else:
+                continue
+            rows, start = trace_rows(trace, "filter " + repr(c), rows, start)
+
+        # Build the head rows
+        head = [(True, columns[arg]) if isinstance(arg, Var) else (False, arg)
+                for arg in self.head.args]
+        rows = (tuple(row[v] if is_var else v for is_var, v in head) for row in rows)
+        if distinct:
+            rows = deduplicate(rows)
+        rows, start = trace_rows(trace, "head " + repr(self.head), rows, start)
+        yield from rows
+
+    def get_groups(self, db, delta=None, trace=None):
+        ''' Compute the answer of a rule whose head has aggregates : the derivations
+        of the body are grouped by the other terms of the head with a hash group-by
+        (see operators.group_by), each aggregate ranging over the derivations of its
+        group (one per distinct binding of the rows of the body atoms). Counts and
+        sums are numbers constants, such as '42'.
+        @param db, delta, trace : as in get_answer
+        @return list of rows (tuples) of the head predicate
+        '''
+        grouped = self.get_ir().get_grouped_rule()
+        rows = grouped.iter_answer(db, delta, False, trace)
+        start = time.perf_counter()
+        aggregates = [(a.function, i) for i, a in enumerate(self.head.args)
+                      if isinstance(a, Aggregate)]
+        rows = group_by(rows, [i for i, a in enumerate(self.head.args)
+                               if not isinstance(a, Aggregate)], aggregates)
+        numbers = [i for function, i in aggregates if function in ('count', 'sum')]
+        if numbers:
+            rows = [tuple(number_constant(v) if i in numbers else v for i, v in enumerate(row))
+                    for row in rows]
+        if trace is not None:
+            rows, start = trace_rows(trace, "group by " + repr(self.head), rows, start)
+        return rows
+
+    def get_compiled(self, order, distinct=False):
+        ''' Return the Python function generated for this rule and join order (see
+        compiler.compile_rule), compiled the first time it is asked for. The rule must
+        not contain equalities (see remove_equalities).
+        @param order : indexes of the positive clauses of the body in join order
+        @param distinct : as in get_answer
+        @return CompiledRule, called with (db, delta) as get_answer
+        '''
+        key = (tuple(order), distinct)
+        cache = self.get_ir().compiled
+        compiled = cache.get(key)
+        if compiled is None:
+            from .compiler import compile_rule
+            compiled = cache[key] = compile_rule(self, order, distinct)
+        return compiled
+
+    def get_join_method(self, db, delta, i, bound):
+        ''' Return how the i-th clause of the body (a positive clause) is joined with
+        rows binding the given variables : 'index join' (probing a cached index of
+        the Database), 'hash join', or 'scan' when it shares no variable with them
+        '''
+        constants, variables = self.body[i].get_positions()
+        shared = [v for v in variables if v in bound]
+        if (delta is None or delta[0] != i) and isinstance(db, Database) and \
+                (constants or shared):
+            return 'index join'
+        return 'hash join' if shared else 'scan'
+
+    def join_clause(self, db, delta, i, rows, columns):
+        ''' Join the rows with the i-th clause of the body (a positive clause)
+        @param rows : iterable of rows, columns : position of each variable in them
+        @return (joined rows, position of each variable in the joined rows)
+        '''
+        c = self.body[i]
+        constants, variables = c.get_positions()
+        atom_vars = list(variables.keys())
+        shared = [j for j, v in enumerate(atom_vars) if v in columns]
+        new = [j for j, v in enumerate(atom_vars) if v not in columns]
+        if self.get_join_method(db, delta, i, columns) == 'index join':
+            # Constant selection and join probe through a cached index
+            index = db.get_index(c.predicate_name, tuple(
+                [p for p, _ in constants] + [variables[atom_vars[j]][0] for j in shared]))
+            rows = index_join(rows, index, tuple(const for _, const in constants),
+                              [columns[atom_vars[j]] for j in shared],
+                              [p for p in variables.values() if len(p) > 1],
+                              [variables[atom_vars[j]][0] for j in new])
+        else:
+            if delta is not None and delta[0] == i:
+                relation = delta[1]
+            else:
+                relation = db.get(c.predicate_name, [])
+            atom = list(scan(relation, constants, list(variables.values())))
+            rows = hash_join(rows, atom, [columns[atom_vars[j]] for j in shared],
+                             shared, new)
+        for j in new:
+            columns[atom_vars[j]] = len(columns)
+        return rows, columns
+
+    def evaluate(self, db, distinct=True, trace=None):
         ''' Evaluate rule
-        @param db : dict with data tables 
-        @return db : same dict as input, with rule answer added as a new table
+        @param db : dict with data tables
+        @param distinct : if true (set semantics), only the rows which are not already
+        in the table of the head are added, once each. Otherwise every derivation
+        of a row adds it (bag semantics).
+        @param trace : optional list receiving the measures of the operators (see get_answer)
+        @return db : same dict as input, with rule answer added to the table of the head
+        (the table is replaced by a new list, tables are never modified in place)
         '''
-        tmp_dict_values = {}  # tmp tables in order to be able to modify data
-        var_pred = {}  # position of variables in body
-        diff = []
-
-        # First loop which deals with constants and different, and stores Variable locations
-        for pred in self.body:
-            if isinstance(pred, Clause):
-                tmp_dict_values[pred.predicate_name] = copy(
-                    db[pred.predicate_name])
-                i = 0
-                for arg in pred.args:
-                    if isinstance(arg, Const):
-                        [tmp_dict_values[pred.predicate_name].pop(j) for j in range(len(
-                            tmp_dict_values[pred.predicate_name])-1, -1, -1) if xor(tmp_dict_values[pred.predicate_name][j][i] == arg, pred.pos)]
-                        #  Remove elements not satisfying condition with constants
-                    else:
-                        var_pred.setdefault(arg, []).extend(
-                            [[pred.predicate_name, i, pred.pos]])
-                        # Store each pos/name/positivity of each Variable
-                    i += 1
-
-            elif isinstance(pred, Different):
-                diff.append(pred.args)
-
-        # Replace the different var negative with the negation of the other one
-        for d in diff:
-            if isinstance(d[0], Var) and isinstance(d[1], Var):
-                for var in var_pred.keys():
-                    if var == d[1]:
-                        new_diff_vars = [[old[0], old[1], not old[2]]
-                                         for old in var_pred[d[1]]]
-                        var_pred[d[0]].extend(new_diff_vars)
-                        del var_pred[d[1]]
-            elif isinstance(d[0], Const) and isinstance(d[1], Const):
-                raise Exception(
-                    "Different of Two constant is not allowed")
-
-            # Evaluate constant within different objects
+        name = self.head.predicate_name
+        if distinct:
+            if isinstance(db, Database):
+                # Index on all the columns : its keys are the rows of the table
+                known = db.get_index(name, tuple(range(self.head.arity)))
             else:
-                if isinstance(d[0], Const):
-                    var = d[1]
-                    constant = d[0]
-                else:
-                    var = d[0]
-                    constant = d[1]
-
-                [[[tmp_dict_values[pred.predicate_name].pop(j) for j in range(len(tmp_dict_values[pred.predicate_name])-1, -1, -1) if xor(
-                    tmp_dict_values[pred.predicate_name][j][i] != constant, pred.pos)] for i in range(len(pred.args)) if pred.args[i] == var] for pred in self.body if isinstance(pred, Clause)]
-
-        #  Joins using previously stored information
-        join_repr = {}
-        join_index = {}
-        for var in var_pred.keys():
-            # if var appears once, do nothing/ keep everything
-            if not len(var_pred[var]) <= 1:
-
-                pred0, i0, pos0 = var_pred[var][0]
-                if pred0 in join_repr.keys():
-                    i0 += join_index[pred0]
-                    pred0 = join_repr[pred0]
-                for l in var_pred[var][1:]:
-                    pred1, i1, pos1 = l
-
-                    if pred1 in join_repr.keys():
-                        i1 += join_index[pred1]
-                        pred1 = join_repr[pred1]
-
-                    # Actual Join
-                    new_table = []
-                    for i in range(len(tmp_dict_values[pred0])-1, -1, -1):
-                        for j in range(len(tmp_dict_values[pred1])-1, -1, -1):
-                            if (tmp_dict_values[pred0][i][i0] == tmp_dict_values[pred1][j][i1]):
-                                if pred0 == pred1:
-                                    new_table.append(tmp_dict_values[pred0][i])
-                                else:
-                                    new_row = copy(tmp_dict_values[pred0][i])
-                                    new_row.extend(tmp_dict_values[pred1][j])
-                                    new_table.append(new_row)
-
-                    # Put the representant (the joined table) of the second as the first table
-                    if pred0 != pred1:
-                        join_repr[pred1] = pred0
-                        join_index[pred1] = len(
-                            tmp_dict_values[pred0][0])
-
-                    tmp_dict_values[pred0] = new_table
-
-        # Answer the query
-        rule_answer_tmp = []
-        for v in self.head.get_vars():
-            table = tmp_dict_values[var_pred[v][0][0]]
-            rule_answer_tmp.append(
-                [table[i][var_pred[v][0][1]] for i in range(len(table))])
-
-        # Reshape answer
-        rule_answer = []
-        for i in range(len(rule_answer_tmp[0])):
-            row = []
-            for j in range(len(rule_answer_tmp)):
-                row.append(rule_answer_tmp[j][i])
-            rule_answer.append(row)
-
-        db[self.head.predicate_name] = rule_answer
-
+                known = set(db.get(name, []))
+            new = [row for row in self.iter_answer(db, distinct=True, trace=trace)
+                   if row not in known]
+        else:
+            new = self.get_answer(db, trace=trace)
+        db[name] = db.get(name, []) + new
         return db
 
     def __repr__(self):
-        if self.body == []:
+        if not self.body:
             r = self.head.__repr__()
         else:
             r = self.head.__repr__() + u" ← " + " ".join(
@@ -371,12 +525,7 @@ class Program:
 
     def is_CQ(self):
         ''' Check if program is CQ'''
-        for rule in self.rules:
-            for clause in rule.body:
-                if isinstance(clause, Equality) or isinstance(clause, Different):
-                    return False
-
-        return True
+        return all(rule.get_ir().conjunctive for rule in self.rules)
 
     def is_rangerestricted(self):
         '''Check if the program is range restricted /safe'''
@@ -386,6 +535,14 @@ class Program:
 
         return True
 
+    def get_predicate_arities(self):
+        '''Return a dict containing the arity of each predicate (as first stated)'''
+        predicate_arity = dict()
+        for r in self.rules:
+            for name, arity in r.get_predicate_namesarity():
+                predicate_arity.setdefault(name, arity)
+        return predicate_arity
+
     def check_predicate_arity(self):
         '''Check if the arity of each predicate does not change'''
         predicate_arity = dict()
@@ -406,8 +563,36 @@ class Program:
                 return False
         return True
 
+    def get_dependencies(self):
+        '''Return the dependency graph of the program as a dict
+        predicate -> list of the predicates in the body of its rules'''
+        dependencies = {}
+        for r in self.rules:
+            head_pred, body_pred = r.get_predicates()
+            dependencies.setdefault(head_pred, []).extend(body_pred)
+            [dependencies.setdefault(p, []) for p in body_pred]
+        return dependencies
+
+    def get_negative_dependencies(self):
+        '''Return the set of edges (head predicate, negated predicate) of the dependency graph'''
+        return set((r.head.get_predicate(), p) for r in self.rules
+                   for p in r.get_negated_predicates())
+
+    def get_aggregate_dependencies(self):
+        '''Return the set of edges (head predicate, body predicate) of the rules with
+        aggregates : as negation, an aggregate needs the predicates it reads evaluated'''
+        return set((r.head.get_predicate(), p) for r in self.rules
+                   if r.get_ir().aggregated for p in r.get_ir().body_predicates)
+
+    def has_aggregates(self):
+        '''Check if the head of a rule of the program has aggregates'''
+        return any(r.get_ir().aggregated for r in self.rules)
+
     def is_recursive(self):
-        pass
+        '''Check if a predicate of the program depends on itself'''
+        dependencies = self.get_dependencies()
+        return any(is_recursive_component(c, dependencies)
+                   for c in strongly_connected_components(dependencies, list(dependencies)))
 
     def is_satisfiable(self):
         '''Check if the program is satisfiable '''
@@ -464,11 +649,7 @@ class Query:
     def get_sorted_predicate(self):
         ''' Sort the rules/predicates in order to solve the query'''
         # Create dependencies graph
-        dependencies = {}
-        for r in self.program.rules:
-            head_pred, body_pred = r.get_predicates()
-            dependencies.setdefault(head_pred, []).extend(body_pred)
-            [dependencies.setdefault(p, []) for p in body_pred]
+        dependencies = self.program.get_dependencies()
         # Init the states
         states = {p: 'white' for p in dependencies}
         start = self.query.get_predicate()
@@ -492,74 +673,237 @@ class Query:
         predicate_sorted = sort_graph(dependencies, states, start, [])
         return predicate_sorted
 
+    def get_components(self):
+        ''' Return the strongly connected components of the dependency graph needed
+        to answer the query, each component appearing after the ones it depends on'''
+        dependencies = self.program.get_dependencies()
+        start = self.query.get_predicate()
+        dependencies.setdefault(start, [])
+        return strongly_connected_components(dependencies, [start])
+
+    def get_strata(self):
+        ''' Stratify the components needed to answer the query : a predicate is in a
+        strictly higher stratum than the predicates it depends on negatively or
+        through an aggregate
+        @return list of strata, each stratum being a list of components
+        '''
+        dependencies = self.program.get_dependencies()
+        negative = self.program.get_negative_dependencies() | \
+            self.program.get_aggregate_dependencies()
+        level = {}
+        strata = []
+        for component in self.get_components():
+            stratum = 0
+            for p in component:
+                for d in dependencies[p]:
+                    if d in component:
+                        if (p, d) in negative:
+                            raise Exception("The Query is not stratifiable")
+                    else:
+                        stratum = max(stratum, level[d] + ((p, d) in negative))
+            for p in component:
+                level[p] = stratum
+            while len(strata) <= stratum:
+                strata.append([])
+            strata[stratum].append(component)
+        return strata
+
     def sort_rules(self):
         pred_sorted = self.get_sorted_predicate()
         self.program.rules = [
             rule for pred in pred_sorted for rule in self.program.rules if pred == rule.head.get_predicate()]
 
-    def get_data(self):
-        '''Get data of a query as a dict (The query has to be sorted)
-        @return db: dict containing tables from query
-        @return idx_end : last rule containing data
+    def get_data(self, db=None):
+        '''Get data of a query as a Database
+        @param db: optional Database the facts of the query are added to (db itself
+        is not modified, its tables and indexes are shared with the result)
+        @return db: Database containing tables from query
+        @return idx_end : number of facts (first rule with a body if the query is sorted)
         '''
         idx_end = 0
-        db = {}
+        facts = {}
         for r in self.program.rules:
             if not r.body:
-                db.setdefault(r.head.predicate_name, []).extend([r.head.args])
+                facts.setdefault(r.head.predicate_name, []).append(
+                    tuple(r.head.args))
                 idx_end += 1
-            else:
-                break
 
+        db = db.overlay() if db is not None else Database()
+        for name, rows in facts.items():
+            db.add_rows(name, rows)
         return db, idx_end
 
-    def evaluate(self, unique=True):
-        '''Evalute the Query
-        @param unique: if true return only unique answers
-        '''
-        # Assertion of evaluation possibility
+    def assert_evaluable(self):
+        '''Assert that the query can be evaluated'''
         assert self.is_satisfiable(), "Query is not satisfiable"
         assert self.check_predicate_arity(
         ), "Arity of a predicate is not constant everywhere in the query "
         assert self.check_no_negate_any(), "A negation of any can't been found"
         assert self.is_rangerestricted(), "The Query is not safe"
 
-        # Prepare the query to be evaluated
-        self.remove_equalities()
-        self.sort_rules()
-
-        # Retrieving data
-        db, idx_rule_start = self.get_data()
+    def magic_sets(self):
+        '''Return the magic-sets rewriting of the query (see magic.magic_rewrite)
+        The query must not contain equalities anymore.'''
+        from .magic import magic_rewrite
+        return magic_rewrite(self)
 
-        # Evaluate each rule
-        for r in self.program.rules[idx_rule_start:]:
-            db = r.evaluate(db)
+    def evaluate(self, unique=True, engine='tuple', db=None, magic=None, workers=None,
+                 partitions=None):
+        '''Evalute the Query
+        @param unique: if true return only unique answers
+        @param engine: 'tuple' to evaluate on python tuples, 'columnar' to evaluate
+        with vectorized operations on a dictionary-encoded store (see store.ColumnStore),
+        'sqlite' to translate the rules to SQL run by SQLite (see sql.SQLiteStore)
+        @param db: optional Database, ColumnStore (e.g. an opened snapshot) or
+        SQLiteStore (e.g. a file of facts) holding facts in addition to the ones of
+        the program. It is not modified, and the
+        indexes built on its tables are kept for the next evaluations.
+        @param magic: if true, evaluate the magic-sets rewriting of the query. By
+        default, the query is rewritten if it has constant arguments.
+        @param workers: if given, evaluate the rules which do not depend on each other
+        concurrently, on this number of processes (with the columnar engine)
+        @param partitions: if given, also split the joins of each non-recursive rule in
+        this number of hash partitions evaluated in parallel
+        @return the rows of the query predicate matching the constants of the query
+        '''
+        return self.prepare(magic).execute(db, unique, engine, workers, partitions)
+
+    def iter_answers(self, limit=None, engine='tuple', db=None, magic=None):
+        '''Yield the distinct answers of the query as they are derived, without
+        materializing and sorting the whole answer (see PreparedQuery.iter_answers)
+        @param limit: optional maximum number of answers
+        @param engine, db, magic: as in evaluate
+        @return generator of tuples of str
+        '''
+        return self.prepare(magic).iter_answers(db, limit, engine)
+
+    def explain(self, analyze=False, db=None, magic=None, hooks=()):
+        '''Describe how the query is evaluated (EXPLAIN), or evaluate it and measure
+        each component, rule and operator (EXPLAIN ANALYZE)
+        @param analyze: if true, evaluate the query with the tuple engine and record
+        the time, rows and peak intermediate size of each operator. The rules are
+        then run by the interpreted pipeline of operators instead of their compiled
+        functions : the rows are the ones of a normal evaluation, the times are the
+        ones of the interpreter
+        @param db, magic: as in evaluate
+        @param hooks: callables receiving the dict describing each component
+        @return Explanation (see explain.Explanation)
+        '''
+        return self.prepare(magic).explain(db, analyze, hooks)
 
-        # Answer the query
-        # TODO deal with constant term in query
-        ans = db[self.query.predicate_name]
-        if unique:
-            ans = [list(d) for d in np.unique(to_string(ans), axis=0)]
-        return ans
+    def prepare(self, magic=None):
+        '''Check, rewrite and stratify the query once (see prepared.PreparedQuery)
+        The query itself is not modified.
+        @param magic: as in evaluate
+        @return PreparedQuery, to be executed on any number of databases
+        '''
+        from .prepared import PreparedQuery
+        return PreparedQuery(self, magic)
 
     def __repr__(self):
         return self.program.__repr__() + "\n? " + self.query.__repr__()
 
 
 def union_find(lis):
-    '''Perform union find'''
-    lis = map(set, lis)
-    unions = []
+    '''Perform union find : merge the overlapping sets of lis
+    @return list of disjoint sets'''
+    from .analysis import DisjointSet
+    classes = DisjointSet()
     for item in lis:
-        temp = []
-        for s in unions:
-            if not s.isdisjoint(item):
-                item = s.union(item)
+        item = list(item)
+        for term in item:
+            classes.union(item[0], term)
+    return classes.get_sets()
+
+
+def strongly_connected_components(graph, starts):
+    '''Tarjan's algorithm (iterative version)
+    @param graph: dict node -> list of successors
+    @param starts: nodes from which the graph is explored
+    @return list of components (list of nodes), each component appearing after
+    all the components reachable from it
+    '''
+    index, low = {}, {}
+    stack, on_stack = [], set()
+    components = []
+    for start in starts:
+        if start in index:
+            continue
+        index[start] = low[start] = len(index)
+        stack.append(start)
+        on_stack.add(start)
+        work = [(start, iter(graph[start]))]
+        while work:
+            node, successors = work[-1]
+            for succ in successors:
+                if succ not in index:
+                    index[succ] = low[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(graph[succ])))
+                    break
+                elif succ in on_stack:
+                    low[node] = min(low[node], index[succ])
             else:
-                temp.append(s)
-        temp.append(item)
-        unions = temp
-    return unions
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        p = stack.pop()
+                        on_stack.discard(p)
+                        component.append(p)
+                        if p == node:
+                            break
+                    components.append(component)
+    return components
+
+
+def seminaive(rules, component, db, delta=None, traces=None, known=None):
+    '''Evaluate recursive rules until fixpoint, each round only joining
+    the tuples derived in the previous one
+    @param rules: rules defining the predicates of the component
+    @param component: list of mutually recursive predicates
+    @param db: dict with data tables, updated with the derived tables
+    @param delta: optional dict predicate -> new rows to start the iteration from
+    (by default, the first round evaluates all the rules)
+    @param traces: optional dict rule -> list receiving the measures of its operators
+    (see Rule.get_answer)
+    @param known: optional dict predicate -> set of the rows of its table, updated
+    with the derived rows. The tables of db are then extended in place instead of
+    being copied.
+    '''
+    traces = traces or {}
+    if known is None:
+        for p in component:
+            db[p] = list(db.get(p, []))
+        known = {p: set(db[p]) for p in component}
+    if delta is None:
+        delta = {p: [] for p in component}
+        for r in rules:
+            delta[r.head.predicate_name].extend(r.get_answer(db, None, True, traces.get(r)))
+    delta = {p: list(delta.get(p, [])) for p in component}
+    while True:
+        for p in component:
+            delta[p] = list(set(delta[p]) - known[p])
+            known[p].update(delta[p])
+            db[p].extend(delta[p])
+        if not any(delta.values()):
+            return db
+        new_delta = {p: [] for p in component}
+        for r in rules:
+            for i, c in enumerate(r.body):
+                if isinstance(c, Clause) and c.pos and c.predicate_name in known:
+                    new_delta[r.head.predicate_name].extend(
+                        r.get_answer(db, (i, delta[c.predicate_name]), True, traces.get(r)))
+        delta = new_delta
+
+
+def is_recursive_component(component, graph):
+    '''Check if a strongly connected component contains a cycle'''
+    return len(component) > 1 or component[0] in graph[component[0]]
 
 
 def get_repr_eq_classes(eq_classes):
@@ -577,16 +921,36 @@ def get_repr_eq_classes(eq_classes):
             repr.append(list(eq_classes[i])[0])
 
         for term in eq_classes[i]:
-            dict_repr[str(term)] = repr[i]
+            dict_repr[term] = repr[i]
 
     return dict_repr
 
 
+def number_constant(number):
+    ''' Return the constant writing a number, quoted as numbers read from files
+    (see loader.to_constant)'''
+    return Const("'%s'" % number)
+
+
+def trace_rows(trace, operator, rows, start):
+    ''' Materialize the output of an operator and append (operator, number of rows,
+    seconds since start) to trace
+    @return (list of rows, end time)
+    '''
+    rows = list(rows)
+    end = time.perf_counter()
+    trace.append((operator, len(rows), end - start))
+    return rows, end
+
+
+def distinct_rows(rows):
+    ''' Remove the duplicated rows (hashing the constants), and return the rows
+    as sorted lists of str'''
+    return sorted([str(v) for v in row] for row in set(map(tuple, rows)))
+
+
 def to_string(list_of_list):
-    ''' Takes a list of list as input and return the same 
+    ''' Takes a list of rows as input and return a new
     list of list with each value to str(value)
     '''
-    for i in range(len(list_of_list)):
-        for j in range(len(list_of_list[i])):
-            list_of_list[i][j] = str(list_of_list[i][j])
-    return list_of_list
+    return [[str(v) for v in row] for row in list_of_list]
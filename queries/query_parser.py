@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
+import re
 
 from lark import Lark, Transformer
 
 from . import queries
 
+__all__ = ['grammar', 'BuildQuery', 'query_parser', 'program_parser', 'statements_parser',
+           'parse_stream', 'program_parse_stream', 'query_parse_stream',
+           'program_parse_file', 'query_parse_file']
+
 grammar = r"""
 NEG:  "~" | "¬" | "!"
 IMPL: "<-" | "<=" | "←" | ":-"
@@ -19,13 +24,16 @@ NEQ: "<>" | "~=" | "!=" | "≠"
 
 query: program the_query
 
-program: rule          -> one_rule_program
-       | rule program  -> rec_program
+program: rule+
+
+statements: (rule | the_query)*
 
 rule: head IMPL body DOT -> act_rule
     | head DOT           -> fact
 
-head: pred "(" args ")"
+head: pred "(" hargs ")"
+
+atom: pred "(" args ")" -> head
 
 ?pred: VAR
 | NAME
@@ -37,16 +45,20 @@ term: VAR -> t_var
 tterm: VAR -> t_var
 | NAME     -> t_name
 
-?args:              -> empty_arg
+?args:              -> empty_args
 | nargs
 
-nargs: term      -> one_arg
-| term "," nargs -> args_term
-| term nargs     -> args_term
+nargs: term (","? term)*
+
+?hargs:             -> empty_args
+| nhargs
+
+nhargs: hterm (","? hterm)* -> nargs
 
-body:              -> empty_body
-| clause "," body  -> clause_body
-| clause body      -> clause_body
+?hterm: term
+| NAME "(" VAR ")" -> t_aggregate
+
+body: (clause ","?)*
 
 clause: tterm "=" tterm  -> eq_clause
 | NEG tterm "=" tterm    -> neq_clause1
@@ -54,8 +66,8 @@ clause: tterm "=" tterm  -> eq_clause
 | NEG pred "(" args ")"  -> neg_clause
 | pred "(" args ")"      -> pos_clause
 
-the_query: ASK head DOT ->the_query_dot
-| ASK head -> the_query
+the_query: ASK atom DOT ->the_query_dot
+| ASK atom -> the_query
 
 %import common.WS
 %ignore WS
@@ -68,12 +80,11 @@ class BuildQuery(Transformer):
         [program, theQuery] = ch
         return queries.Query(program, [], theQuery)
 
-    def one_rule_program(self, rule):
-        return queries.Program(rule)
+    def program(self, rules):
+        return queries.Program(rules)
 
-    def rec_program(self, ch):
-        [rule, program] = ch
-        return queries.Program([rule] + program.rules)
+    def statements(self, ch):
+        return ch
 
     def act_rule(self, ch):
         [head, _, body, _] = ch
@@ -91,16 +102,11 @@ class BuildQuery(Transformer):
         [n] = v
         return n
 
-    def empty_args(self):
+    def empty_args(self, _):
         return []
 
-    def one_arg(self, ch):
-        [t] = ch
-        return [t]
-
-    def args_term(self, ch):
-        [t, args] = ch
-        return [t] + args
+    def nargs(self, terms):
+        return terms
 
     def t_var(self, ch):
         [x] = ch
@@ -113,12 +119,15 @@ class BuildQuery(Transformer):
     def t_any(self, ch):
         return queries.Any()
 
-    def empty_body(self, _):
-        return []
+    def t_aggregate(self, ch):
+        [function, x] = ch
+        if function not in queries.Aggregate.functions:
+            raise ValueError("Unknown aggregate %s (expected one of %s)" % (
+                function, ", ".join(queries.Aggregate.functions)))
+        return queries.Aggregate(function, queries.Var(x))
 
-    def clause_body(self, ch):
-        [clause, body] = ch
-        return [clause] + body
+    def body(self, clauses):
+        return clauses
 
     def eq_clause(self, ch):
         [left, right] = ch
@@ -159,16 +168,75 @@ program_parser = Lark(grammar,
                       transformer=BuildQuery()).parse
 
 
+statements_parser = Lark(grammar,
+                         start='statements',
+                         parser='lalr',
+                         transformer=BuildQuery()).parse
+
+# A complete statement : anything but quotes and dots, or quoted names, up to a dot.
+# The quoted names are the tokens the lexer reads for NAME : its regex tries
+# [^'] before \\\', so a backslash is read alone and a quoted name always ends at
+# the next quote. They are matched the same way here (and a name has a single
+# way to match), so a statement never ends at a dot the parser reads in a name.
+STATEMENT = re.compile(r"""(?:[^.'"]|'[^']+'|"[^"]+")*\.""")
+
+
+def parse_stream(f, chunk_size=1 << 16):
+    """Parse a program (and its query) read from a file handle one chunk at a time.
+    Each chunk is cut after its last complete statement and parsed without building
+    a parse tree, so time and memory are linear in the size of the input.
+    Yield the queries.Rule objects in order, then the query clause if there is one."""
+    buffer = ""
+    for chunk in iter(lambda: f.read(chunk_size), ""):
+        buffer += chunk
+        end = 0
+        match = STATEMENT.match(buffer)
+        while match is not None:
+            end = match.end()
+            match = STATEMENT.match(buffer, end)
+        if end:
+            yield from statements_parser(buffer[:end])
+            buffer = buffer[end:]
+    if buffer.strip():
+        yield from statements_parser(buffer)
+
+
+def program_parse_stream(f):
+    """Parse a program read from a file handle (see parse_stream) and return a queries.Program object."""
+    rules = []
+    for statement in parse_stream(f):
+        if not isinstance(statement, queries.Rule):
+            raise Exception("Unexpected query in a program : %s" % statement)
+        rules.append(statement)
+    return queries.Program(rules)
+
+
+def query_parse_stream(f):
+    """Parse a program and its query read from a file handle (see parse_stream) and return a queries.Query object."""
+    rules = []
+    query = None
+    for statement in parse_stream(f):
+        if query is not None:
+            raise Exception("The query must be the last statement, found %s after it" % statement)
+        if isinstance(statement, queries.Rule):
+            rules.append(statement)
+        else:
+            query = statement
+    if query is None:
+        raise Exception("No query found")
+    return queries.Query(queries.Program(rules), [], query)
+
+
 def program_parse_file(file_name):
     """Function helper that parses a file containing a program and return a queries.Program object."""
     with open(file_name,encoding='utf8') as f:
-        return program_parser(f.read())
+        return program_parse_stream(f)
 
 
 def query_parse_file(file_name):
     """Function helper that parses a file containing a program and return a queries.Query object."""
     with open(file_name,encoding='utf8') as f:
-        return query_parser(f.read())
+        return query_parse_stream(f)
 
 if __name__ == 'main':
     print(query_parse_file("../example.query"))
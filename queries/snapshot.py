@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import json
+import struct
+
+import numpy as np
+
+from .queries import Const
+from .store import ConstantDictionary, ColumnStore, Relation
+
+__all__ = ['save_snapshot', 'open_snapshot']
+
+# File layout : MAGIC, offset and length of the json header (2 little-endian
+# uint64), then the sections, each starting on an ALIGN bytes boundary : the
+# offsets (uint64) and utf8 text of the constants of the dictionary, their codes
+# in the order of their text (int64), then one int64 array of codes per column of
+# each relation. The header is written last.
+MAGIC = b"QSNAP\x00\x00\x02"
+PREFIX = struct.Struct("<8sQQ")
+ALIGN = 64
+FILE_DTYPE = np.dtype("<i8")
+
+
+class SnapshotDictionary(ConstantDictionary):
+    # Read-only dictionary of a snapshot, reading the mapped file : a constant is
+    # only decoded when its code is, and looked up by binary search on the codes
+    # sorted by text. New constants are encoded by a DictionaryOverlay (see
+    # ColumnStore.overlay).
+    def __init__(self, offsets, text, order):
+        self.offsets = offsets
+        self.text = text
+        self.order = order
+        self.decoded = {}  # code -> constant, for the codes decoded so far
+
+    def get_text(self, code):
+        return self.text[int(self.offsets[code]):int(self.offsets[code + 1])].tobytes()
+
+    def encode(self, constant):
+        code = self.lookup(constant)
+        if code < 0:
+            raise Exception("A snapshot is read-only : %s cannot be added to its "
+                            "dictionary, use an overlay of the store" % constant)
+        return code
+
+    def lookup(self, constant):
+        key = str(constant).encode('utf8')
+        low, high = 0, len(self.order)
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_text(self.order[middle]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.order) and self.get_text(self.order[low]) == key:
+            return int(self.order[low])
+        return -1
+
+    def decode(self, code):
+        constant = self.decoded.get(code)
+        if constant is None:
+            constant = self.decoded[code] = Const(self.get_text(code).decode('utf8'))
+        return constant
+
+    def __iter__(self):
+        return (self.decode(code) for code in range(len(self)))
+
+    def __len__(self):
+        return len(self.order)
+
+    def __repr__(self):
+        return "SnapshotDictionary(%d constants, %d decoded)" % (len(self), len(self.decoded))
+
+
+def save_snapshot(db, file_name):
+    '''Write a database to a snapshot file, that open_snapshot maps back in memory
+    @param db: ColumnStore, or Database (dict predicate name -> list of tuples of constants)
+    '''
+    store = db if isinstance(db, ColumnStore) else ColumnStore.from_db(db)
+    with open(file_name, 'wb') as f:
+        f.write(b"\x00" * PREFIX.size)
+
+        def write_section(data):
+            f.write(b"\x00" * (-f.tell() % ALIGN))
+            offset = f.tell()
+            f.write(data)
+            return offset
+
+        text = [c.name.encode('utf8') for c in store.dictionary]
+        offsets = np.cumsum([0] + [len(t) for t in text], dtype=np.uint64)
+        order = sorted(range(len(text)), key=text.__getitem__)
+        header = {
+            'constants': len(text),
+            'offsets': write_section(offsets.astype("<u8").tobytes()),
+            'text': write_section(b"".join(text)),
+            'order': write_section(np.array(order, dtype=FILE_DTYPE).tobytes()),
+            'relations': {}
+        }
+        for name, relation in store.relations.items():
+            header['relations'][name] = {
+                'length': relation.length,
+                'columns': [write_section(c.astype(FILE_DTYPE).tobytes())
+                            for c in relation.columns]
+            }
+
+        data = json.dumps(header).encode('utf8')
+        offset = write_section(data)
+        f.seek(0)
+        f.write(PREFIX.pack(MAGIC, offset, len(data)))
+
+
+def open_snapshot(file_name):
+    '''Open a snapshot file written by save_snapshot. The columns of the relations
+    are read-only views of the memory-mapped file, so they are only loaded when read,
+    and processes opening the same snapshot share their pages. The constants are
+    decoded when an answer reads them (see SnapshotDictionary).
+    @return ColumnStore
+    '''
+    data = np.memmap(file_name, dtype=np.uint8, mode='r')
+    magic, offset, length = PREFIX.unpack(data[:PREFIX.size].tobytes())
+    if magic != MAGIC:
+        raise Exception("%s is not a snapshot file" % file_name)
+    header = json.loads(data[offset:offset + length].tobytes().decode('utf8'))
+
+    n = header['constants']
+    offsets = data[header['offsets']:header['offsets'] + 8 * (n + 1)].view("<u8")
+    text = data[header['text']:header['text'] + int(offsets[-1])]
+    order = data[header['order']:header['order'] + FILE_DTYPE.itemsize * n].view(FILE_DTYPE)
+    store = ColumnStore(SnapshotDictionary(offsets, text, order))
+
+    for name, r in header['relations'].items():
+        store.relations[name] = Relation(
+            [data[o:o + FILE_DTYPE.itemsize * r['length']].view(FILE_DTYPE) for o in r['columns']],
+            r['length'])
+    return store
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+from functools import partial
+
+from .queries import Var, Const, Aggregate, Clause, Different, number_constant
+from .operators import to_number, order_key
+
+__all__ = ['SQLiteStore', 'rule_to_sql']
+
+
+class SQLiteStore:
+    # Database whose tables are SQLite tables, in a file or in memory : rules are
+    # translated to SQL (see rule_to_sql) and evaluated by SQLite, so that the facts
+    # do not have to fit in memory. Each predicate is a table of TEXT columns c0, c1,
+    # ... holding the names of the constants (a predicate of arity 0 has a single
+    # column u holding ''), with a UNIQUE index on all its columns : tables are sets.
+    # The tables derived by an overlay are TEMP tables, dropped by release.
+    def __init__(self, file_name=":memory:", connection=None, errors=None):
+        self.connection = connection if connection is not None else sqlite3.connect(file_name)
+        if errors is None:
+            # Values the aggregates of the connection could not read, reported by
+            # execute : the list is shared with the overlays of the store
+            errors = []
+            for function, aggregate in AGGREGATES.items():
+                self.connection.create_aggregate("datalog_" + function, 1,
+                                                 partial(aggregate, errors))
+        self.errors = errors
+        self.temporary = False
+        self.created = set()  # tables created by this store when it is temporary
+
+    @classmethod
+    def from_db(cls, db, file_name=":memory:"):
+        ''' Store a Database, a dict of tables or a ColumnStore in a new SQLite database'''
+        if hasattr(db, 'to_db'):
+            db = db.to_db()
+        store = cls(file_name)
+        for name, rows in db.items():
+            if rows:
+                store.add_rows(name, rows)
+        store.connection.commit()
+        return store
+
+    def overlay(self):
+        ''' Return a store sharing the connection and the tables of this one, in which
+        the tables written to are temporary copies, so that this one is not modified.
+        The temporary tables of a previous overlay (not released because its
+        evaluation failed) are dropped : one overlay is used at a time.'''
+        store = SQLiteStore(connection=self.connection, errors=self.errors)
+        store.temporary = True
+        store.created = set(row[0] for row in self.connection.execute(
+            "SELECT name FROM sqlite_temp_master WHERE type = 'table'"))
+        store.release()
+        return store
+
+    def release(self):
+        ''' Drop the temporary tables of an overlay'''
+        for name in self.created:
+            self.connection.execute("DROP TABLE temp.%s" % quote(name))
+        self.created = set()
+
+    def get_arity(self, name):
+        ''' Arity of a table, or None if there is no such table'''
+        columns = [row[1] for row in self.connection.execute(
+            "PRAGMA table_info(%s)" % quote(name))]
+        if not columns:
+            return None
+        return 0 if columns == ['u'] else len(columns)
+
+    def create(self, name, arity, source=None):
+        ''' Create the table of a predicate if it does not exist. In an overlay, the
+        table is a temporary one, starting from the rows of the table of the same
+        name if there is one.
+        @param source: in an overlay, table of the base database the table starts
+        from instead'''
+        if name in self.created:
+            return
+        if source is None:
+            source = name
+        exists = self.get_arity(source) is not None
+        if self.get_arity(name) is not None and not self.temporary:
+            return
+        names = columns(arity)
+        self.connection.execute("CREATE %s TABLE %s (%s, UNIQUE (%s))" % (
+            "TEMP" if self.temporary else "", quote(name),
+            ", ".join(c + " TEXT NOT NULL" for c in names), ", ".join(names)))
+        # Index the other columns for the joins on them (the first column is the
+        # prefix of the UNIQUE index)
+        for c in names[1:]:
+            self.connection.execute("CREATE INDEX %s ON %s (%s)" % (
+                quote(name + "#" + c), quote(name), c))
+        if self.temporary:
+            self.created.add(name)
+            if exists:
+                self.connection.execute("INSERT INTO temp.%s SELECT * FROM main.%s" % (
+                    quote(name), quote(source)))
+
+    def require(self, name, arity):
+        ''' Make sure the table of a predicate read by a rule exists : the tables of
+        the base database are read as they are (they are only copied by create, when
+        an overlay writes to them), a missing table is created empty'''
+        if self.get_arity(name) is None:
+            self.create(name, arity)
+
+    def copy(self, name, source):
+        ''' Make the table name of an overlay start from the rows of the table source
+        of the base database instead of its own (it is empty if there is no source)'''
+        arity = self.get_arity(source)
+        if arity is None:
+            arity = self.get_arity(name)
+        if arity is not None:
+            self.create(name, arity, source)
+
+    def get_tables(self):
+        ''' Names of the tables (of the base database and temporary ones)'''
+        return [row[0] for row in self.connection.execute(
+            "SELECT name FROM sqlite_temp_master WHERE type = 'table' UNION "
+            "SELECT name FROM sqlite_master WHERE type = 'table'")]
+
+    def to_db(self):
+        ''' Read the store as a dict of lists of tuples of constants'''
+        db = {}
+        for name in self.get_tables():
+            rows = self.connection.execute("SELECT * FROM " + quote(name))
+            db[name] = [tuple(map(Const, row)) for row in rows] \
+                if self.get_arity(name) else [()] * len(rows.fetchall())
+        return db
+
+    def add_rows(self, name, rows, arity=None):
+        ''' Add rows (tuples of constants or str) to a table, created if needed'''
+        rows = iter(rows)
+        if arity is None:
+            first = next(rows, None)
+            if first is None:
+                return
+            arity = len(first)
+            self.add_rows(name, [first], arity)
+        self.create(name, arity)
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO %s VALUES (%s)" % (quote(name), ", ".join("?" * max(arity, 1))),
+            ((tuple(str(v) for v in row) if arity else ('',)) for row in rows))
+
+    def evaluate_rule(self, rule, sources=None):
+        ''' Insert the rows derived by a rule (without equalities) into the table of
+        its head predicate
+        @param sources: as in rule_to_sql'''
+        p = rule.head.predicate_name
+        self.create(p, rule.head.arity)
+        for c in rule.body:
+            if isinstance(c, Clause):
+                self.require(c.predicate_name, c.arity)
+        text, parameters = rule_to_sql(rule, sources)
+        self.execute("INSERT OR IGNORE INTO %s %s" % (quote(p), text), parameters)
+
+    def execute(self, text, parameters):
+        ''' Execute a statement, raising the errors of the aggregates as the tuple
+        engine does (SQLite reports them as OperationalError)'''
+        del self.errors[:]
+        try:
+            return self.connection.execute(text, parameters)
+        except sqlite3.OperationalError:
+            if not self.errors:
+                raise
+            value = self.errors[0]
+            del self.errors[:]
+            raise ValueError("sum of a value which is not a number : %s" % value)
+
+    def evaluate_component(self, rules, component, recursive):
+        ''' Evaluate the rules defining a strongly connected component. A recursive
+        component made of one predicate, read once by each of its recursive rules, is
+        evaluated by a recursive common table expression (see recursive_to_sql).
+        Other recursive components are evaluated by semi-naive iteration, the new
+        rows of each round being the ones of higher rowid.'''
+        for r in rules:
+            self.create(r.head.predicate_name, r.head.arity)
+        if not recursive:
+            for r in rules:
+                self.evaluate_rule(r)
+            return self
+        if is_linear(rules, component):
+            for r in rules:
+                for c in r.body:
+                    if isinstance(c, Clause):
+                        self.require(c.predicate_name, c.arity)
+            text, parameters = recursive_to_sql(rules, component[0])
+            self.execute(text, parameters)
+            return self
+
+        marks = self.get_rowids(component)
+        for r in rules:
+            self.evaluate_rule(r)
+        while True:
+            new_marks = self.get_rowids(component)
+            if new_marks == marks:
+                return self
+            for r in rules:
+                for i, c in enumerate(r.body):
+                    p = c.predicate_name if isinstance(c, Clause) and c.pos else None
+                    if p in component and new_marks[p] > marks[p]:
+                        self.evaluate_rule(r, {i: "(SELECT * FROM %s WHERE rowid > %d AND rowid <= %d)"
+                                                  % (quote(p), marks[p], new_marks[p])})
+            marks = new_marks
+
+    def get_rowids(self, names):
+        ''' Largest rowid of each table : rows are inserted with increasing rowids'''
+        return {p: self.connection.execute("SELECT coalesce(max(rowid), 0) FROM %s"
+                                           % quote(p)).fetchone()[0] for p in names}
+
+    def get_answer(self, name, unique=True, constants=(), variables=(), limit=None):
+        ''' Read a table as a list of list of str
+        @param unique: if true, the rows are sorted (tables have no duplicates)
+        @param constants, variables: optional selection of the rows (see select)
+        @param limit: if given, maximum number of rows read (the first ones in order
+        if unique is true)
+        '''
+        arity = self.get_arity(name)
+        if arity is None:
+            return []
+        conditions = ["c%d = ?" % p for p, _ in constants]
+        parameters = [str(c) for _, c in constants]
+        for positions in variables:
+            conditions += ["c%d = c%d" % (p, positions[0]) for p in positions[1:]]
+        text = "SELECT * FROM " + quote(name)
+        if conditions:
+            text += " WHERE " + " AND ".join(conditions)
+        if unique:
+            # TEXT values are compared as UTF-8 bytes, in the order of Python strings
+            text += " ORDER BY " + ", ".join(columns(arity))
+        if limit is not None:
+            text += " LIMIT %d" % limit
+        return [list(row) if arity else [] for row in self.connection.execute(text, parameters)]
+
+    def __contains__(self, name):
+        return self.get_arity(name) is not None
+
+    def __repr__(self):
+        return "SQLiteStore(%s)" % ", ".join(self.get_tables())
+
+
+class CountAggregate:
+    # SQLite aggregates computing the same values as operators.group_by, counts and
+    # sums being written as number constants. errors is the list receiving the
+    # values an aggregate cannot read (see SQLiteStore.execute).
+    def __init__(self, errors):
+        self.total = 0
+        self.errors = errors
+
+    def step(self, value):
+        self.total += 1
+
+    def finalize(self):
+        return number_constant(self.total).name
+
+
+class SumAggregate(CountAggregate):
+    def step(self, value):
+        number = to_number(value)
+        if number is None:
+            self.errors.append(value)
+            raise ValueError("sum of a value which is not a number : %s" % value)
+        self.total += number
+
+
+class MinAggregate:
+    minimum = True
+
+    def __init__(self, errors):
+        self.value = None
+
+    def step(self, value):
+        if self.value is None or (order_key(value) < order_key(self.value)) == self.minimum:
+            self.value = value
+
+    def finalize(self):
+        return self.value
+
+
+class MaxAggregate(MinAggregate):
+    minimum = False
+
+
+AGGREGATES = {'count': CountAggregate, 'sum': SumAggregate, 'min': MinAggregate,
+              'max': MaxAggregate}
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def columns(arity):
+    return ["c%d" % p for p in range(arity)] if arity else ["u"]
+
+
+def rule_to_sql(rule, sources=None, parameters=None):
+    '''Translate a rule (without equalities) to a SELECT query returning the rows of its
+    head : the positive clauses are joined on their shared variables, the differences
+    are <> conditions and the negated clauses NOT EXISTS subqueries. Aggregates are
+    computed with GROUP BY the other terms of the head.
+    @param sources: optional dict index of a clause of the body -> SQL table expression
+    it reads instead of the table of its predicate
+    @param parameters: optional dict of named parameters the ones of the query are
+    added to (to combine queries)
+    @return (text, dict of the named parameters : the constants)
+    '''
+    sources = sources or {}
+    parameters = parameters if parameters is not None else {}
+    bindings = {}    # variable -> column it is bound to
+    tables = []
+    conditions = []
+
+    def term(t):
+        if isinstance(t, Var):
+            return bindings[t]
+        name = ":k%d" % len(parameters)
+        parameters[name[1:]] = str(t)
+        return name
+
+    for i, c in enumerate(rule.body):
+        if isinstance(c, Clause) and c.pos:
+            alias = "t%d" % i
+            tables.append("%s AS %s" % (sources.get(i, quote(c.predicate_name)), alias))
+            for p, a in enumerate(c.args):
+                column = "%s.c%d" % (alias, p)
+                if isinstance(a, Var) and a not in bindings:
+                    bindings[a] = column
+                elif isinstance(a, (Var, Const)):
+                    conditions.append("%s = %s" % (column, term(a)))
+    for i, c in enumerate(rule.body):
+        if isinstance(c, Different):
+            conditions.append("%s <> %s" % (term(c.left), term(c.right)))
+        elif isinstance(c, Clause) and c.is_negative():
+            alias = "n%d" % i
+            matches = ["%s.c%d = %s" % (alias, p, term(a)) for p, a in enumerate(c.args)
+                       if isinstance(a, (Var, Const))]
+            conditions.append("NOT EXISTS (SELECT 1 FROM %s AS %s%s)" % (
+                quote(c.predicate_name), alias,
+                "".join((" WHERE ", " AND ")[k > 0] + m for k, m in enumerate(matches))))
+
+    head = []
+    groups = []
+    for a in rule.head.args:
+        if isinstance(a, Aggregate):
+            head.append("datalog_%s(%s)" % (a.function, term(a.term)))
+        else:
+            head.append(term(a))
+            groups.append(head[-1])
+    text = "SELECT " + (", ".join(head) or "''")
+    if tables:
+        text += " FROM " + ", ".join(tables)
+    if conditions:
+        text += " WHERE " + " AND ".join(conditions)
+    if len(groups) < len(head):
+        # Without groups, an aggregate query returns a row even if the body has none
+        text += " GROUP BY " + ", ".join(groups) if groups else " HAVING count(*) > 0"
+    return text, parameters
+
+
+def is_linear(rules, component):
+    '''Whether a recursive component can be evaluated by a recursive common table
+    expression : it has a single predicate, read by each of its rules at most once'''
+    if len(component) != 1:
+        return False
+    reads = [sum(1 for c in r.body if isinstance(c, Clause) and c.predicate_name == component[0])
+             for r in rules]
+    # SQLite accepts several recursive selects since its version 3.34
+    if sum(reads) > 1 and sqlite3.sqlite_version_info < (3, 34):
+        return False
+    return max(reads) <= 1 and not any(r.get_ir().aggregated for r in rules)
+
+
+def recursive_to_sql(rules, predicate):
+    '''Translate the rules of a linear recursive predicate (see is_linear) to a
+    statement inserting all its rows into its table : WITH RECURSIVE a table
+    starting from the rows of the table and of the rules not reading the predicate,
+    the recursive rules reading it, INSERT its rows
+    @return (text, dict of the named parameters)
+    '''
+    name = quote(predicate + "#recursive")
+    parameters = {}
+    selects = []
+    recursive = []
+    for r in rules:
+        reads = [i for i, c in enumerate(r.body) if isinstance(c, Clause) and
+                 c.predicate_name == predicate]
+        if reads:
+            recursive.append((r, {reads[0]: name}))
+        else:
+            selects.append(rule_to_sql(r, None, parameters)[0])
+    # The recursive selects follow the initial ones
+    for r, sources in recursive:
+        selects.append(rule_to_sql(r, sources, parameters)[0])
+    arity = rules[0].head.arity
+    return ("WITH RECURSIVE %s (%s) AS (SELECT * FROM %s%s) INSERT OR IGNORE INTO %s SELECT * FROM %s"
+            % (name, ", ".join(columns(arity)), quote(predicate),
+               "".join(" UNION " + s for s in selects), quote(predicate), name), parameters)
@@ -0,0 +1,482 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from .queries import Var, Const, Aggregate, Clause, Different, number_constant
+from .operators import to_number, order_key
+from .planner import RelationStatistics
+
+__all__ = ['ConstantDictionary', 'DictionaryOverlay', 'Relation', 'ColumnStore']
+
+CODE_DTYPE = np.int64
+
+
+class ConstantDictionary:
+    # Shared encoding of the constants of a database to consecutive integers
+    def __init__(self, constants=()):
+        self.constants = []
+        self.codes = {}
+        for c in constants:
+            self.encode(c)
+
+    def encode(self, constant):
+        ''' Return the code of a constant, adding it to the dictionary if needed'''
+        code = self.codes.get(constant)
+        if code is None:
+            code = self.codes[constant] = len(self.constants)
+            self.constants.append(constant)
+        return code
+
+    def lookup(self, constant):
+        ''' Return the code of a constant, or -1 if the constant is unknown'''
+        return self.codes.get(constant, -1)
+
+    def decode(self, code):
+        ''' Return the constant of a code'''
+        return self.constants[code]
+
+    def encode_column(self, values):
+        ''' Encode a sequence of constants as an array of codes'''
+        return np.fromiter((self.encode(v) for v in values), dtype=CODE_DTYPE)
+
+    def decode_column(self, codes):
+        ''' Decode an array of codes as an array of constants (dtype object), each
+        distinct code being decoded once'''
+        distinct, inverse = np.unique(codes, return_inverse=True)
+        constants = np.empty(len(distinct), dtype=object)
+        constants[:] = [self.decode(c) for c in distinct.tolist()]
+        return constants[inverse.reshape(-1)]
+
+    def __iter__(self):
+        return iter(self.constants)
+
+    def __len__(self):
+        return len(self.constants)
+
+    def __repr__(self):
+        return "ConstantDictionary(%d constants)" % len(self)
+
+
+class DictionaryOverlay(ConstantDictionary):
+    # Extension of a dictionary which is not modified : the constants it does not
+    # know are encoded after its codes
+    def __init__(self, base):
+        super().__init__()
+        self.base = base
+        self.offset = len(base)
+
+    def encode(self, constant):
+        code = self.lookup(constant)
+        if code < 0:
+            code = self.offset + ConstantDictionary.encode(self, constant)
+        return code
+
+    def lookup(self, constant):
+        code = self.base.lookup(constant)
+        if 0 <= code < self.offset:
+            return code
+        code = self.codes.get(constant)
+        return -1 if code is None else self.offset + code
+
+    def decode(self, code):
+        return self.base.decode(code) if code < self.offset else self.constants[code - self.offset]
+
+    def __iter__(self):
+        return (self.decode(code) for code in range(len(self)))
+
+    def __len__(self):
+        return self.offset + len(self.constants)
+
+    def __repr__(self):
+        return "DictionaryOverlay(%d constants, %d new)" % (len(self), len(self.constants))
+
+
+class Relation:
+    # Relation stored as one array of constant codes per argument. The number
+    # of rows is kept explicitly so that relations of arity 0 can be represented.
+    def __init__(self, columns, length=None):
+        self.columns = [np.asarray(c, dtype=CODE_DTYPE) for c in columns]
+        if self.columns:
+            self.length = len(self.columns[0])
+        else:
+            self.length = length or 0
+
+    @classmethod
+    def empty(cls, arity):
+        return cls([np.empty(0, dtype=CODE_DTYPE) for _ in range(arity)])
+
+    @classmethod
+    def from_rows(cls, rows, arity, dictionary):
+        ''' Encode an iterable of rows of constants'''
+        rows = list(rows)
+        return cls([dictionary.encode_column(row[i] for row in rows)
+                    for i in range(arity)], len(rows))
+
+    def get_arity(self):
+        return len(self.columns)
+
+    def take(self, indices):
+        ''' Return the rows at the given indices (or boolean mask)'''
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            length = int(indices.sum())
+        else:
+            length = len(indices)
+        return Relation([c[indices] for c in self.columns], length)
+
+    def project(self, positions):
+        return Relation([self.columns[i] for i in positions], self.length)
+
+    def concat(self, other):
+        ''' Bag union of two relations with the same arity'''
+        return Relation([np.concatenate([a, b]) for a, b in zip(self.columns, other.columns)],
+                        self.length + other.length)
+
+    def unique(self):
+        ''' Remove duplicated rows (rows are sorted by codes)'''
+        if not self.columns:
+            return Relation([], min(self.length, 1))
+        return self.take(unique_indices(self.columns))
+
+    def difference(self, other):
+        ''' Rows of self which are not in other'''
+        if not self.columns:
+            return Relation([], 0 if other.length else self.length)
+        left, right = dense_keys(self.columns, other.columns)
+        return self.take(~np.isin(left, right))
+
+    def __or__(self, other):
+        return self.concat(other).unique()
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return "Relation(arity=%d, %d rows)" % (self.get_arity(), self.length)
+
+
+class ColumnStore:
+    # Database of columnar relations sharing one constant dictionary
+    def __init__(self, dictionary=None):
+        self.dictionary = dictionary if dictionary is not None else ConstantDictionary()
+        self.relations = {}
+        self.statistics = {}
+
+    @classmethod
+    def from_db(cls, db):
+        ''' Encode a dict of tables (lists of rows of constants)'''
+        store = cls()
+        for name, rows in db.items():
+            store.add_rows(name, rows)
+        return store
+
+    def to_db(self):
+        ''' Decode the store as a dict of lists of tuples of constants'''
+        db = {}
+        for name, relation in self.relations.items():
+            decoded = [self.dictionary.decode_column(c) for c in relation.columns]
+            db[name] = [tuple(row) for row in zip(*decoded)] if decoded else \
+                [()] * relation.length
+        return db
+
+    def overlay(self):
+        ''' Return a new store sharing the relations of this one, so that relations
+        added to it do not modify this one. The constants it encodes are added to an
+        extension of the dictionary (see DictionaryOverlay).'''
+        store = ColumnStore(DictionaryOverlay(self.dictionary))
+        store.relations = dict(self.relations)
+        store.statistics = self.statistics
+        return store
+
+    def add_rows(self, name, rows):
+        ''' Encode and add rows to the relation name, skipping the rows it already
+        holds : facts are sets'''
+        rows = list(rows)
+        arity = len(rows[0]) if rows else 0
+        if name in self.relations:
+            arity = self.relations[name].get_arity()
+        relation = Relation.from_rows(rows, arity, self.dictionary).unique()
+        if name in self.relations:
+            relation = relation - self.relations[name]
+        self.add(name, relation)
+
+    def add(self, name, relation):
+        ''' Append an encoded relation to the relation name'''
+        if name in self.relations:
+            relation = self.relations[name].concat(relation)
+        self.relations[name] = relation
+
+    def get(self, name, arity):
+        ''' Return the relation name, or an empty relation of the given arity'''
+        relation = self.relations.get(name)
+        return relation if relation is not None else Relation.empty(arity)
+
+    def get_statistics(self, name, arity):
+        ''' Return the RelationStatistics of relation name (cached until the
+        relation is replaced)'''
+        relation = self.get(name, arity)
+        entry = self.statistics.get(name)
+        if entry is None or entry[0] is not relation:
+            entry = self.statistics[name] = (relation, RelationStatistics.from_columns(
+                relation.columns, relation.length))
+        return entry[1]
+
+    def select(self, relation, constants, variables):
+        ''' Select the rows matching the constants and repeated variables of an atom
+        (vectorized version of operators.select)'''
+        mask = np.ones(relation.length, dtype=bool)
+        for i, c in constants:
+            mask &= relation.columns[i] == self.dictionary.lookup(c)
+        for positions in variables:
+            for i in positions[1:]:
+                mask &= relation.columns[i] == relation.columns[positions[0]]
+        return relation.take(mask)
+
+    def scan(self, relation, constants, variables):
+        ''' Select the rows matching an atom, and project them on its variables
+        (vectorized version of operators.scan)'''
+        selected = self.select(relation, constants, variables)
+        return selected.project([positions[0] for positions in variables])
+
+    def evaluate_rule(self, rule, delta=None, distinct=True):
+        ''' Compute the answer of a rule with vectorized joins
+        @param rule: rule (without equalities)
+        @param delta: optional couple (index of a body clause, relation) to read
+        this clause from the given relation instead of the store
+        @param distinct: if false, the rows are not deduplicated after the projections,
+        so that the answer holds each row once per derivation
+        @return Relation of the head
+        '''
+        if rule.get_ir().aggregated:
+            relation = self.evaluate_rule(rule.get_ir().get_grouped_rule(), delta, False)
+            return self.group_by(relation, [i for i, a in enumerate(rule.head.args)
+                                            if not isinstance(a, Aggregate)],
+                                 [(a.function, i) for i, a in enumerate(rule.head.args)
+                                  if isinstance(a, Aggregate)])
+        columns = {}
+        table = Relation([], 1)
+        order = rule.get_join_plan(self, delta).order
+        for i, live in zip(order, rule.get_live_variables(order)):
+            c = rule.body[i]
+            if delta is not None and delta[0] == i:
+                relation = delta[1]
+            else:
+                relation = self.get(c.predicate_name, c.arity)
+            constants, variables = c.get_positions()
+            atom = self.scan(relation, constants, list(variables.values()))
+            atom_vars = list(variables.keys())
+            shared = [j for j, v in enumerate(atom_vars) if v in columns]
+            new = [j for j, v in enumerate(atom_vars) if v not in columns]
+            left, right = join_indices([table.columns[columns[atom_vars[j]]] for j in shared],
+                                       [atom.columns[j] for j in shared],
+                                       table.length, atom.length)
+            table = Relation([col[left] for col in table.columns] +
+                             [atom.columns[j][right] for j in new], len(left))
+            for j in new:
+                columns[atom_vars[j]] = len(columns)
+            # Drop the variables which are not used anymore
+            if len(live) < len(columns):
+                kept = [v for v in columns if v in live]
+                table = table.project([columns[v] for v in kept])
+                if distinct:
+                    table = table.unique()
+                columns = {v: j for j, v in enumerate(kept)}
+
+        for c in rule.body:
+            if isinstance(c, Different):
+                if isinstance(c.left, Const) and isinstance(c.right, Const):
+                    # Two constants (left by the removal of the equalities) : all or
+                    # no rows, as in operators.select_different
+                    table = table.take(np.full(table.length, c.left is not c.right))
+                    continue
+                left, right = [table.columns[columns[arg]] if arg in columns
+                               else self.dictionary.lookup(arg) for arg in c.args]
+                table = table.take(left != right)
+            elif isinstance(c, Clause) and c.is_negative():
+                constants, variables = c.get_positions()
+                atom = self.scan(self.get(c.predicate_name, c.arity),
+                                 constants, list(variables.values()))
+                if not variables:
+                    table = table.take(np.full(table.length, atom.length == 0))
+                    continue
+                left, right = dense_keys([table.columns[columns[v]] for v in variables],
+                                         atom.columns)
+                table = table.take(~np.isin(left, right))
+
+        head = []
+        for arg in rule.head.args:
+            if isinstance(arg, Var):
+                head.append(table.columns[columns[arg]])
+            else:
+                head.append(np.full(table.length, self.dictionary.encode(arg),
+                                    dtype=CODE_DTYPE))
+        return Relation(head, table.length)
+
+    def group_by(self, relation, keys, aggregates):
+        ''' Vectorized group-by (see operators.group_by) : the rows are grouped on the
+        codes of the key columns, counts and sums are encoded as new constants
+        @return Relation, with one row per group
+        '''
+        if relation.length == 0:
+            return Relation.empty(relation.get_arity())
+        ids = group_ids([relation.columns[k] for k in keys]) if keys \
+            else np.zeros(relation.length, dtype=CODE_DTYPE)
+        _, first, groups = np.unique(ids, return_index=True, return_inverse=True)
+        columns = [c[first] for c in relation.columns]
+        for function, position in aggregates:
+            if function == 'count':
+                totals = np.bincount(groups, minlength=len(first)).tolist()
+                columns[position] = self.encode_numbers(totals)
+                continue
+            codes, values = np.unique(relation.columns[position], return_inverse=True)
+            constants = [self.dictionary.decode(c) for c in codes.tolist()]
+            if function == 'sum':
+                numbers = [to_number(c) for c in constants]
+                if None in numbers:
+                    raise ValueError("sum of a value which is not a number : %s"
+                                     % constants[numbers.index(None)])
+                # As in operators.group_by, the sum of a group is a float only if
+                # one of its values is a float
+                floats = np.array([isinstance(n, float) for n in numbers])[values]
+                ints = [0 if isinstance(n, float) else n for n in numbers]
+                # Python ints are summed when a total could leave the range of int64
+                dtype = np.int64 if max(map(abs, ints)) * relation.length < 2 ** 63 else object
+                int_totals = np.zeros(len(first), dtype=dtype)
+                np.add.at(int_totals, groups[~floats], np.array(ints, dtype=dtype)[values[~floats]])
+                float_totals = np.zeros(len(first), dtype=np.float64)
+                has_float = np.zeros(len(first), dtype=bool)
+                if floats.any():
+                    np.add.at(float_totals, groups, np.array(numbers, dtype=np.float64)[values])
+                    has_float[groups[floats]] = True
+                columns[position] = self.encode_numbers(
+                    [f if h else i for i, f, h in zip(int_totals.tolist(), float_totals.tolist(),
+                                                      has_float.tolist())])
+                continue
+            # min and max : compare the ranks of the values in the order of order_key
+            order = sorted(range(len(codes)), key=lambda i: order_key(constants[i]))
+            ranks = np.empty(len(codes), dtype=CODE_DTYPE)
+            ranks[order] = np.arange(len(codes))
+            if function == 'min':
+                chosen = np.full(len(first), len(codes), dtype=CODE_DTYPE)
+                np.minimum.at(chosen, groups, ranks[values])
+            else:
+                chosen = np.full(len(first), -1, dtype=CODE_DTYPE)
+                np.maximum.at(chosen, groups, ranks[values])
+            columns[position] = codes[np.array(order, dtype=CODE_DTYPE)[chosen]]
+        return Relation(columns, len(first))
+
+    def encode_numbers(self, numbers):
+        ''' Encode a list of numbers as an array of codes of constants'''
+        return self.dictionary.encode_column(number_constant(n) for n in numbers)
+
+    def evaluate_component(self, rules, component, recursive):
+        ''' Evaluate the rules defining a strongly connected component
+        (semi-naive iteration if the component is recursive)'''
+        if not recursive:
+            for r in rules:
+                p = r.head.predicate_name
+                self.add(p, self.evaluate_rule(r).unique() - self.get(p, r.head.arity))
+            return self
+
+        arity = {r.head.predicate_name: r.head.arity for r in rules}
+        known = {p: self.get(p, arity[p]).unique() for p in component}
+        delta = {p: Relation.empty(arity[p]) for p in component}
+        for r in rules:
+            p = r.head.predicate_name
+            delta[p] = delta[p].concat(self.evaluate_rule(r))
+        while True:
+            for p in component:
+                delta[p] = delta[p].unique() - known[p]
+                known[p] = known[p].concat(delta[p])
+                self.relations[p] = known[p]
+            if not any(len(d) for d in delta.values()):
+                return self
+            new_delta = {p: Relation.empty(arity[p]) for p in component}
+            for r in rules:
+                p = r.head.predicate_name
+                for i, c in enumerate(r.body):
+                    if isinstance(c, Clause) and c.pos and c.predicate_name in known:
+                        new_delta[p] = new_delta[p].concat(
+                            self.evaluate_rule(r, (i, delta[c.predicate_name])))
+            delta = new_delta
+
+    def get_answer(self, name, unique=True, constants=(), variables=()):
+        ''' Decode a relation as a list of list of str
+        @param unique: if true, duplicates are removed (on the codes) and
+        the rows are sorted
+        @param constants, variables: optional selection of the rows (see select)
+        '''
+        relation = self.select(self.relations.get(name, Relation([], 0)), constants, variables)
+        if unique:
+            relation = relation.unique()
+        rows = [list(map(str, row)) for row in zip(*[self.dictionary.decode_column(c)
+                                                      for c in relation.columns])] \
+            if relation.columns else [[] for _ in range(relation.length)]
+        if unique:
+            rows.sort()
+        return rows
+
+    def __contains__(self, name):
+        return name in self.relations
+
+    def __getitem__(self, name):
+        return self.relations[name]
+
+    def __repr__(self):
+        return "\n".join("%s: %r" % item for item in self.relations.items())
+
+
+def unique_indices(columns):
+    '''Indices of the first occurrence of each distinct row, in lexicographic order'''
+    order = np.lexsort(columns[::-1])
+    if len(order) == 0:
+        return order
+    change = np.zeros(len(order), dtype=bool)
+    change[0] = True
+    for c in columns:
+        sorted_c = c[order]
+        change[1:] |= sorted_c[1:] != sorted_c[:-1]
+    return order[change]
+
+
+def group_ids(columns):
+    '''Dense integer id of each row, equal rows having equal ids'''
+    if len(columns) == 1:
+        return columns[0]
+    order = np.lexsort(columns[::-1])
+    change = np.zeros(len(order), dtype=bool)
+    for c in columns:
+        sorted_c = c[order]
+        change[1:] |= sorted_c[1:] != sorted_c[:-1]
+    ids = np.empty(len(order), dtype=CODE_DTYPE)
+    ids[order] = np.cumsum(change)
+    return ids
+
+
+def dense_keys(left_columns, right_columns):
+    '''Encode multi-column keys of two relations as a single array each,
+    equal keys getting equal values on both sides'''
+    n = len(left_columns[0])
+    ids = group_ids([np.concatenate([l, r]) for l, r in zip(left_columns, right_columns)])
+    return ids[:n], ids[n:]
+
+
+def join_indices(left_columns, right_columns, left_length, right_length):
+    '''Vectorized equi-join on the given key columns
+    @return (left indices, right indices) of the matching couples of rows
+    '''
+    if not left_columns:
+        return (np.repeat(np.arange(left_length), right_length),
+                np.tile(np.arange(right_length), left_length))
+    left, right = dense_keys(left_columns, right_columns)
+    order = np.argsort(right, kind='stable')
+    sorted_right = right[order]
+    lo = np.searchsorted(sorted_right, left, 'left')
+    counts = np.searchsorted(sorted_right, left, 'right') - lo
+    total = counts.sum()
+    left_idx = np.repeat(np.arange(len(left)), counts)
+    starts = np.cumsum(counts) - counts
+    right_idx = order[np.repeat(lo - starts, counts) + np.arange(total)]
+    return left_idx, right_idx
@@ -0,0 +1,81 @@
+import unittest
+import pickle
+import queries
+
+'''
+Careful : This test file is meant to be run at the root of the project
+
+Command : python3 -m unittest tests/analysis_test.py'''
+
+class AnalysisTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder_test = 'query_examples/'
+
+    def test_disjoint_set(self):
+        classes = queries.DisjointSet(range(6))
+        for a, b in [(0, 1), (2, 3), (1, 3), (4, 5)]:
+            classes.union(a, b)
+        self.assertIs(classes.find(0), classes.find(2))
+        self.assertIsNot(classes.find(0), classes.find(4))
+        self.assertListEqual(classes.get_sets(), [{0, 1, 2, 3}, {4, 5}])
+        self.assertListEqual(queries.union_find([[1, 2], [3], [2, 4], [5, 3], [6]]),
+                             [{1, 2, 4}, {3, 5}, {6}])
+
+    def test_long_chain(self):
+        # A chain of 2000 equalities forms a single class
+        body = " ".join("e(X%d) X%d = X%d" % (i, i, i + 1) for i in range(2000))
+        rule = queries.program_parser("p(X0) ← %s e(X2000)." % body).rules[0]
+        self.assertEqual(len(rule.get_eqclasses()), 1)
+        self.assertTrue(rule.is_rangerestricted())
+        head, _ = rule.get_remove_equalities()
+        self.assertEqual(repr(head), "p(X0)")
+
+    def test_ir(self):
+        rule = queries.program_parser("q(X, Y) ← e(X, Z) Z = Y Y = b ¬f(X) X ≠ a.").rules[0]
+        ir = rule.get_ir()
+        self.assertIs(rule.get_ir(), ir)
+        self.assertTrue(ir.satisfiable and ir.range_restricted)
+        self.assertFalse(ir.conjunctive)
+        self.assertEqual(ir.negated_predicates, ['f'])
+        self.assertEqual(repr(ir), "RuleIR(q(X, b) ← e(X, b) ¬f(X) X ≠ a)")
+        rule.remove_equalities()
+        self.assertIsNot(rule.get_ir(), ir)
+        self.assertEqual(len(rule.body), 3)
+        self.assertNotIn('ir', pickle.loads(pickle.dumps(rule)).__dict__)
+
+    def test_immutable_rule(self):
+        # The body and the arguments cannot be modified in place : a rule is edited
+        # by replacing them, which drops its analysis and its compiled functions
+        rule = queries.program_parser("q(X) ← e(X, Y).").rules[0]
+        rule.get_compiled([0])
+        ir = rule.get_ir()
+        self.assertIsInstance(rule.body, tuple)
+        self.assertIsInstance(rule.body[0].args, tuple)
+        rule.body = rule.body + (queries.Clause('f', [queries.Var('X')], False),)
+        self.assertIsNot(rule.get_ir(), ir)
+        self.assertDictEqual(rule.compiled, {})
+        self.assertEqual(repr(rule), "q(X) ← e(X, Y) ¬f(X).")
+
+    def test_unsatisfiable(self):
+        for text in ["q(X) ← e(X) X = a X = b.", "q(X) ← e(X, Y) X = Y X ≠ Y.",
+                     "q(X) ← e(X) X ≠ X."]:
+            self.assertFalse(queries.program_parser(text).rules[0].is_satisfiable())
+
+    def test_any(self):
+        q = queries.query_parser("e(a, b).\nq(X) ← e(X, _).\n? q(X)")
+        self.assertTrue(q.is_rangerestricted())
+        self.assertListEqual(q.evaluate(), [['a']])
+        self.assertFalse(queries.program_parser("q(X) ← e(X) ¬f(X, _).").check_no_negate_any())
+
+    def test_any_safety(self):
+        # An _ of a positive clause is bound by it, in the head or a negated clause
+        # it is not
+        for text, safe in [("q(X) ← e(X, _).", True), ("q(X) ← e(Y, _) X = Y.", True),
+                           ("q(X, Y) ← e(X, _).", False), ("q(_) ← e(X).", False),
+                           ("q(X) ← e(X) ¬f(X, _).", False), ("q(X) ← ¬e(X, _).", False)]:
+            rule = queries.program_parser(text).rules[0]
+            self.assertEqual(rule.is_rangerestricted(), safe, text)
+
+
+if __name__ == '__main__':
+    unittest.main()
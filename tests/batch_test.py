@@ -0,0 +1,37 @@
+import unittest
+import queries
+
+'''
+Careful : This test file is meant to be run at the root of the project
+
+Command : python3 -m unittest tests/batch_test.py'''
+
+class BatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder_test = 'query_examples/'
+
+    def test_rule_signature(self):
+        r1 = queries.query_parser("p(X,Z) ← e(X,Y) e(Y,Z) X≠Z.\n? p(X,Y)").program.rules[0]
+        r2 = queries.query_parser("p(A,C) ← e(A,B) e(B,C) A≠C.\n? p(X,Y)").program.rules[0]
+        r3 = queries.query_parser("p(A,C) ← e(A,B) e(C,B) A≠C.\n? p(X,Y)").program.rules[0]
+        names = {'e': 'e'}
+        self.assertEqual(queries.batch.rule_signature(r1, names), queries.batch.rule_signature(r2, names))
+        self.assertNotEqual(queries.batch.rule_signature(r1, names), queries.batch.rule_signature(r3, names))
+
+    def test_shared_predicates(self):
+        with open(self.folder_test+"transitive.query", encoding='utf8') as f:
+            text = f.read()
+        q1 = queries.query_parser(text)
+        q2 = queries.query_parser(text.replace('X', 'A').replace('path(a,Y)', 'path(e,Y)'))
+        batch = queries.BatchQuery([q1, q2])
+        self.assertListEqual([c[0] for c in batch.components], [('path',), ('q',), ('q#2',)])
+        self.assertListEqual(batch.execute(), [[['b'], ['c'], ['d']],
+                                               [['a'], ['b'], ['c'], ['d']]])
+
+    def test_conflicting_predicates(self):
+        names = ["transitive.query", "mutual-recursion.query", "negation.query",
+                 "eval4-differentconst.query", "magic.query", "eval5-selfjoin.query"]
+        qs = [queries.query_parse_file(self.folder_test+name) for name in names]
+        expected = [q.evaluate() for q in qs]
+        self.assertListEqual(queries.evaluate_batch(qs), expected)
+        self.assertListEqual(queries.evaluate_batch(qs, engine='columnar'), expected)
@@ -0,0 +1,24 @@
+import unittest
+import json
+import queries
+import benchmarks
+from benchmarks import runner
+
+'''
+Careful : This test file is meant to be run at the root of the project
+
+Command : python3 -m unittest tests/benchmarks_test.py'''
+
+class BenchmarksTestCase(unittest.TestCase):
+    def test_workloads(self):
+        for name, workload in benchmarks.WORKLOADS.items():
+            q = queries.query_parser(workload(30))
+            self.assertListEqual(q.evaluate(), q.evaluate(engine='columnar'), name)
+
+    def test_runner(self):
+        results = runner.run(['chain', 'differences'], scale=20, repeat=1)
+        self.assertEqual(results['results']['chain']['answers'], 210)
+        self.assertIn('evaluate_columnar', results['results']['differences']['seconds'])
+        results = json.loads(json.dumps(results))
+        ratios = runner.compare(results, results)
+        self.assertEqual(ratios['chain']['parse'], 1.0)
@@ -0,0 +1,64 @@
+import unittest
+import pickle
+import queries
+
+'''
+Careful : This test file is meant to be run at the root of the project
+
+Command : python3 -m unittest tests/compiler_test.py'''
+
+class CompilerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder_test = 'query_examples/'
+
+    def get_rule(self, text):
+        rule = queries.program_parser(text).rules[-1]
+        rule.remove_equalities()
+        return rule
+
+    def get_db(self, tables):
+        c = queries.Const
+        return queries.Database({name: [tuple(c(v) for v in row) for row in rows]
+                                 for name, rows in tables.items()})
+
+    def assertSameAnswer(self, rule, db, distinct):
+        compiled = sorted(map(repr, rule.get_answer(db, distinct=distinct)))
+        interpreted = sorted(map(repr, rule.get_answer(db, distinct=distinct, trace=[])))
+        self.assertListEqual(compiled, interpreted)
+        return compiled
+
+    def test_filters(self):
+        rule = self.get_rule("q(X, Z) ← e(X, Y) e(Y, Z) ¬f(X, X) X ≠ Z Y ≠ c.")
+        db = self.get_db({'e': [('a', 'b'), ('b', 'a'), ('b', 'c'), ('c', 'a'), ('a', 'c')],
+                          'f': [('b', 'b'), ('c', 'a')]})
+        self.assertEqual(len(self.assertSameAnswer(rule, db, True)), 2)
+        # Same rule on a dict without indexes
+        self.assertSameAnswer(rule, dict(db), True)
+
+    def test_bag(self):
+        rule = self.get_rule("q(X) ← e(X, Y) e(Y, Z).")
+        db = self.get_db({'e': [('a', 'b'), ('b', 'c'), ('b', 'd'), ('a', 'e'), ('e', 'c')]})
+        self.assertEqual(len(self.assertSameAnswer(rule, db, False)), 3)
+        self.assertEqual(len(self.assertSameAnswer(rule, db, True)), 1)
+
+    def test_constants_and_repeated(self):
+        rule = self.get_rule("q(Y, b) ← e(a, Y) e(Y, Y) X = a.")
+        db = self.get_db({'e': [('a', 'b'), ('a', 'c'), ('b', 'b'), ('c', 'a')]})
+        self.assertListEqual(self.assertSameAnswer(rule, db, True), ["(b, b)"])
+
+    def test_cache(self):
+        rule = self.get_rule("p(X, Z) ← e(X, Y) e(Y, Z).")
+        compiled = rule.get_compiled([0, 1], True)
+        self.assertIs(rule.get_compiled([0, 1], True), compiled)
+        self.assertIsNot(rule.get_compiled([1, 0], True), compiled)
+        self.assertEqual(pickle.loads(pickle.dumps(rule)).compiled, {})
+
+    def test_examples(self):
+        for name in ["transitive.query", "negation.query", "eval4-differentconst.query"]:
+            q = queries.query_parse_file(self.folder_test+name)
+            prepared = q.prepare()
+            self.assertListEqual(prepared.execute(), prepared.execute(engine='columnar'))
+
+
+if __name__ == '__main__':
+    unittest.main()
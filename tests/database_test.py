@@ -0,0 +1,51 @@
+import unittest
+import queries
+
+'''
+Careful : This test file is meant to be run at the root of the project
+
+Command : python3 -m unittest tests/database_test.py'''
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        a, b, c = queries.Const('a'), queries.Const('b'), queries.Const('c')
+        self.db = queries.Database({'E': [(a, b), (b, c), (a, c)]})
+
+    def test_index(self):
+        index = self.db.get_index('E', (0,))
+        self.assertEqual(len(index[(queries.Const('a'),)]), 2)
+        self.assertIs(self.db.get_index('E', (0,)), index)
+        self.db['E'].append((queries.Const('c'), queries.Const('a')))
+        self.assertIs(self.db.get_index('E', (0,)), index)
+        self.assertEqual(len(index[(queries.Const('c'),)]), 1)
+        self.db['E'] = []
+        self.assertEqual(self.db.get_index('E', (0,)), {})
+
+    def test_evaluate_with_database(self):
+        q = queries.query_parse_file("query_examples/eval5-selfjoin.query")
+        db = queries.Database({'E': [(queries.Const('d'), queries.Const('a'))]})
+        eval = q.evaluate(unique=True, db=db)
+        self.assertListEqual(eval, [['a', 'c'], ['a', 'd'], ['b', 'a'], ['b', 'd'], ['c', 'a'], ['d', 'b']])
+        self.assertEqual(len(db['E']), 1)
+        self.assertNotIn('q', db)
+        # E is replaced by the table holding the facts of the program as well :
+        # its indexes are not kept on db
+        self.assertFalse(db.indexes)
+
+    def test_overlay_index(self):
+        # The indexes of the tables an overlay replaces do not replace the ones of
+        # the base, which are reused by the next evaluations
+        index = self.db.get_index('E', (0,))
+        q = queries.query_parser("E(b, a).\nq(X, Y) ← E(X, Y).\n? q(a, Y)")
+        q.evaluate(db=self.db)
+        q.evaluate(db=self.db)
+        self.assertIs(self.db.get_index('E', (0,)), index)
+        self.assertEqual(len(index[(queries.Const('b'),)]), 1)
+        overlay = self.db.overlay()
+        overlay['E'] = overlay['E'] + [(queries.Const('c'), queries.Const('a'))]
+        self.assertEqual(len(overlay.get_index('E', (0,))[(queries.Const('c'),)]), 1)
+        self.assertNotIn((queries.Const('c'),), self.db.get_index('E', (0,)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import json
+import queries
+
+'''
+Careful : This test file is meant to be run at the root of the project
+
+Command : python3 -m unittest tests/explain_test.py'''
+
+class ExplainTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder_test = 'query_examples/'
+
+    def test_explain(self):
+        q = queries.query_parse_file(self.folder_test+"transitive.query")
+        explanation = q.explain()
+        self.assertFalse(explanation.analyze)
+        [path] = [c for c in explanation.components if c['predicates'] == ['path']]
+        self.assertTrue(path['recursive'])
+        operators = [op['operator'] for op in path['rules'][1]['operators']]
+        self.assertListEqual(operators, ["scan path(X, Y)", "index join edge(Y, Z)",
+                                         "head path(X, Z)"])
+        self.assertNotIn('seconds', path)
+        self.assertIn("index join edge(Y, Z)", str(explanation))
+
+    def test_analyze(self):
+        q = queries.query_parse_file(self.folder_test+"negation.query")
+        seen = []
+        explanation = q.explain(analyze=True, hooks=[lambda c: seen.append(c['predicates'])])
+        components = explanation.to_dict()['components']
+        self.assertListEqual(seen, [c['predicates'] for c in components])
+        self.assertEqual(json.loads(explanation.to_json())['analyze'], True)
+
+        [unreachable] = [c for c in components if c['predicates'] == ['unreachable']]
+        self.assertEqual(unreachable['rows'], {'unreachable': 10})
+        [rule] = unreachable['rules']
+        self.assertEqual((rule['calls'], rule['rows'], rule['peak']), (1, 10, 16))
+        measures = {m['operator']: m for m in rule['measures']}
+        self.assertEqual(measures['filter ¬path(X, Y)']['rows_in'], 16)
+        self.assertEqual(measures['filter ¬path(X, Y)']['rows'], 10)
+
+        [answer] = [c for c in components if c['predicates'] == ['q']]
+        self.assertEqual(answer['rows']['q'], len(q.evaluate()))
+
+    def test_analyze_recursive(self):
+        q = queries.query_parse_file(self.folder_test+"transitive.query")
+        [path] = [c for c in q.explain(analyze=True).components if c['predicates'] == ['path']]
+        self.assertEqual(path['rows'], {'path': 16})
+        # One evaluation of the recursive rule per round of the semi-naive iteration
+        self.assertGreater(path['rules'][1]['calls'], 1)
+        self.assertGreaterEqual(sum(r['rows'] for r in path['rules']), 16)
+
+
+if __name__ == '__main__':
+    unittest.main()
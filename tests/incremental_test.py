@@ -0,0 +1,110 @@
+import unittest
+import random
+import queries
+
+'''
+Careful : This test file is meant to be run at the root of the project
+
+Command : python3 -m unittest tests/incremental_test.py'''
+
+class IncrementalTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder_test = 'query_examples/'
+
+    def test_insert_recursive(self):
+        m = queries.MaterializedQuery(queries.query_parse_file(self.folder_test+"transitive.query"))
+        self.assertListEqual(m.get_answer(), [['b'], ['c'], ['d']])
+        changes = m.insert({'edge': [('d', 'f')]})
+        self.assertEqual(changes['q'], ([(queries.Const('f'),)], []))
+        self.assertListEqual(m.get_answer(), [['b'], ['c'], ['d'], ['f']])
+
+    def test_delete_recursive(self):
+        m = queries.MaterializedQuery(queries.query_parse_file(self.folder_test+"transitive.query"))
+        m.delete({'edge': [('b', 'c')]})
+        self.assertListEqual(m.get_answer(), [['b']])
+        m.insert({'edge': [('b', 'c')]})
+        self.assertListEqual(m.get_answer(), [['b'], ['c'], ['d']])
+
+    def test_update_negation(self):
+        m = queries.MaterializedQuery(queries.query_parse_file(self.folder_test+"negation.query"))
+        self.assertListEqual(m.get_answer(), [['a'], ['d']])
+        m.insert({'edge': [('a', 'd')]})
+        self.assertListEqual(m.get_answer(), [['a']])
+        m.delete({'node': [('a',)]})
+        self.assertListEqual(m.get_answer(), [])
+
+    def test_random_updates(self):
+        rng = random.Random(0)
+        preds = {'edge': 2, 'node': 1}
+        m = queries.MaterializedQuery(queries.query_parse_file(self.folder_test+"negation.query"))
+        facts = {p: set(m.db[p]) for p in preds}
+        consts = [queries.Const(c) for c in 'abcde']
+        for _ in range(50):
+            p = rng.choice(list(preds))
+            row = tuple(rng.choice(consts) for _ in range(preds[p]))
+            if rng.random() < 0.5:
+                m.insert({p: [row]})
+                facts[p].add(row)
+            else:
+                m.delete({p: [row]})
+                facts[p].discard(row)
+            q = queries.query_parse_file(self.folder_test+"negation.query")
+            q.program.rules = [r for r in q.program.rules if r.body]
+            db = queries.Database({p: list(rows) for p, rows in facts.items()})
+            self.assertListEqual(m.get_answer(), q.evaluate(db=db))
+
+    def test_intensional_update(self):
+        m = queries.MaterializedQuery(queries.query_parse_file(self.folder_test+"transitive.query"))
+        self.assertRaises(Exception, m.insert, {'path': [('a', 'a')]})
+
+    def test_in_place_updates(self):
+        # Tables are updated in place : their indexes are patched, not rebuilt
+        m = queries.MaterializedQuery(queries.query_parse_file(self.folder_test+"transitive.query"))
+        table, index = m.db['edge'], m.db.get_index('edge', (0,))
+        m.delete({'edge': [('b', 'c')]})
+        m.insert({'edge': [('d', 'f')]})
+        self.assertIs(m.db['edge'], table)
+        self.assertIs(m.db.get_index('edge', (0,)), index)
+        self.assertNotIn((queries.Const('b'),), index)
+        d, b, f = queries.Const('d'), queries.Const('b'), queries.Const('f')
+        self.assertSetEqual(set(index[(d,)]), {(d, b), (d, f)})
+
+    def test_random_self_joins(self):
+        # Clauses reading a modified table in its state before the update
+        program = "p(X, Y) ← e(X, Z) e(Z, Y) ¬f(X, Y) e(Y, _).\n" \
+                  "t(X, Y) ← e(X, Y) ¬f(Y, X).\nt(X, Y) ← t(X, Z) e(Z, Y) ¬f(Y, Y) e(_, Z) f(_, _).\n" \
+                  "u(X) ← t(X, X) ¬p(X, X).\n"
+        rng = random.Random(1)
+        consts = [queries.Const(c) for c in 'abcde']
+        for goal in ["? p(X, Y)", "? u(X)"]:
+            m = queries.MaterializedQuery(queries.query_parser(program + goal))
+            facts = {'e': set(), 'f': set()}
+            for _ in range(40):
+                inserted, deleted = {}, {}
+                for _ in range(3):
+                    p = rng.choice(['e', 'f'])
+                    row = (rng.choice(consts), rng.choice(consts))
+                    (inserted if rng.random() < 0.6 else deleted).setdefault(p, []).append(row)
+                m.update(inserted, deleted)
+                for p, rows in deleted.items():
+                    facts[p] -= set(rows)
+                for p, rows in inserted.items():
+                    facts[p] |= set(rows)
+                db = queries.Database({p: list(rows) for p, rows in facts.items()})
+                self.assertListEqual(m.get_answer(), queries.query_parser(program + goal).evaluate(db=db))
+
+
+    def test_any_in_changed_clauses(self):
+        # The _ of different clauses are not joined, in a rule or in a recursion
+        for program in ["p(X) ← f(X) e(_, _) g(_).\n? p(X)",
+                        "p(X) ← f(X) e(_, _) g(_).\np(X) ← p(Y) e(Y, X) g(_).\n? p(X)"]:
+            facts = "e(a, b). e(c, d). g(x). f(w).\n"
+            m = queries.MaterializedQuery(queries.query_parser(facts + program))
+            m.update({'f': [('y',)], 'g': [('z',)]}, {'e': [('c', 'd')]})
+            expected = queries.query_parser("e(a, b). g(x). g(z). f(w). f(y).\n" + program)
+            self.assertListEqual(m.get_answer(), expected.evaluate())
+            self.assertIn(['y'], m.get_answer())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import os
+import tempfile
+import queries
+
+'''
+Careful : This test file is meant to be run at the root of the project
+
+Command : python3 -m unittest tests/loader_test.py'''
+
+class LoaderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder_test = 'query_examples/'
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.dir.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_to_constant(self):
+        self.assertIs(queries.to_constant('a'), queries.Const('a'))
+        self.assertIs(queries.to_constant("'Actor0'"), queries.Const("'Actor0'"))
+        self.assertIs(queries.to_constant('Actor0'), queries.Const("'Actor0'"))
+        self.assertIs(queries.to_constant(3), queries.Const("'3'"))
+
+    def test_load_csv_tsv(self):
+        db = queries.Database()
+        counts = queries.load_facts(db, self.write('edge.csv', 'a,b\nb,c\n\nc,d\n'), 'edge',
+                                    chunk_size=2)
+        self.assertEqual(counts, {'edge': 3})
+        queries.load_facts(db, self.write('edge.tsv', 'd\tb\ne\ta\n'), 'edge')
+        self.assertEqual(len(db['edge']), 5)
+        self.assertEqual(db['edge'][0], (queries.Const('a'), queries.Const('b')))
+
+    def test_load_overlay(self):
+        # Loading into an overlay leaves the tables of its base unchanged
+        base = queries.Database({'edge': [(queries.Const('a'), queries.Const('b'))]})
+        db = base.overlay()
+        queries.load_facts(db, self.write('edge.csv', 'c,d\na,b\ne,f\n'), 'edge', chunk_size=1)
+        self.assertEqual(len(base['edge']), 1)
+        self.assertEqual(len(db['edge']), 3)
+
+    def test_load_jsonl(self):
+        db = queries.Database()
+        path = self.write('facts.jsonl', '{"predicate": "edge", "args": ["a", "b"]}\n'
+                                         '["b", "c"]\n')
+        self.assertEqual(queries.load_facts(db, path, 'edge'), {'edge': 2})
+        with self.assertRaises(Exception):
+            queries.load_facts(db, self.write('bad.jsonl', '["a", "b"]\n'))
+
+    def test_arity(self):
+        q = queries.query_parse_file(self.folder_test+"transitive.query")
+        with self.assertRaises(Exception) as e:
+            queries.load_facts(queries.Database(), self.write('edge.csv', 'a,b,c\n'), 'edge',
+                               program=q)
+        self.assertIn('edge.csv:1', str(e.exception))
+        with self.assertRaises(Exception):
+            queries.load_facts(queries.Database(), self.write('edge.csv', 'a,b\nb\n'), 'edge')
+
+    def test_evaluate(self):
+        text = open(self.folder_test+"transitive.query").read()
+        q = queries.query_parser("\n".join(l for l in text.splitlines() if not l.startswith('edge')))
+        path = self.write('edge.csv', 'a,b\nb,c\nc,d\nd,b\ne,a\n')
+        db = queries.Database()
+        queries.load_facts(db, path, 'edge', program=q)
+        store = queries.ColumnStore()
+        queries.load_facts(store, path, 'edge', program=q, chunk_size=2)
+        self.assertListEqual(q.evaluate(db=db), [['b'], ['c'], ['d']])
+        self.assertListEqual(q.evaluate(engine='columnar', db=store), [['b'], ['c'], ['d']])
+        # The facts already loaded are skipped
+        queries.load_facts(store, self.write('more.csv', 'a,b\nf,g\nf,g\n'), 'edge', chunk_size=2)
+        self.assertEqual(len(store['edge']), 6)
@@ -0,0 +1,45 @@
+import unittest
+import queries
+
+'''
+Careful : This test file is meant to be run at the root of the project
+
+Command : python3 -m unittest tests/magic_test.py'''
+
+class MagicTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder_test = 'query_examples/'
+
+    def test_rewrite(self):
+        q = queries.query_parse_file(self.folder_test+"magic.query")
+        q.remove_equalities()
+        m = q.magic_sets()
+        self.assertEqual(m.query.predicate_name, 'path@bf')
+        heads = set(r.head.predicate_name for r in m.program.rules)
+        self.assertIn('magic@path@bf', heads)
+        self.assertNotIn('path', heads)
+
+    def test_only_relevant_facts(self):
+        q = queries.query_parse_file(self.folder_test+"magic.query")
+        q.remove_equalities()
+        m = q.magic_sets()
+        m.query = queries.Clause(m.query.predicate_name, [queries.Var('X'), queries.Var('Y')], True)
+        eval = m.evaluate(magic=False)
+        self.assertListEqual(eval, [['a', 'b'], ['a', 'c'], ['a', 'd']])
+
+    def test_eval_bound_query(self):
+        for magic in [False, True]:
+            q = queries.query_parse_file(self.folder_test+"magic.query")
+            eval = q.evaluate(unique=True, magic=magic)
+            self.assertListEqual(eval, [['a', 'b'], ['a', 'c'], ['a', 'd']])
+
+    def test_eval_bound_query_negation(self):
+        for magic in [False, True]:
+            q = queries.query_parse_file(self.folder_test+"negation.query")
+            q.query = queries.Clause('unreachable', [queries.Var('X'), queries.Const('a')], True)
+            eval = q.evaluate(unique=True, magic=magic)
+            self.assertListEqual(eval, [['a', 'a'], ['b', 'a'], ['c', 'a'], ['d', 'a']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import queries
+
+'''
+Careful : This test file is meant to be run at the root of the project
+
+Command : python3 -m unittest tests/operators_test.py'''
+
+class OperatorsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.left = [(1, 'a', 'x'), (2, 'b', 'y'), (3, 'a', 'y')]
+        self.right = [('a', 'x', 10), ('a', 'y', 11), ('b', 'x', 12)]
+
+    def test_scan(self):
+        relation = [('a', 1, 1), ('a', 1, 2), ('b', 2, 2)]
+        rows = list(queries.operators.scan(relation, [(0, 'a')], [[1, 2]]))
+        self.assertListEqual(rows, [(1,)])
+
+    def test_hash_join_one_column(self):
+        rows = list(queries.operators.hash_join(self.left, self.right, [1], [0], [2]))
+        self.assertCountEqual(rows, [(1, 'a', 'x', 10), (1, 'a', 'x', 11), (2, 'b', 'y', 12),
+                                     (3, 'a', 'y', 10), (3, 'a', 'y', 11)])
+
+    def test_hash_join_two_columns(self):
+        rows = list(queries.operators.hash_join(self.left, self.right, [1, 2], [0, 1], [2]))
+        self.assertCountEqual(rows, [(1, 'a', 'x', 10), (3, 'a', 'y', 11)])
+
+    def test_cartesian_product(self):
+        rows = list(queries.operators.hash_join([(1,), (2,)], [('a',), ('b',)], [], [], [0]))
+        self.assertCountEqual(rows, [(1, 'a'), (1, 'b'), (2, 'a'), (2, 'b')])
+
+    def test_anti_join(self):
+        rows = list(queries.operators.anti_join(self.left, self.right, [1, 2], [0, 1]))
+        self.assertListEqual(rows, [(2, 'b', 'y')])
+        self.assertListEqual(list(queries.operators.anti_join(self.left, [()], [], [])), [])
+
+    def test_select_different(self):
+        select_different = queries.operators.select_different
+        rows = list(select_different(self.left, (True, 1), (False, 'a')))
+        self.assertListEqual(rows, [(2, 'b', 'y')])
+        # Two constants keep every row or no row
+        self.assertListEqual(list(select_different(self.left, (False, 'a'), (False, 'b'))),
+                             self.left)
+        self.assertListEqual(list(select_different(self.left, (False, 'a'), (False, 'a'))), [])
+
+    def test_project_deduplicate(self):
+        rows = list(queries.operators.project(self.left, [1]))
+        self.assertListEqual(rows, [('a',), ('b',), ('a',)])
+        self.assertListEqual(list(queries.operators.deduplicate(rows)), [('a',), ('b',)])
+        self.assertListEqual(list(queries.operators.project(self.left, [])), [(), (), ()])
+
+    def test_projection_pushdown(self):
+        q = queries.query_parser("e(a,b,c).\ne(a,d,c).\ne(c,b,a).\n"
+                                 "p(X) ← e(X,Y,Z) e(Z,U,X) ¬e(U,U,U).\n? p(X)")
+        r = q.program.rules[-1]
+        order = r.get_join_plan(q.get_data()[0]).order
+        self.assertEqual(r.get_live_variables(order)[-1], {queries.Var('X'), queries.Var('U')})
+        db, _ = q.get_data()
+        self.assertEqual(len(r.get_answer(db)), 4)
+        self.assertEqual(len(r.get_answer(db, distinct=True)), 2)
+
+    def test_eval_selfjoin(self):
+        q = queries.query_parse_file("query_examples/eval5-selfjoin.query")
+        eval = q.evaluate(unique=True)
+        self.assertListEqual(eval, [['a', 'c'], ['a', 'd'], ['b', 'd']])
+
+    def test_group_by(self):
+        rows = [('a', "'1'", 'x'), ('a', "'2'", 'y'), ('b', "'1.5'", "'10'"), ('b', "'2'", "'9'")]
+        groups = queries.operators.group_by(rows, [0], [('sum', 1), ('min', 2)])
+        self.assertListEqual(sorted(groups), [('a', 3, 'x'), ('b', 3.5, "'9'")])
+        groups = queries.operators.group_by(rows, [], [('count', 0), ('max', 2)])
+        # The columns which are neither keys nor aggregated come from a row of the group
+        self.assertListEqual(groups, [(4, "'1'", 'y')])
+        with self.assertRaises(ValueError):
+            queries.operators.group_by(rows, [], [('sum', 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
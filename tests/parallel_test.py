@@ -0,0 +1,52 @@
+import unittest
+import queries
+
+'''
+Careful : This test file is meant to be run at the root of the project
+
+Command : python3 -m unittest tests/parallel_test.py'''
+
+class ParallelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder_test = 'query_examples/'
+
+    def test_tasks(self):
+        q = queries.query_parser("e(a,b).\nf(b).\np(X) ← e(X,Y).\nr(Y) ← e(X,Y) ¬f(X).\n"
+                                 "s(X) ← p(X) r(X).\ns(X) ← f(X).\n? s(X)")
+        components, dependencies = queries.parallel.get_tasks(q.prepare().strata)
+        names = [c[0] for c in components]
+        index = {c[0]: k for k, c in enumerate(names)}
+        self.assertEqual(dependencies[index['p']], {index['e']})
+        self.assertEqual(dependencies[index['r']], {index['e'], index['f']})
+        self.assertEqual(dependencies[index['s']], {index['p'], index['r'], index['f']})
+
+    def test_evaluate(self):
+        for name in ["transitive.query", "mutual-recursion.query", "negation.query",
+                     "eval4-differentconst.query", "magic.query", "eval5-selfjoin.query"]:
+            q = queries.query_parse_file(self.folder_test+name)
+            self.assertListEqual(q.evaluate(workers=2), [list(row) for row in q.evaluate()])
+
+    def test_partition_rule(self):
+        q = queries.query_parser("e(a,b).\ne(b,c).\ne(c,a).\ne(b,a).\nf(a).\n"
+                                 "p(X,Z) ← e(X,Y) e(Y,Z) ¬f(Z).\n? p(X,Z)")
+        store = queries.ColumnStore.from_db(q.get_data()[0])
+        rule = q.program.rules[-1]
+        tasks = queries.parallel.partition_rule(store, rule, 3)
+        self.assertEqual(len(tasks), 3)
+        # Y is in both atoms : each is partitioned, the negated atom is replicated
+        self.assertEqual(sum(len(relations['#0']) for _, relations in tasks), 4)
+        self.assertEqual(sum(len(relations['#1']) for _, relations in tasks), 4)
+        self.assertTrue(all(len(relations['#2']) == 1 for _, relations in tasks))
+        rows = 0
+        for task_rule, relations in tasks:
+            task_store = queries.ColumnStore(store.dictionary)
+            task_store.relations = relations
+            rows += len(task_store.evaluate_rule(task_rule))
+        self.assertEqual(rows, len(store.evaluate_rule(rule)))
+
+    def test_evaluate_partitions(self):
+        for name in ["transitive.query", "negation.query", "eval4-differentconst.query",
+                     "eval5-selfjoin.query"]:
+            q = queries.query_parse_file(self.folder_test+name)
+            self.assertListEqual(q.evaluate(workers=2, partitions=3),
+                                 [list(row) for row in q.evaluate()])
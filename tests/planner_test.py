@@ -0,0 +1,38 @@
+import unittest
+import queries
+
+'''
+Careful : This test file is meant to be run at the root of the project
+
+Command : python3 -m unittest tests/planner_test.py'''
+
+class PlannerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder_test = 'query_examples/'
+
+    def test_statistics(self):
+        q = queries.query_parse_file(self.folder_test+"joinorder.query")
+        db, _ = q.get_data()
+        stats = db.get_statistics('big', 2)
+        self.assertEqual(stats.cardinality, 5)
+        self.assertListEqual(stats.distinct, [3, 3])
+
+    def test_selective_atom_first(self):
+        q = queries.query_parse_file(self.folder_test+"joinorder.query")
+        db, _ = q.get_data()
+        plan = q.program.rules[-1].get_join_plan(db)
+        self.assertListEqual([c.predicate_name for c in plan.get_order()], ['small', 'mid', 'big'])
+        self.assertListEqual(q.evaluate(), [['a3', 'c3']])
+
+    def test_greedy_order(self):
+        x, y, z = queries.Var('X'), queries.Var('Y'), queries.Var('Z')
+        atoms = [([], {x: [0], y: [1]}, queries.RelationStatistics(100, [10, 10])),
+                 ([], {z: [0]}, queries.RelationStatistics(2, [2])),
+                 ([], {y: [0]}, queries.RelationStatistics(50, [50]))]
+        order, estimates = queries.plan_joins(atoms)
+        self.assertListEqual(order, [1, 2, 0])
+        self.assertEqual(len(estimates), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
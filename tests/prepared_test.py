@@ -0,0 +1,67 @@
+import unittest
+import os
+import tempfile
+import queries
+
+'''
+Careful : This test file is meant to be run at the root of the project
+
+Command : python3 -m unittest tests/prepared_test.py'''
+
+class PreparedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder_test = 'query_examples/'
+
+    def test_evaluate_twice(self):
+        q = queries.query_parser("e(a,b).\ne(b,c).\np(X,Z) ← e(X,Y) e(U,Z) Y=U.\n? p(X,Z)")
+        text = repr(q)
+        self.assertListEqual(q.evaluate(), [['a', 'c']])
+        self.assertEqual(repr(q), text)
+        self.assertListEqual(q.evaluate(engine='columnar'), [['a', 'c']])
+
+    def test_execute_databases(self):
+        q = queries.query_parser("path(X,Y) ← edge(X,Y).\npath(X,Z) ← path(X,Y) edge(Y,Z).\n"
+                                 "? path(a,Y)")
+        prepared = q.prepare()
+        c = queries.Const
+        db1 = queries.Database({'edge': [(c('a'), c('b')), (c('b'), c('c'))]})
+        db2 = queries.Database({'edge': [(c('b'), c('a'))]})
+        self.assertListEqual(prepared.execute(db1), [['a', 'b'], ['a', 'c']])
+        self.assertListEqual(prepared.execute(db2), [])
+        self.assertListEqual(prepared.execute(db1, engine='columnar'), [['a', 'b'], ['a', 'c']])
+        self.assertEqual(len(db1), 1)
+
+    def test_cache(self):
+        file_name = self.folder_test+"negation.query"
+        expected = queries.query_parse_file(file_name).evaluate()
+        with tempfile.TemporaryDirectory() as cache_dir:
+            prepared = queries.prepare_query_file(file_name, cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            cached = queries.prepare_query_file(file_name, cache_dir=cache_dir)
+            self.assertIsNot(cached, prepared)
+            self.assertListEqual(cached.execute(), expected)
+            queries.prepare_query_file(file_name, magic=True, cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+            # A stale plan, referencing a class which does not exist anymore
+            for plan in os.listdir(cache_dir):
+                with open(os.path.join(cache_dir, plan), 'wb') as f:
+                    f.write(b"cqueries.queries\nRemovedClass\n)\x81.")
+            self.assertListEqual(queries.prepare_query_file(file_name, cache_dir=cache_dir).execute(),
+                                 expected)
+
+    def test_iter_answers(self):
+        for name in ["transitive.query", "negation.query", "eval4-differentconst.query"]:
+            q = queries.query_parse_file(self.folder_test+name)
+            expected = [tuple(row) for row in q.evaluate()]
+            self.assertListEqual(sorted(q.iter_answers()), expected)
+            self.assertListEqual(sorted(q.iter_answers(engine='columnar')), expected)
+            first = list(q.iter_answers(limit=2))
+            self.assertEqual(len(first), 2)
+            self.assertTrue(set(first) <= set(expected))
+
+    def test_iter_answers_early_termination(self):
+        # The product has 9 million rows : only the first ones are computed
+        q = queries.query_parser("p(X, Y) ← a(X) a(Y).\n? p(X, Y)")
+        db = queries.Database({'a': [(queries.Const('n%d' % i),) for i in range(3000)]})
+        answers = q.iter_answers(limit=3, db=db)
+        self.assertListEqual(list(answers), [('n0', 'n0'), ('n0', 'n1'), ('n0', 'n2')])
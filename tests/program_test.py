@@ -1,6 +1,8 @@
 import unittest
 import queries
 import numpy as np
+import pickle
+import gc
 
 '''
 Careful : This test file is meant to be run at the root of the project
@@ -153,7 +155,132 @@ class ProgramTestCase(unittest.TestCase):
         eval = q.evaluate(unique=True)
         true_ans = [["'Movie0'", "'Director0'"], ["'Movie2'", "'Director1'"]]
         self.assertListEqual(true_ans,eval)
-    
+
+    def test_components(self):
+        file = self.folder_test+"mutual-recursion.query"
+        q = queries.query_parse_file(file)
+        components = q.get_components()
+        self.assertListEqual(components[:2], [['zero'], ['succ']])
+        self.assertCountEqual(components[2], ['even', 'odd'])
+        self.assertTrue(q.program.is_recursive())
+
+    def test_eval_transitive_closure(self):
+        file = self.folder_test+"transitive.query"
+        q = queries.query_parse_file(file)
+        eval = q.evaluate(unique=True)
+        true_ans = [['b'], ['c'], ['d']]
+        self.assertListEqual(true_ans,eval)
+
+    def test_eval_mutual_recursion(self):
+        file = self.folder_test+"mutual-recursion.query"
+        q = queries.query_parse_file(file)
+        eval = q.evaluate(unique=True)
+        true_ans = [['n1'], ['n3']]
+        self.assertListEqual(true_ans,eval)
+
+    def test_strata(self):
+        file = self.folder_test+"negation.query"
+        q = queries.query_parse_file(file)
+        strata = q.get_strata()
+        self.assertEqual(len(strata), 2)
+        self.assertListEqual(strata[1], [['unreachable'], ['q']])
+
+    def test_not_stratifiable(self):
+        file = self.folder_test+"notstratifiable.query"
+        q = queries.query_parse_file(file)
+        self.assertRaises(Exception, q.get_strata)
+
+    def test_eval_negation(self):
+        file = self.folder_test+"negation.query"
+        q = queries.query_parse_file(file)
+        eval = q.evaluate(unique=True)
+        true_ans = [['a'], ['d']]
+        self.assertListEqual(true_ans,eval)
+
+    def test_interned_terms(self):
+        file = self.folder_test+"eval1-join.query"
+        q = queries.query_parse_file(file)
+        facts = [r.head.args for r in q.program.rules if not r.body]
+        self.assertIs(facts[0][0], queries.Const("'Director0'"))
+        self.assertIs(pickle.loads(pickle.dumps(facts[0][0])), facts[0][0])
+        self.assertIsNot(queries.Var("a"), queries.Const("a"))
+        self.assertFalse(hasattr(facts[0][0], '__dict__'))
+        # The terms no longer used are freed
+        self.assertIn("'Director0'", queries.Const.interned)
+        del q, facts
+        gc.collect()
+        self.assertNotIn("'Director0'", queries.Const.interned)
+
+    def test_set_semantics(self):
+        q = queries.query_parser("e(a,b).\ne(a,c).\ne(d,b).\np(X) ← e(X,Y).\n"
+                                 "r(X) ← p(X) e(X,Y).\n? r(X)")
+        db, _ = q.get_data()
+        for r in q.program.rules[3:]:
+            db = r.evaluate(db)
+        self.assertEqual(set(db['p']), {(queries.Const('a'),), (queries.Const('d'),)})
+        self.assertEqual(len(db['p']), 2)
+        self.assertEqual(len(db['r']), 2)
+        bag, _ = q.get_data()
+        for r in q.program.rules[3:]:
+            bag = r.evaluate(bag, distinct=False)
+        self.assertEqual(len(bag['r']), 5)
+        store = queries.ColumnStore.from_db(q.get_data()[0])
+        for r in q.program.rules[3:]:
+            store.evaluate_component([r], [r.head.predicate_name], False)
+        self.assertEqual(len(store.relations['r']), 2)
+
+    def test_eval_aggregates(self):
+        q = queries.query_parse_file(self.folder_test+"aggregate.query")
+        expected = [['a', "'4'"], ['b', "'4'"], ['c', "'4'"]]
+        self.assertListEqual(q.evaluate(), expected)
+        self.assertListEqual(q.evaluate(engine='columnar'), expected)
+        self.assertListEqual(q.get_strata()[-1], [['reach']])
+
+        q.query = queries.query_parser("q(a).\n? weight(X, S, M, Y)").query
+        expected = [['a', "'3'", "'3'", 'b'], ['b', "'4'", "'4'", 'c'],
+                    ['c', "'3.5'", "'1'", 'd']]
+        self.assertListEqual(q.evaluate(), expected)
+        self.assertListEqual(q.evaluate(engine='columnar'), expected)
+
+    def test_eval_large_sums(self):
+        # Sums leaving the range of 64 bits integers are exact with every engine
+        q = queries.query_parser("e(a, '4611686018427387904', x). e(a, '4611686018427387904', y).\n"
+                                 "e(b, '18446744073709551616', x). e(b, '-1', y).\n"
+                                 "s(X, sum(N)) ← e(X, N, _).\n? s(X, S)")
+        expected = [['a', "'9223372036854775808'"], ['b', "'18446744073709551615'"]]
+        for engine in ('tuple', 'columnar', 'sqlite'):
+            self.assertListEqual(q.evaluate(engine=engine), expected)
+
+    def test_eval_repeated_facts(self):
+        # Facts are sets : a repeated fact is counted once by every engine
+        program = "e(a, '1'). e(a, '1'). e(a, '2'). e(b, '1').\n" \
+                  "c(X, count(Y), sum(Y)) ← e(X, Y).\n? c(X, N, S)"
+        q = queries.query_parser(program)
+        expected = [['a', "'2'", "'3'"], ['b', "'1'", "'1'"]]
+        for engine in ('tuple', 'columnar', 'sqlite'):
+            self.assertListEqual(q.evaluate(engine=engine), expected)
+        self.assertListEqual(q.evaluate(workers=2), expected)
+        db = queries.Database({'e': [(queries.Const('b'), queries.Const("'1'"))]})
+        self.assertListEqual(q.evaluate(db=db), expected)
+        self.assertListEqual(q.evaluate(db=queries.ColumnStore.from_db(db), engine='columnar'),
+                             expected)
+        self.assertEqual(len(db['e']), 1)
+
+    def test_eval_different_constants(self):
+        # Removing the equalities leaves c ≠ d, which keeps every row with all the
+        # engines
+        q = queries.query_parser("e(a, c). e(b, d).\np(X) ← e(X, Y) Y ≠ d Y = c.\n"
+                                 "s(X) ← p(X).\n? s(X)")
+        for engine in ('tuple', 'columnar', 'sqlite'):
+            self.assertListEqual(q.evaluate(engine=engine), [['a']])
+            self.assertListEqual(q.evaluate(engine=engine, magic=False), [['a']])
+        self.assertListEqual(q.evaluate(workers=2), [['a']])
+        self.assertIn("c ≠ d", str(q.explain(analyze=True)))
+
+    def test_aggregate_not_stratifiable(self):
+        q = queries.query_parser("e(a, b).\np(X, count(Y)) ← e(X, Y) p(Y, Z).\n? p(X, N)")
+        self.assertRaises(Exception, q.get_strata)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,58 @@
+import unittest
+import io
+import queries
+
+'''
+Careful : This test file is meant to be run at the root of the project
+
+Command : python3 -m unittest tests/query_parser_test.py'''
+
+class QueryParserTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder_test = 'query_examples/'
+
+    def test_stream_chunks(self):
+        text = 'a("x. y", \'z.t\'). b(X) ← a(X, _), ¬c(X) X ≠ d.\nc(e).\n? b(X)'
+        expected = repr(queries.query_parser(text))
+        for chunk_size in [1, 2, 7, 1 << 16]:
+            q = queries.query_parse_stream(io.StringIO(text))
+            self.assertEqual(repr(q), expected)
+            statements = list(queries.parse_stream(io.StringIO(text), chunk_size))
+            self.assertEqual(len(statements), 4)
+
+    def test_stream_escaped_quotes(self):
+        # As for the parser, a backslash does not escape the quote ending a name : the
+        # statements are cut at the same dots for any chunk size
+        text = r"""p('a\', 'b.c'). q("d\"). r('e\'). ? p(X, Y)"""
+        self.assertEqual(repr(queries.query_parse_stream(io.StringIO(text))),
+                         repr(queries.query_parser(text)))
+        expected = list(map(repr, queries.statements_parser(text)))
+        self.assertEqual(len(expected), 4)
+        for chunk_size in range(1, len(text) + 1):
+            statements = queries.parse_stream(io.StringIO(text), chunk_size)
+            self.assertListEqual(list(map(repr, statements)), expected)
+
+    def test_parse_file(self):
+        for name in ["evaluation.query", "transitive.query", "eval4-differentconst.query"]:
+            with open(self.folder_test+name, encoding='utf8') as f:
+                expected = repr(queries.query_parser(f.read()))
+            self.assertEqual(repr(queries.query_parse_file(self.folder_test+name)), expected)
+
+    def test_query_position(self):
+        with self.assertRaises(Exception):
+            queries.query_parse_stream(io.StringIO("? q(X). q(a)."))
+        with self.assertRaises(Exception):
+            queries.query_parse_stream(io.StringIO("q(a)."))
+        with self.assertRaises(Exception):
+            queries.program_parse_stream(io.StringIO("q(a). ? q(X)"))
+
+    def test_aggregates(self):
+        q = queries.query_parse_file(self.folder_test+"aggregate.query")
+        head = q.program.rules[-1].head
+        self.assertEqual(repr(head), "weight(X, sum(W), min(W), max(Y))")
+        self.assertIsInstance(head.args[1], queries.Aggregate)
+        self.assertEqual(repr(queries.program_parser("p(count, a).")), "p(count, a).")
+        with self.assertRaises(Exception):
+            queries.program_parser("p(avg(X)) ← q(X).")
+        with self.assertRaises(Exception):
+            queries.query_parser("q(a).\n? q(count(X))")
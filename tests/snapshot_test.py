@@ -0,0 +1,62 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+import queries
+
+'''
+Careful : This test file is meant to be run at the root of the project
+
+Command : python3 -m unittest tests/snapshot_test.py'''
+
+class SnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder_test = 'query_examples/'
+        self.dir = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.dir.name, 'facts.snapshot')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_round_trip(self):
+        db = queries.Database({'edge': [(queries.Const('a'), queries.Const("'B c'")),
+                                        (queries.Const('é'), queries.Const('a'))],
+                               'empty': [], 'nullary': [()]})
+        queries.save_snapshot(db, self.file_name)
+        store = queries.open_snapshot(self.file_name)
+        self.assertEqual(store.to_db(), dict(db))
+        column = store.relations['edge'].columns[0]
+        self.assertFalse(column.flags.writeable)
+        self.assertTrue(isinstance(column.base, np.memmap))
+
+    def test_evaluate(self):
+        q = queries.query_parse_file(self.folder_test+"transitive.query")
+        facts, _ = q.get_data()
+        queries.save_snapshot(facts, self.file_name)
+        rules = queries.Query(queries.Program([r for r in q.program.rules if r.body]), [], q.query)
+        store = queries.open_snapshot(self.file_name)
+        expected = q.evaluate()
+        self.assertListEqual(rules.evaluate(engine='columnar', db=store), expected)
+        self.assertListEqual(rules.evaluate(db=store), expected)
+        self.assertEqual(len(store.relations), 1)
+
+    def test_lazy_dictionary(self):
+        C = queries.Const
+        db = queries.Database({'edge': [(C('n%d' % i), C('n%d' % (i + 1))) for i in range(100)]})
+        queries.save_snapshot(db, self.file_name)
+        store = queries.open_snapshot(self.file_name)
+        self.assertEqual(len(store.dictionary.decoded), 0)
+        self.assertEqual(store.dictionary.decode(store.dictionary.lookup(C('n42'))), C('n42'))
+        self.assertEqual(store.dictionary.lookup(C('m')), -1)
+        # Constants of the rules are encoded in an overlay of the dictionary, only
+        # the constants of the answer are decoded
+        q = queries.query_parser("p(X, new) ← edge(n3, X).\n? p(X, Y)")
+        self.assertListEqual(q.evaluate(engine='columnar', db=store), [['n4', 'new']])
+        self.assertEqual(len(store.dictionary), 101)
+        self.assertLess(len(store.dictionary.decoded), 5)
+
+    def test_not_a_snapshot(self):
+        with open(self.file_name, 'wb') as f:
+            f.write(b"edge(a,b)." * 10)
+        with self.assertRaises(Exception):
+            queries.open_snapshot(self.file_name)
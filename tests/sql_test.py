@@ -0,0 +1,102 @@
+import unittest
+import os
+import tempfile
+import queries
+
+'''
+Careful : This test file is meant to be run at the root of the project
+
+Command : python3 -m unittest tests/sql_test.py'''
+
+class SQLTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder_test = 'query_examples/'
+
+    def assertSameAnswer(self, q, **kwargs):
+        expected = q.evaluate(**kwargs)
+        self.assertListEqual(q.evaluate(engine='sqlite', **kwargs), expected)
+        return expected
+
+    def test_examples(self):
+        for name in ['eval2-doublejoin', 'eval4-differentconst', 'negation', 'transitive',
+                     'mutual-recursion', 'magic', 'aggregate']:
+            q = queries.query_parse_file(self.folder_test + name + '.query')
+            self.assertSameAnswer(q)
+            self.assertSameAnswer(q, magic=False)
+
+    def test_rule_to_sql(self):
+        rule = queries.program_parser("q(X, c) ← e(X, Y) e(Y, X) ¬f(Y, d) X ≠ Y.").rules[0]
+        text, parameters = queries.rule_to_sql(rule)
+        self.assertIn("t1.c0 = t0.c1 AND t1.c1 = t0.c0", text)
+        self.assertIn("t0.c0 <> t0.c1", text)
+        self.assertIn("NOT EXISTS (SELECT 1 FROM \"f\" AS n2 WHERE n2.c0 = t0.c1", text)
+        self.assertListEqual(sorted(parameters.values()), ['c', 'd'])
+
+    def test_recursion(self):
+        # Linear recursion is a recursive common table expression, the other
+        # recursive components are evaluated by semi-naive iteration
+        edges = "".join("edge(n%d, n%d).\n" % (i, (3 * i + 1) % 20) for i in range(30))
+        for rule in ["path(X, Z) ← path(X, Y) edge(Y, Z).", "path(X, Z) ← path(X, Y) path(Y, Z)."]:
+            q = queries.query_parser(edges + "path(X, Y) ← edge(X, Y).\n" + rule + "\n? path(X, Y)")
+            self.assertEqual(len(self.assertSameAnswer(q)), 108)
+
+    def test_file(self):
+        q = queries.query_parse_file(self.folder_test + 'transitive.query')
+        with tempfile.TemporaryDirectory() as folder:
+            file_name = os.path.join(folder, "facts.csv")
+            with open(file_name, "w") as f:
+                f.write("a,b\nb,c\nc,d\n")
+            store = queries.SQLiteStore(os.path.join(folder, "facts.db"))
+            self.assertDictEqual(queries.load_facts(store, file_name, "edge"), {'edge': 3})
+            db = queries.Database()
+            queries.load_facts(db, file_name, "edge")
+            self.assertListEqual(q.evaluate(engine='sqlite', db=store), q.evaluate(db=db))
+            # The derived tables are temporary : the file only holds the facts
+            self.assertListEqual(store.get_tables(), ['edge'])
+            self.assertEqual(len(list(q.iter_answers(engine='sqlite', db=store, limit=2))), 2)
+            store.connection.close()
+
+    def test_read_base_tables(self):
+        # An overlay only copies the tables it writes : the facts are read in place
+        store = queries.SQLiteStore()
+        store.add_rows("edge", [("n%d" % i, "n%d" % (i + 1)) for i in range(100)])
+        statements = []
+        store.connection.set_trace_callback(statements.append)
+        q = queries.query_parser("q(Y) ← edge(n5, Y) ¬missing(Y).\n? q(Y)")
+        self.assertListEqual(q.evaluate(engine='sqlite', db=store), [['n6']])
+        self.assertFalse([s for s in statements if 'temp."edge"' in s])
+        self.assertTrue([s for s in statements if 'TEMP TABLE "missing"' in s])
+        self.assertListEqual(store.get_tables(), ['edge'])
+
+    def test_sum_error(self):
+        q = queries.query_parser("e(a, b). s(X, sum(Y)) ← e(X, Y). ? s(X, Y)")
+        with self.assertRaises(ValueError):
+            q.evaluate(engine='sqlite')
+        # The error is kept by the store (and its overlays) which met it, so the
+        # other stores and the next statements are not affected
+        store, other = queries.SQLiteStore(), queries.SQLiteStore()
+        store.add_rows("e", [("a", "b")])
+        other.add_rows("e", [("a", "2")])
+        q = queries.query_parser("s(X, sum(Y)) ← e(X, Y). ? s(X, Y)")
+        with self.assertRaises(ValueError):
+            q.evaluate(engine='sqlite', db=store)
+        self.assertListEqual(q.evaluate(engine='sqlite', db=other), [['a', "'2'"]])
+        self.assertListEqual(store.errors, [])
+        with self.assertRaises(Exception):
+            store.execute("SELECT * FROM missing", ())
+
+    def test_limit(self):
+        store = queries.SQLiteStore()
+        store.add_rows("e", [(str(i % 7), str(i)) for i in range(30)])
+        rows = store.get_answer("e")
+        self.assertListEqual(rows, sorted(rows))
+        self.assertListEqual(store.get_answer("e", limit=4), rows[:4])
+        self.assertListEqual(store.get_answer("e", True, [(0, queries.Const("3"))], limit=2),
+                             [r for r in rows if r[0] == "3"][:2])
+        q = queries.query_parser("p(X, Y) ← e(X, Y).\n? p(X, Y)")
+        self.assertListEqual(list(q.iter_answers(engine='sqlite', db=store, limit=3)),
+                             [tuple(r) for r in rows[:3]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+import queries
+import numpy as np
+
+'''
+Careful : This test file is meant to be run at the root of the project
+
+Command : python3 -m unittest tests/store_test.py'''
+
+class StoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder_test = 'query_examples/'
+
+    def test_dictionary(self):
+        d = queries.ConstantDictionary()
+        codes = d.encode_column([queries.Const('a'), queries.Const('b'), queries.Const('a')])
+        self.assertListEqual(list(codes), [0, 1, 0])
+        self.assertEqual(d.lookup(queries.Const('c')), -1)
+        self.assertListEqual([str(c) for c in d.decode_column(codes)], ['a', 'b', 'a'])
+
+    def test_dictionary_overlay(self):
+        d = queries.ConstantDictionary([queries.Const('a'), queries.Const('b')])
+        overlay = queries.DictionaryOverlay(d)
+        codes = overlay.encode_column([queries.Const('c'), queries.Const('a')])
+        self.assertListEqual(list(codes), [2, 0])
+        self.assertEqual(len(d), 2)
+        self.assertEqual(overlay.decode(2), queries.Const('c'))
+        self.assertListEqual([str(c) for c in overlay], ['a', 'b', 'c'])
+
+    def test_join_indices(self):
+        left = [np.array([1, 2, 1]), np.array([5, 5, 6])]
+        right = [np.array([1, 1, 2]), np.array([5, 6, 5])]
+        l, r = queries.store.join_indices(left, right, 3, 3)
+        self.assertCountEqual(zip(l.tolist(), r.tolist()), [(0, 0), (1, 2), (2, 1)])
+
+    def test_unique_difference(self):
+        a = queries.Relation([[1, 0, 1, 2], [3, 4, 3, 3]])
+        b = queries.Relation([[2], [3]])
+        self.assertListEqual([c.tolist() for c in a.unique().columns], [[0, 1, 2], [4, 3, 3]])
+        self.assertListEqual([c.tolist() for c in (a.unique() - b).columns], [[0, 1], [4, 3]])
+
+    def test_columnar_engine(self):
+        for name in ["eval1-join", "eval3", "eval4-differentconst", "eval5-selfjoin",
+                     "transitive", "mutual-recursion", "negation"]:
+            file = self.folder_test+name+".query"
+            expected = queries.query_parse_file(file).evaluate(unique=True)
+            eval = queries.query_parse_file(file).evaluate(unique=True, engine='columnar')
+            self.assertListEqual(eval, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()